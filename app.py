@@ -1,14 +1,159 @@
-from flask import Flask, render_template, request, Response, redirect, url_for, jsonify
+from flask import Flask, render_template, stream_template, request, Response, redirect, url_for, jsonify, send_file, g
+from flask import before_render_template, template_rendered
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from datetime import datetime, timedelta
 from db import (
     get_recent_transactions, get_transactions_for_report, 
-    clear_all_transactions, get_unique_usernames
+    get_unique_usernames, get_pool_stats,
+    get_dashboard_aggregates, get_transactions_ingested_since,
+    report_has_transactions, iter_transactions_for_report,
+    get_transactions_changed_since, get_timeseries_aggregates, TIMESERIES_PERCENTILES,
+    upsert_transactions, get_top_values
 )
 import csv
+import gzip
+import hashlib
+import heapq
 import io
-import statistics # For standard deviation
+import os
+import queue
+import time
+import zlib
+from stats import DashboardAccumulator, ReportAccumulator, HeavyHitters, FAILURE_STATUSES, aggregate_report
+from rolling import RollingWindowStats
+from push import LiveProducer
+from cache import create_cache_from_env, ResponseCache, MemoryCacheBackend
+from rollups import RollupMaintainer, ceil_time
+from jobs import ReportJobManager, COMPLETE
+from shards import ShardedReportEngine
+from metrics import (
+    registry as metrics_registry, span, record_stage, begin_trace, end_trace, current_trace, metric_lines
+)
+from profiler import SamplingProfiler
+from ingest import IngestWriter, IngestQueueFull, parse_event
+from retention import RetentionEngine, PurgeInProgress, COMPLETE as PURGE_COMPLETE, RUNNING as PURGE_RUNNING
+from assets import AssetManifest, DEFAULT_BUILD_DIR as DEFAULT_ASSETS_DIR
+
+try:
+    import orjson
+except ImportError:  # optional fast JSON encoder
+    orjson = None
+
+class AppJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes datetimes as ISO 8601 and skips key sorting.
+
+    Uses orjson when it is installed (it serializes datetimes natively),
+    otherwise the stdlib encoder with an isoformat() default.
+    """
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        # jsonify() passes compact separators (ignored; orjson is always compact) or an indent in debug
+        with span('json'):
+            if orjson is not None and 'indent' not in kwargs:
+                return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = AppJSONProvider(app)
+
+# Compiled template bytecode is cached on disk, so new worker processes skip
+# recompiling templates (JINJA_BYTECODE_CACHE_DIR= empty disables). The bytecode
+# is loaded with marshal, so the default is Jinja's per-user 0700 directory,
+# which it checks is owned by this user; a shared path could be pre-seeded.
+JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR')
+if JINJA_BYTECODE_CACHE_DIR is None:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+elif JINJA_BYTECODE_CACHE_DIR:
+    os.makedirs(JINJA_BYTECODE_CACHE_DIR, mode=0o700, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_BYTECODE_CACHE_DIR)
+
+# Gzip streamed CSV reports for clients that accept it (REPORT_GZIP=0 disables)
+REPORT_GZIP = os.getenv('REPORT_GZIP', '1') != '0'
+
+# Keys kept per top-N summary in the rolling stats (TOP_K_CAPACITY=0 disables them)
+TOP_K_CAPACITY = int(os.getenv('TOP_K_CAPACITY', 100))
+
+# Shared in-memory rolling-window stats for the dashboard (DASHBOARD_ROLLING_STATS=0 disables)
+rolling_stats = None
+if os.getenv('DASHBOARD_ROLLING_STATS', '1') != '0':
+    rolling_stats = RollingWindowStats(
+        get_transactions_ingested_since,
+        retention_minutes=int(os.getenv('ROLLING_STATS_RETENTION_MINUTES', 60)),
+        settle_seconds=int(os.getenv('ROLLING_STATS_SETTLE_SECONDS', 120)),
+        poll_interval=float(os.getenv('ROLLING_STATS_POLL_INTERVAL', 1)),
+        top_capacity=TOP_K_CAPACITY,
+    )
+
+# Per-minute/per-hour rollups that answer long-range HTML reports (REPORT_ROLLUPS=0 disables)
+report_rollups = None
+if os.getenv('REPORT_ROLLUPS', '1') != '0':
+    report_rollups = RollupMaintainer(
+        settle_minutes=int(os.getenv('ROLLUP_SETTLE_MINUTES', 10)),
+        minute_retention_hours=int(os.getenv('ROLLUP_MINUTE_RETENTION_HOURS', 48)),
+        poll_interval=float(os.getenv('ROLLUP_POLL_INTERVAL', 30)),
+    )
+
+# Raw-row reports are split into time shards aggregated by a process pool (REPORT_SHARD_WORKERS<=1 disables)
+report_shards = ShardedReportEngine(
+    workers=int(os.getenv('REPORT_SHARD_WORKERS', os.cpu_count() or 1)),
+    min_shard_minutes=int(os.getenv('REPORT_SHARD_MIN_MINUTES', 60)),
+)
+
+# Short-TTL cache shared by identical API requests (RESPONSE_CACHE=0 disables)
+response_cache = create_cache_from_env()
+CACHE_TTL_STATS = float(os.getenv('CACHE_TTL_STATS', 1))
+CACHE_TTL_FEED = float(os.getenv('CACHE_TTL_FEED', 1))
+CACHE_TTL_USERNAMES = float(os.getenv('CACHE_TTL_USERNAMES', 60))
+
+# Rendered per-user HTML report sections, keyed by the user's stats (REPORT_FRAGMENT_CACHE_ENTRIES=0 disables)
+REPORT_FRAGMENT_CACHE_ENTRIES = int(os.getenv('REPORT_FRAGMENT_CACHE_ENTRIES', 10000))
+report_fragment_cache = ResponseCache(MemoryCacheBackend(max_entries=REPORT_FRAGMENT_CACHE_ENTRIES),
+                                      enabled=REPORT_FRAGMENT_CACHE_ENTRIES > 0)
+REPORT_FRAGMENT_TTL = float(os.getenv('REPORT_FRAGMENT_TTL', 3600))
+
+# Chunked purges and clears of the transactions table (RETENTION_DAYS>0 also purges older rows on a schedule)
+retention = RetentionEngine(
+    # Resumed at startup, so keep it out of shared, writable directories
+    state_path=os.getenv('RETENTION_STATE_PATH', os.path.join(app.instance_path, 'retention.json')),
+    chunk_rows=int(os.getenv('RETENTION_CHUNK_ROWS', 5000)),
+    pause_seconds=float(os.getenv('RETENTION_PAUSE_MS', 100)) / 1000,
+    archive_dir=os.getenv('RETENTION_ARCHIVE_DIR') or None,
+    retention_days=float(os.getenv('RETENTION_DAYS', 0)),
+    poll_interval=float(os.getenv('RETENTION_INTERVAL', 3600)),
+    rollups=report_rollups is not None,
+)
+# How long /admin/clear-db waits for a clear before reporting it as running in the background
+CLEAR_WAIT_SECONDS = float(os.getenv('CLEAR_WAIT_SECONDS', 10))
+
+# Static files are served from /assets/ under content-hashed names, precompressed
+# and cached for good (STATIC_ASSETS=0 serves them plainly from /static/)
+static_assets = None
+if os.getenv('STATIC_ASSETS', '1') != '0':
+    static_assets = AssetManifest(app.static_folder, os.getenv('STATIC_ASSETS_DIR', DEFAULT_ASSETS_DIR),
+                                  brotli_quality=int(os.getenv('STATIC_ASSETS_BROTLI_QUALITY', 11)))
+    try:
+        static_assets.build()
+    except OSError as err:
+        print(f"Error building static assets, serving them from /static/: {err}")
+        static_assets = None
+STATIC_ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Sampling profiler for slow requests; off unless PROFILE_SLOW_REQUESTS=1 or toggled via /admin/profiler
+profiler = SamplingProfiler(
+    output_dir=os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')),
+    interval=float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000,
+    slow_threshold=float(os.getenv('PROFILE_SLOW_THRESHOLD_MS', 1000)) / 1000,
+    enabled=os.getenv('PROFILE_SLOW_REQUESTS', '0') == '1',
+)
 
 # Custom Jinja filter for formatting file sizes
 @app.template_filter('filesizeformat')
@@ -35,22 +180,6 @@ def filesizeformat(value, binary=False):
     return f"{size:.1f} {unit}"
 
 # HELPER FUNCTIONS (Restoring these as they are needed)
-def calculate_percentile(values, percentile):
-    """Calculate the percentile value from a list of values without using NumPy"""
-    if not values:
-        return 0.0
-    sorted_values = sorted(values)
-    n = len(sorted_values)
-    index = (n - 1) * (percentile / 100)
-    if index.is_integer():
-        return sorted_values[int(index)]
-    lower_index = int(index)
-    upper_index = lower_index + 1
-    lower_value = sorted_values[lower_index]
-    upper_value = sorted_values[upper_index] if upper_index < n else lower_value
-    fraction = index - lower_index
-    return lower_value + (upper_value - lower_value) * fraction
-
 def format_time(seconds):
     """Format time with appropriate SI units, starting from ms"""
     if seconds is None or not isinstance(seconds, (int, float)) or seconds < 0:
@@ -83,7 +212,14 @@ def format_data_rate(bits_per_second):
 
 def calculate_report_stats_for_subset(transactions_subset, duration_minutes=None):
     """Calculate detailed stats for a subset of transactions for reporting (Restored)."""
-    if not transactions_subset:
+    accumulator = ReportAccumulator()
+    for t in transactions_subset:
+        accumulator.add(t)
+    return build_report_stats(accumulator, duration_minutes)
+
+def build_report_stats(accumulator, duration_minutes=None):
+    """Build a report stats block from a (possibly merged) ReportAccumulator."""
+    if not accumulator.total_transactions:
         return {
             'total_transactions': 0, 'total_bytes': 0,
             'max_data_rate': 0.0, 'avg_data_rate': 0.0,
@@ -95,51 +231,33 @@ def calculate_report_stats_for_subset(transactions_subset, duration_minutes=None
             'p75_transit_time_formatted': '0 ms', 'p95_transit_time_formatted': '0 ms', 'p99_transit_time_formatted': '0 ms',
             'min_file_size': 0, 'avg_file_size': 0, 'max_file_size': 0,
             'min_file_size_formatted': '0 Bytes', 'avg_file_size_formatted': '0 Bytes', 'max_file_size_formatted': '0 Bytes',
-            'transaction_rate_per_minute': 0.0
+            'transaction_rate_per_minute': 0.0,
+            'unique_users': 0, 'unique_users_exact': True
         }
 
-    data_rates_bps = []
-    transit_times_seconds = []
-    file_sizes = []
-    total_bytes = 0
-    status_breakdown = {}
-
-    for t in transactions_subset:
-        file_size = t.get('file_size', 0)
-        total_bytes += file_size
-        if file_size > 0: # Only consider for file size stats if actual size > 0
-            file_sizes.append(file_size)
-        status = t.get('status', 'UNKNOWN')
-        status_breakdown[status] = status_breakdown.get(status, 0) + 1
-        if t.get('transit_time_seconds') and t['transit_time_seconds'] > 0 and file_size > 0:
-            rate = (file_size * 8) / t['transit_time_seconds']
-            data_rates_bps.append(rate)
-            transit_times_seconds.append(t['transit_time_seconds'])
-    
     # File size stats
-    min_fs = min(file_sizes) if file_sizes else 0
-    avg_fs = statistics.mean(file_sizes) if file_sizes else 0
-    max_fs = max(file_sizes) if file_sizes else 0
-
-    # Calculate percentiles and means, ensuring lists are not empty
-    p75_transit = calculate_percentile(transit_times_seconds, 75) if transit_times_seconds else 0.0
-    p95_transit = calculate_percentile(transit_times_seconds, 95) if transit_times_seconds else 0.0
-    p99_transit = calculate_percentile(transit_times_seconds, 99) if transit_times_seconds else 0.0
+    min_fs = accumulator.file_size_min
+    avg_fs = accumulator.file_size_sum / accumulator.file_size_count if accumulator.file_size_count else 0
+    max_fs = accumulator.file_size_max
+
+    # Percentiles come from the transit-time sketch in a single pass over its bins
+    timed_count = accumulator.transit_sketch.count
+    p75_transit, p95_transit, p99_transit = accumulator.transit_sketch.percentiles(75, 95, 99)
     
-    max_data_rate = max(data_rates_bps) if data_rates_bps else 0.0
-    avg_data_rate = statistics.mean(data_rates_bps) if data_rates_bps else 0.0
+    max_data_rate = accumulator.data_rate_max
+    avg_data_rate = accumulator.data_rate_sum / timed_count if timed_count else 0.0
     
-    max_transit = max(transit_times_seconds) if transit_times_seconds else 0.0
-    avg_transit = statistics.mean(transit_times_seconds) if transit_times_seconds else 0.0
+    max_transit = accumulator.transit_max
+    avg_transit = accumulator.transit_sum / timed_count if timed_count else 0.0
 
     # Transaction rate
     tx_rate_per_min = 0.0
-    if duration_minutes and duration_minutes > 0 and len(transactions_subset) > 0:
-        tx_rate_per_min = round(len(transactions_subset) / duration_minutes, 1)
+    if duration_minutes and duration_minutes > 0:
+        tx_rate_per_min = round(accumulator.total_transactions / duration_minutes, 1)
     
     return {
-        'total_transactions': len(transactions_subset),
-        'total_bytes': total_bytes,
+        'total_transactions': accumulator.total_transactions,
+        'total_bytes': accumulator.total_bytes,
         'max_data_rate': max_data_rate,
         'avg_data_rate': avg_data_rate,
         'max_data_rate_formatted': format_data_rate(max_data_rate),
@@ -154,17 +272,31 @@ def calculate_report_stats_for_subset(transactions_subset, duration_minutes=None
         'p75_transit_time_formatted': format_time(p75_transit),
         'p95_transit_time_formatted': format_time(p95_transit), 
         'p99_transit_time_formatted': format_time(p99_transit),
-        'status_breakdown': status_breakdown,
+        'status_breakdown': dict(accumulator.status_breakdown),
         'min_file_size': min_fs,
         'avg_file_size': avg_fs,
         'max_file_size': max_fs,
         'min_file_size_formatted': filesizeformat(min_fs),
         'avg_file_size_formatted': filesizeformat(avg_fs),
         'max_file_size_formatted': filesizeformat(max_fs),
-        'transaction_rate_per_minute': tx_rate_per_min
+        'transaction_rate_per_minute': tx_rate_per_min,
+        'unique_users': accumulator.usernames.count(),
+        'unique_users_exact': accumulator.usernames.exact
     }
 
+def aggregate_dashboard_transactions(transactions_for_stats):
+    """Reduce transaction rows to the aggregates the dashboard needs (Python fallback for db.get_dashboard_aggregates)."""
+    accumulator = DashboardAccumulator()
+    for t in transactions_for_stats:
+        accumulator.add(t)
+    return accumulator.aggregates()
+
 def calculate_dashboard_stats(transactions_for_stats, time_window_minutes):
+    """Calculate dashboard stats from transaction rows."""
+    return build_dashboard_stats(aggregate_dashboard_transactions(transactions_for_stats), time_window_minutes)
+
+def build_dashboard_stats(aggregates, time_window_minutes):
+    """Build the dashboard `stats` structure from pre-computed aggregates."""
     stats = {
         'ingress': {
             'BAD_REQUEST': 0, 'CD_UNAVAILABLE': 0, 'SUBMITTED': 0,
@@ -186,61 +318,39 @@ def calculate_dashboard_stats(transactions_for_stats, time_window_minutes):
             'success_rate': 0.0
         }
     }
-    if not transactions_for_stats:
+    status_counts = aggregates['status_counts']
+    if not status_counts:
         stats['egress']['avg_transit_time'] = '-'
         stats['egress']['max_transit_time'] = '-'
         stats['egress']['p95_transit_time'] = '-'
         stats['egress']['p99_transit_time'] = '-'
         return stats
 
-    relevant_tx_for_egress_rates = []
-    transit_times = []
-    active_usernames = set()
+    stats['ingress']['total_tx'] = sum(status_counts.values())
+    for status in ['BAD_REQUEST', 'CD_UNAVAILABLE', 'SUBMITTED']:
+        stats['ingress'][status] = status_counts.get(status, 0)
+    for status in ['COMPLETE', 'EP_UNAVAILABLE']:
+        stats['egress'][status] = status_counts.get(status, 0)
+    stats['egress']['total_tx'] = stats['egress']['COMPLETE'] + stats['egress']['EP_UNAVAILABLE']
+    stats['egress']['total_volume_complete_bytes'] = aggregates['complete_bytes']
+    stats['egress']['total_bytes'] = aggregates['egress_bytes']
+    stats['egress']['total_duration_seconds'] = aggregates['transit_sum']
 
-    for t in transactions_for_stats:
-        stats['ingress']['total_tx'] += 1
-        if t.get('username'):
-            active_usernames.add(t['username'])
-
-        if t['status'] == 'BAD_REQUEST':
-            stats['ingress']['BAD_REQUEST'] += 1
-        if t['status'] == 'CD_UNAVAILABLE':
-            stats['ingress']['CD_UNAVAILABLE'] += 1
-        if t['status'] == 'SUBMITTED':
-            stats['ingress']['SUBMITTED'] += 1
-            
-        if t['status'] in ['COMPLETE', 'EP_UNAVAILABLE']:
-            stats['egress']['total_tx'] += 1
-            if t['status'] == 'COMPLETE':
-                stats['egress']['COMPLETE'] += 1
-                if t.get('file_size'): # Accumulate for total volume (complete)
-                    stats['egress']['total_volume_complete_bytes'] += t['file_size']
-            if t['status'] == 'EP_UNAVAILABLE':
-                stats['egress']['EP_UNAVAILABLE'] += 1
-            
-            if t.get('file_size') and t.get('ingress_time') and t.get('egress_time'):
-                stats['egress']['total_bytes'] += t['file_size']
-                duration = t.get('transit_time_seconds', 0)
-                if duration > 0:
-                    relevant_tx_for_egress_rates.append(t)
-                    transit_times.append(duration)
-                    stats['egress']['total_duration_seconds'] += duration
-    
-    if transit_times:
-        stats['egress']['avg_transit_time'] = format_time(sum(transit_times) / len(transit_times))
-        stats['egress']['max_transit_time'] = format_time(max(transit_times))
-        stats['egress']['p95_transit_time'] = format_time(calculate_percentile(transit_times, 95))
-        stats['egress']['p99_transit_time'] = format_time(calculate_percentile(transit_times, 99))
+    transit_count = aggregates['transit_count']
+    if transit_count:
+        stats['egress']['avg_transit_time'] = format_time(aggregates['transit_sum'] / transit_count)
+        stats['egress']['max_transit_time'] = format_time(aggregates['transit_max'])
+        stats['egress']['p95_transit_time'] = format_time(aggregates['p95_transit'])
+        stats['egress']['p99_transit_time'] = format_time(aggregates['p99_transit'])
     else:
         stats['egress']['avg_transit_time'] = '-'
         stats['egress']['max_transit_time'] = '-'
         stats['egress']['p95_transit_time'] = '-'
         stats['egress']['p99_transit_time'] = '-'
     
-    if stats['egress']['total_duration_seconds'] > 0 and relevant_tx_for_egress_rates:
-        total_bytes_for_rate = sum(tx['file_size'] for tx in relevant_tx_for_egress_rates)
-        stats['egress']['data_rate_mbps'] = round((total_bytes_for_rate * 8 / (1024*1024)) / stats['egress']['total_duration_seconds'], 1)
-        stats['egress']['tx_per_sec'] = round(len(relevant_tx_for_egress_rates) / stats['egress']['total_duration_seconds'], 1)
+    if stats['egress']['total_duration_seconds'] > 0 and transit_count:
+        stats['egress']['data_rate_mbps'] = round((aggregates['transit_bytes'] * 8 / (1024*1024)) / stats['egress']['total_duration_seconds'], 1)
+        stats['egress']['tx_per_sec'] = round(transit_count / stats['egress']['total_duration_seconds'], 1)
     
     if time_window_minutes > 0:
         time_window_seconds = time_window_minutes * 60
@@ -258,7 +368,7 @@ def calculate_dashboard_stats(transactions_for_stats, time_window_minutes):
         stats['egress']['ep_unavailable_rate'] = round((stats['egress']['EP_UNAVAILABLE'] / total_egress_attempts) * 100, 1)
     
     # Set active user count
-    stats['general']['active_users'] = len(active_usernames)
+    stats['general']['active_users'] = aggregates['active_users']
     
     # Calculate Success Rate
     total_successful = stats['egress']['COMPLETE']
@@ -275,6 +385,59 @@ def calculate_dashboard_stats(transactions_for_stats, time_window_minutes):
 
     return stats
 
+def serialize_transaction(t):
+    """Add the display fields the transaction tables render (in place).
+
+    Only called for rows sent to the client, so the stats paths never pay for
+    string formatting. Datetimes are left as-is for AppJSONProvider to encode.
+    """
+    transit = t.get('transit_time_seconds')
+    t['transit_time'] = f"{transit:.3f}s" if transit is not None else "N/A"
+    t['ingress_time_str'] = t['ingress_time'].isoformat(' ', 'milliseconds') if t.get('ingress_time') else "N/A"
+    t['egress_time_str'] = t['egress_time'].isoformat(' ', 'milliseconds') if t.get('egress_time') else "N/A"
+    return t
+
+@app.before_request
+def begin_request_instrumentation():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    begin_trace(route, request.method)
+    profiler.begin()
+
+@app.after_request
+def finish_request_instrumentation(response):
+    trace = current_trace()
+    if trace is None:
+        return response
+    duration = end_trace(trace, response.status_code)
+    response.headers['Server-Timing'] = trace.server_timing(duration)
+    path = profiler.finish(f"{trace.method} {trace.route}", duration, details=dict(trace.summary(), url=request.full_path.rstrip('?')))
+    if path:
+        print(f"Slow request {trace.method} {request.full_path.rstrip('?')} took {duration * 1000:.0f} ms; profile written to {path}")
+    return response
+
+@app.teardown_request
+def discard_request_instrumentation(exc=None):
+    # after_request is skipped if the request failed before producing a response
+    if current_trace() is not None:
+        end_trace(current_trace(), 500)
+        profiler.end()
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        record_stage('render', time.perf_counter() - started.pop())
+
+@app.before_request
+def start_background_jobs():
+    if report_rollups is not None:
+        report_rollups.start()
+    retention.start()
+
 @app.route('/')
 def dashboard():
     time_window = int(request.args.get('time_window', 60))
@@ -294,64 +457,400 @@ def reports_generate():
     return render_template('reports_generate_page.html',
                            initial_load=True)
 
-@app.route('/api/dashboard-stats')
-def api_dashboard_stats():
-    time_window = int(request.args.get('time_window', 60))
-    transactions_for_stats = get_recent_transactions(minutes_ago=time_window, limit=None)
-    dashboard_stats_data = calculate_dashboard_stats(transactions_for_stats, time_window)
-    
-    # Prepare transactions for JSON serialization (similar to /api/transactions-feed)
-    transactions_in_window_json = []
-    for t in transactions_for_stats: # Use the same list used for stats
-        t_dict = dict(t) 
-        t_dict['ingress_time_str'] = t.get('ingress_time_str', 'N/A')
-        t_dict['egress_time_str'] = t.get('egress_time_str', 'N/A')
-        t_dict['transit_time'] = t.get('transit_time', 'N/A')
-        if 'ingress_time' in t_dict and isinstance(t_dict['ingress_time'], datetime):
-            t_dict['ingress_time'] = t_dict['ingress_time'].isoformat()
-        if 'egress_time' in t_dict and isinstance(t_dict['egress_time'], datetime):
-            t_dict['egress_time'] = t_dict['egress_time'].isoformat()
-        transactions_in_window_json.append(t_dict)
+def dashboard_stats_payload(time_window):
+    """Stats for the last `time_window` minutes from the cheapest source that can serve them."""
+    aggregates = None
+    if rolling_stats is not None:
+        rolling_stats.start()
+        aggregates = rolling_stats.aggregates(time_window)
+    if aggregates is None:
+        aggregates = get_dashboard_aggregates(time_window)
+    if aggregates is not None:
+        with span('stats'):
+            dashboard_stats_data = build_dashboard_stats(aggregates, time_window)
+    else:
+        # SQL aggregation unavailable; fall back to aggregating the rows in Python
+        transactions_for_stats = get_recent_transactions(minutes_ago=time_window, limit=None)
+        with span('stats'):
+            dashboard_stats_data = calculate_dashboard_stats(transactions_for_stats, time_window)
         
-    return jsonify({
+    return {
         'stats': dashboard_stats_data,
         'time_window': time_window,
-        'transactions_in_window': transactions_in_window_json, # Add transactions to the response
         'timestamp': datetime.now().isoformat()
-    })
+    }
+
+def cached_dashboard_stats_payload(time_window):
+    return response_cache.get_or_compute(
+        response_cache.key('dashboard-stats', time_window=time_window),
+        lambda: dashboard_stats_payload(time_window), CACHE_TTL_STATS)
+
+@app.route('/api/dashboard-stats')
+def api_dashboard_stats():
+    time_window = int(request.args.get('time_window', 60))
+    return jsonify(cached_dashboard_stats_payload(time_window))
+
+# Bucket sizes /api/timeseries accepts, and the most buckets one response may hold
+TIMESERIES_BUCKET_SECONDS = (10, 30, 60, 300, 900, 3600)
+MAX_TIMESERIES_BUCKETS = 1440
+TIMESERIES_STATUSES = ('SUBMITTED', 'COMPLETE', 'BAD_REQUEST', 'TIMEOUT', 'EP_UNAVAILABLE', 'CD_UNAVAILABLE')
+
+def accumulator_timeseries_aggregates(accumulator):
+    """One /api/timeseries bucket from a DashboardAccumulator, shaped like db.get_timeseries_aggregates()."""
+    sketch = accumulator.transit_sketch
+    percentiles = sketch.percentiles(*TIMESERIES_PERCENTILES) if sketch.count else [None] * len(TIMESERIES_PERCENTILES)
+    aggregates = {
+        'status_counts': accumulator.status_counts,
+        'complete_bytes': accumulator.complete_bytes,
+        'egress_bytes': accumulator.egress_bytes,
+        'transit_count': sketch.count,
+        'transit_sum': accumulator.transit_sum,
+        'transit_max': accumulator.transit_max,
+    }
+    aggregates.update((f'p{p}_transit', value) for p, value in zip(TIMESERIES_PERCENTILES, percentiles))
+    return aggregates
+
+def timeseries_payload(time_window, bucket_seconds):
+    """Per-bucket series for the last `time_window` minutes, or None if no source could answer.
+
+    Every series is a list with one entry per bucket; bucket i starts at
+    timestamps[i] (epoch milliseconds). The last bucket is still filling.
+    """
+    now = datetime.now()
+    # Start on a bucket edge inside the window so the first bucket is complete
+    start = ceil_time(now - timedelta(minutes=time_window), bucket_seconds)
+    start_epoch = int(start.timestamp())
+    count = int((now - start).total_seconds() // bucket_seconds) + 1
+
+    buckets, source = None, 'sql'
+    if rolling_stats is not None:
+        rolling_stats.start()
+        merged = rolling_stats.bucketed(start_epoch, bucket_seconds)
+        if merged is not None:
+            source = 'memory'
+            buckets = {(epoch - start_epoch) // bucket_seconds: accumulator_timeseries_aggregates(accumulator)
+                       for epoch, accumulator in merged.items()}
+    if buckets is None:
+        buckets = get_timeseries_aggregates(start, now, bucket_seconds)
+    if buckets is None:
+        return None
+
+    statuses = list(TIMESERIES_STATUSES)
+    statuses += sorted({status for b in buckets.values() for status in b['status_counts']} - set(statuses))
+    series = {name: [] for name in ('timestamps', 'transactions', 'tx_per_sec', 'complete_bytes', 'egress_bytes',
+                                    'throughput_mbps', 'avg_transit', 'max_transit')}
+    series.update((f'p{p}_transit', []) for p in TIMESERIES_PERCENTILES)
+    status_series = {status: [] for status in statuses}
+    with span('stats'):
+        for i in range(count):
+            b = buckets.get(i)
+            bucket_start = start_epoch + i * bucket_seconds
+            # The current bucket has only been filling for part of its length
+            duration = max(min(bucket_seconds, now.timestamp() - bucket_start), 1)
+            series['timestamps'].append(bucket_start * 1000)
+            transactions = sum(b['status_counts'].values()) if b else 0
+            for status in statuses:
+                status_series[status].append(b['status_counts'].get(status, 0) if b else 0)
+            series['transactions'].append(transactions)
+            series['tx_per_sec'].append(round(transactions / duration, 3))
+            series['complete_bytes'].append(b['complete_bytes'] if b else 0)
+            series['egress_bytes'].append(b['egress_bytes'] if b else 0)
+            series['throughput_mbps'].append(round((b['egress_bytes'] if b else 0) * 8 / (1024 * 1024) / duration, 3))
+            timed = b and b['transit_count']
+            series['avg_transit'].append(round(b['transit_sum'] / b['transit_count'], 3) if timed else None)
+            series['max_transit'].append(round(b['transit_max'], 3) if timed else None)
+            for p in TIMESERIES_PERCENTILES:
+                value = b.get(f'p{p}_transit') if timed else None
+                series[f'p{p}_transit'].append(round(value, 3) if value is not None else None)
+
+    return {
+        'time_window': time_window,
+        'bucket_seconds': bucket_seconds,
+        'source': source,
+        'series': series,
+        'status_counts': status_series,
+        'timestamp': now.isoformat()
+    }
+
+@app.route('/api/timeseries')
+def api_timeseries():
+    """Bucketed counts by status, bytes, throughput and transit percentiles for dashboard charts"""
+    time_window = request.args.get('time_window', 60, type=int)
+    if time_window <= 0:
+        return jsonify({'error': 'time_window must be a positive number of minutes'}), 400
+    bucket_seconds = request.args.get('bucket', type=int)
+    if bucket_seconds is None:
+        # Smallest bucket that keeps the series to a few hundred points
+        bucket_seconds = next((b for b in TIMESERIES_BUCKET_SECONDS if time_window * 60 / b <= 360),
+                              TIMESERIES_BUCKET_SECONDS[-1])
+    if bucket_seconds not in TIMESERIES_BUCKET_SECONDS:
+        return jsonify({'error': f'bucket must be one of {list(TIMESERIES_BUCKET_SECONDS)} seconds'}), 400
+    if time_window * 60 / bucket_seconds > MAX_TIMESERIES_BUCKETS:
+        return jsonify({'error': f'At most {MAX_TIMESERIES_BUCKETS} buckets; use a larger bucket'}), 400
+
+    payload = response_cache.get_or_compute(
+        response_cache.key('timeseries', time_window=time_window, bucket=bucket_seconds),
+        lambda: timeseries_payload(time_window, bucket_seconds), CACHE_TTL_STATS)
+    if payload is None:
+        return jsonify({'error': 'Time series unavailable'}), 503
+    return jsonify(payload)
+
+MAX_TOP_K = 100
+
+def top_payload(time_window, dimension, metric, k):
+    """The k largest `metric` totals by `dimension` over the last `time_window` minutes, or None.
+
+    Served from the rolling stats' Space-Saving summaries when they cover the
+    window (each total may overestimate by up to its `error`; `exact` is true
+    while no key has been evicted), otherwise ranked in SQL.
+    """
+    now = datetime.now()
+    entries, source, exact = None, 'sql', True
+    if rolling_stats is not None and k <= rolling_stats.top_capacity:
+        rolling_stats.start()
+        hitters = rolling_stats.top(time_window)
+        if hitters is not None:
+            source = 'memory'
+            with span('stats'):
+                top, exact = hitters.top(dimension, metric, k)
+            entries = [{'value': value, 'total': total, 'error': error} for value, total, error in top]
+    if entries is None:
+        top = get_top_values(now - timedelta(minutes=time_window), dimension, metric, k)
+        if top is None:
+            return None
+        entries = [{'value': value, 'total': total, 'error': 0} for value, total in top]
+    return {
+        'time_window': time_window,
+        'dimension': dimension,
+        'metric': metric,
+        'source': source,
+        'exact': exact,
+        'top': entries,
+        'timestamp': now.isoformat()
+    }
+
+@app.route('/api/top')
+def api_top():
+    """Heaviest users, servers or files by transactions, bytes or failures"""
+    time_window = request.args.get('time_window', 60, type=int)
+    if time_window <= 0:
+        return jsonify({'error': 'time_window must be a positive number of minutes'}), 400
+    dimension = request.args.get('dimension', 'username')
+    if dimension not in HeavyHitters.DIMENSIONS:
+        return jsonify({'error': f'dimension must be one of {list(HeavyHitters.DIMENSIONS)}'}), 400
+    metric = request.args.get('metric', 'bytes')
+    if metric not in HeavyHitters.METRICS:
+        return jsonify({'error': f'metric must be one of {list(HeavyHitters.METRICS)}'}), 400
+    k = request.args.get('k', 10, type=int)
+    if not 0 < k <= MAX_TOP_K:
+        return jsonify({'error': f'k must be between 1 and {MAX_TOP_K}'}), 400
+
+    payload = response_cache.get_or_compute(
+        response_cache.key('top', time_window=time_window, dimension=dimension, metric=metric, k=k),
+        lambda: top_payload(time_window, dimension, metric, k), CACHE_TTL_STATS)
+    if payload is None:
+        return jsonify({'error': 'Top-N unavailable'}), 503
+    return jsonify(payload)
+
+MAX_PAGE_SIZE = 500
+
+def encode_page_cursor(t):
+    """Opaque keyset cursor for the row a page ended on."""
+    return f"{t['ingress_time'].isoformat()}|{t['transaction_id']}"
+
+def decode_page_cursor(cursor):
+    ingress_time_str, transaction_id = cursor.split('|', 1)
+    return datetime.fromisoformat(ingress_time_str), transaction_id
+
+@app.route('/api/transactions')
+def api_transactions():
+    """Keyset-paginated transactions, newest first, with server-side filters"""
+    time_window = request.args.get('time_window', type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
+    username = request.args.get('username') or None
+    status = request.args.get('status') or None
+    try:
+        before = decode_page_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def build_page():
+        # Fetch one extra row to learn whether another page exists
+        transactions = get_recent_transactions(minutes_ago=time_window, limit=limit + 1,
+                                               username=username, status=status, before=before)
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        with span('serialize'):
+            serialized = [serialize_transaction(t) for t in transactions]
+        return {
+            'transactions': serialized,
+            'next_cursor': encode_page_cursor(transactions[-1]) if has_more else None,
+            'has_more': has_more,
+            'limit': limit,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    key = response_cache.key('transactions', time_window=time_window, limit=limit, username=username,
+                             status=status, cursor=request.args.get('cursor') or None)
+    return jsonify(response_cache.get_or_compute(key, build_page, CACHE_TTL_FEED))
+
+FEED_UPDATE_HORIZON_MINUTES = int(os.getenv('FEED_UPDATE_HORIZON_MINUTES', 10))
+
+def encode_feed_since(transactions, previous=None):
+    """Watermark token "<max ingress_time>|<max egress_time>" covering the rows a client holds."""
+    ingress_wm, egress_wm = previous or (None, None)
+    for t in transactions:
+        if ingress_wm is None or t['ingress_time'] > ingress_wm:
+            ingress_wm = t['ingress_time']
+        if t['egress_time'] and (egress_wm is None or t['egress_time'] > egress_wm):
+            egress_wm = t['egress_time']
+    if ingress_wm is None:
+        return None
+    return f"{ingress_wm.isoformat()}|{egress_wm.isoformat() if egress_wm else ''}"
+
+def decode_feed_since(since):
+    ingress_str, egress_str = since.split('|', 1)
+    ingress_wm = datetime.fromisoformat(ingress_str)
+    return ingress_wm, datetime.fromisoformat(egress_str) if egress_str else None
+
+def transactions_etag(transactions, *extra):
+    """Weak validator over what the client renders: ids, statuses and egress times."""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in extra:
+        digest.update(f"{part};".encode())
+    for t in transactions:
+        digest.update(f"{t['transaction_id']}:{t['status']}:{t['egress_time']};".encode())
+    return digest.hexdigest()
 
 @app.route('/api/transactions-feed')
 def api_transactions_feed():
+    """Latest transactions; with ?since=<token> only rows new or completed since then"""
     num_items = int(request.args.get('num_items', 50))
-    live_transactions = get_recent_transactions(minutes_ago=None, limit=num_items) 
-    
-    transactions_json = []
-    for t in live_transactions:
-        t_dict = dict(t)
-        t_dict['ingress_time_str'] = t.get('ingress_time_str', 'N/A')
-        t_dict['egress_time_str'] = t.get('egress_time_str', 'N/A')
-        t_dict['transit_time'] = t.get('transit_time', 'N/A')
-        if 'ingress_time' in t_dict and isinstance(t_dict['ingress_time'], datetime):
-            t_dict['ingress_time'] = t_dict['ingress_time'].isoformat()
-        if 'egress_time' in t_dict and isinstance(t_dict['egress_time'], datetime):
-            t_dict['egress_time'] = t_dict['egress_time'].isoformat()
-        transactions_json.append(t_dict)
-        
-    return jsonify({
-        'transactions': transactions_json,
-        'num_items': num_items,
-        'timestamp': datetime.now().isoformat()
-    })
+    since = request.args.get('since')
+    previous = None
+    if since:
+        try:
+            previous = decode_feed_since(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since token'}), 400
 
-@app.route('/download_report', methods=['POST'])
-def download_report():
-    """Handle report generation and download directly"""
+    def build_feed():
+        mode, latest = 'full', previous
+        if latest is not None:
+            ingress_wm, egress_wm = latest
+            live_transactions = get_transactions_changed_since(
+                ingress_wm, egress_wm or ingress_wm, num_items,
+                horizon_minutes=FEED_UPDATE_HORIZON_MINUTES)
+            mode = 'delta'
+            # Too many changes to patch in: send the newest num_items instead
+            if len(live_transactions) >= num_items:
+                latest, mode = None, 'full'
+        if mode == 'full':
+            live_transactions = get_recent_transactions(minutes_ago=None, limit=num_items) 
+
+        with span('serialize'):
+            etag = transactions_etag(live_transactions, mode, num_items, since or '')
+            new_since = encode_feed_since(live_transactions, latest) or since
+            serialized = [serialize_transaction(t) for t in live_transactions]
+        return etag, {
+            'transactions': serialized,
+            'mode': mode,
+            'since': new_since,
+            'num_items': num_items,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    # Clients polling in step share one computation per TTL
+    key = response_cache.key('transactions-feed', num_items=num_items, since=since or None)
+    etag, payload = response_cache.get_or_compute(key, build_feed, CACHE_TTL_FEED)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    return response
+
+def encode_live_event(payload):
+    """JSON for one pushed event; feed rows are copied so the producer's shared rows stay raw."""
+    if 'transactions' in payload:
+        payload = dict(payload, transactions=[serialize_transaction(dict(t)) for t in payload['transactions']])
+    return app.json.dumps(payload)
+
+# One shared poller pushes stats and feed changes to every /api/stream subscriber
+live_producer = LiveProducer(
+    cached_dashboard_stats_payload,
+    lambda limit: get_recent_transactions(minutes_ago=None, limit=limit),
+    lambda ingress_since, egress_since, limit: get_transactions_changed_since(
+        ingress_since, egress_since, limit, horizon_minutes=FEED_UPDATE_HORIZON_MINUTES),
+    encode_live_event,
+    poll_interval=float(os.getenv('LIVE_PUSH_INTERVAL', 1)),
+)
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: `feed` changes, plus `stats` when ?time_window= is given"""
+    time_window = request.args.get('time_window', type=int)
+    subscription = live_producer.subscribe(time_window)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.overflowed:
+                    live_producer.resync(subscription)
+                try:
+                    yield subscription.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"  # also how a closed connection gets noticed
+        finally:
+            live_producer.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Define headers based on DB table + calculated fields
+CSV_REPORT_HEADERS = ['transaction_id', 'username', 'file_name', 'file_size', 'ingress_server', 
+                      'ingress_time', 'egress_server', 'egress_time', 'status', 'transit_time_seconds']
+
+def generate_csv_report(batches):
+    """Yield the CSV report one chunk per fetched batch, so memory stays constant."""
+    si = io.StringIO()
+    cw = csv.writer(si)
+    cw.writerow(CSV_REPORT_HEADERS)
+    for batch in batches:
+        for t in batch:
+            cw.writerow([t.get(h) for h in CSV_REPORT_HEADERS])
+        yield si.getvalue()
+        si.seek(0)
+        si.truncate(0)
+    if si.tell():
+        yield si.getvalue()
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks on the fly into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def no_transactions_redirect():
+    """Send the user back to the report form with a 'no data' message."""
+    return redirect(url_for('reports_generate', 
+                            report_message="No transactions found for the selected criteria. Please try a different date range or filter.", 
+                            report_message_type="warning"))
+
+def parse_report_form(form):
+    """(start_dt, end_dt, username, report_format, filename) from the report form fields."""
     # Default to the last 24 hours if no date range is specified
     default_start_dt = datetime.now() - timedelta(hours=24)
     default_end_dt = datetime.now()
     
     try:
-        daterange_str = request.form.get('daterange', '')
+        daterange_str = form.get('daterange', '')
         start_str, end_str = daterange_str.split(' - ')
         start_dt = datetime.strptime(start_str, '%Y-%m-%d %H:%M:%S')
         end_dt = datetime.strptime(end_str, '%Y-%m-%d %H:%M:%S')
@@ -359,81 +858,305 @@ def download_report():
         # Handle error or use default if parsing fails
         start_dt, end_dt = default_start_dt, default_end_dt
     
-    username_filter = request.form.get('username', 'all').strip()
-    selected_report_format = request.form.get('report_format', 'csv')
-    
-    # Get transactions from database
-    transactions = get_transactions_for_report(start_dt, end_dt, username_filter if username_filter.lower() != 'all' else None)
+    username_filter = form.get('username', 'all').strip()
+    selected_report_format = form.get('report_format', 'csv')
     
-    # If no transactions found, redirect with a message
-    if not transactions:
-        return redirect(url_for('reports_generate', 
-                                report_message="No transactions found for the selected criteria. Please try a different date range or filter.", 
-                                report_message_type="warning"))
+    username = username_filter if username_filter.lower() != 'all' else None
+    filename = f"transactions_{start_dt.strftime('%Y%m%d%H%M%S')}_{end_dt.strftime('%Y%m%d%H%M%S')}"
+    return start_dt, end_dt, username, selected_report_format, filename
 
-    # For CSV format, return CSV file
-    if selected_report_format == 'csv':
-        si = io.StringIO()
-        cw = csv.writer(si)
-        
-        # Define headers based on DB table + calculated fields
-        headers = ['transaction_id', 'username', 'file_name', 'file_size', 'ingress_server', 
-                  'ingress_time', 'egress_server', 'egress_time', 'status', 'transit_time_seconds']
-        cw.writerow(headers)
-        
-        for t in transactions:
-            row = [t.get(h) for h in headers]
-            cw.writerow(row)
-        
-        output = si.getvalue()
-        filename = f"transactions_{start_dt.strftime('%Y%m%d%H%M%S')}_{end_dt.strftime('%Y%m%d%H%M%S')}"
-        
-        return Response(
-            output,
-            mimetype="text/csv",
-            headers={"Content-disposition": f"attachment; filename={filename}.csv"}
-        )
-    
-    # For HTML format, generate HTML report for download
-    elif selected_report_format == 'html':
-        # Calculate statistics for the report
-        report_duration_minutes = (end_dt - start_dt).total_seconds() / 60
-        overall_stats = calculate_report_stats_for_subset(transactions, duration_minutes=report_duration_minutes)
+def precompile_templates():
+    """Compile every template up front so no request pays for it (and the bytecode cache is filled)."""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+precompile_templates()
+
+def render_user_section(username, user_stats):
+    """One user's report section as Markup; identical stats reuse the cached fragment."""
+    digest = hashlib.blake2b(repr((username, sorted(user_stats.items()))).encode(), digest_size=16).hexdigest()
+    return report_fragment_cache.get_or_compute(
+        report_fragment_cache.key('report-user-section', digest=digest),
+        lambda: Markup(app.jinja_env.get_template('report_user_section.html').render(
+            username=username, user_stats=user_stats)),
+        REPORT_FRAGMENT_TTL)
+
+# Report top-N section: how many entries per ranking, and the breakdowns it covers
+REPORT_TOP_N = int(os.getenv('REPORT_TOP_N', 10))
+REPORT_TOP_DIMENSIONS = (('username', 'Users'), ('ingress_server', 'Ingress Servers'), ('egress_server', 'Egress Servers'))
+REPORT_TOP_METRICS = (
+    ('transactions', 'By Transactions', lambda a: a.total_transactions),
+    ('bytes', 'By Data Volume', lambda a: a.total_bytes),
+    ('failures', 'By Failures', lambda a: sum(a.status_breakdown.get(status, 0) for status in FAILURE_STATUSES)),
+    ('users', 'By Unique Users', lambda a: a.usernames.count()),
+)
+
+def report_top_talkers(groups, n=REPORT_TOP_N):
+    """Top-n rankings per dimension from the report's (exact) group accumulators, via heap selection."""
+    sections = []
+    for dimension, title in REPORT_TOP_DIMENSIONS:
+        if len(groups.get(dimension, ())) < 2:
+            continue
+        rankings = []
+        for metric, label, total in REPORT_TOP_METRICS:
+            if metric == 'users' and dimension == 'username':
+                continue
+            totals = ((value, total(accumulator)) for value, accumulator in groups[dimension].items()
+                      if value is not None)
+            entries = heapq.nlargest(n, ((value, amount) for value, amount in totals if amount),
+                                     key=lambda entry: entry[1])
+            rankings.append({'metric': metric, 'title': label, 'entries': entries})
+        sections.append({'title': title, 'rankings': rankings})
+    return sections
+
+def html_report_context(start_dt, end_dt, username, progress=None):
+    """Template context for the HTML report, or None if the range has no transactions.
+
+    Per-user sections are a generator, so streaming the template builds and
+    renders them one at a time.
+    """
+    progress = progress or (lambda fraction, message=None: None)
+    progress(0.05, 'Aggregating transactions')
+    # A single user's report has no top-N section, so it only needs the per-user grouping
+    group_by = ('username',) if username else tuple(dimension for dimension, _ in REPORT_TOP_DIMENSIONS)
+    # Overall and per-user stats: from rollups where they cover the range, else one pass over the rows
+    aggregated = report_rollups.report(start_dt, end_dt, username, group_by) if report_rollups is not None else None
+    if aggregated is None:
+        progress(0.1, 'Aggregating time shards')
+        aggregated = report_shards.aggregate(start_dt, end_dt, username, group_by=group_by)
+    if aggregated is None:
+        transactions = get_transactions_for_report(start_dt, end_dt, username, columnar=True)
+        progress(0.6, 'Computing statistics')
+        with span('stats'):
+            aggregated = aggregate_report(transactions, group_by=group_by)
+    overall, groups = aggregated
+
+    if not overall.total_transactions:
+        return None
+
+    # Calculate statistics for the report
+    progress(0.8, 'Rendering report')
+    report_duration_minutes = (end_dt - start_dt).total_seconds() / 60
+    with span('stats'):
+        overall_stats = build_report_stats(overall, duration_minutes=report_duration_minutes)
         overall_stats['start_time_str'] = start_dt.strftime('%Y-%m-%d %H:%M')
         overall_stats['end_time_str'] = end_dt.strftime('%Y-%m-%d %H:%M')
-        
-        # Calculate stats for each username
-        user_specific_stats = {}
-        distinct_users = sorted(list(set(t['username'] for t in transactions)))
-        for user in distinct_users:
-            user_tx = [t for t in transactions if t['username'] == user]
+        top_talkers = report_top_talkers(groups)
+
+    users = sorted(groups['username'].items())
+
+    def user_sections():
+        for i, (user, accumulator) in enumerate(users):
             # Not passing duration_minutes for user-specific rates for now
-            user_specific_stats[user] = calculate_report_stats_for_subset(user_tx)
-        
-        # Create HTML report
-        report_data = {
-            'transactions': transactions,
-            'overall_stats': overall_stats,
-            'user_stats': user_specific_stats
-        }
+            with span('stats'):
+                user_stats = build_report_stats(accumulator)
+            yield render_user_section(user, user_stats)
+            progress(0.8 + 0.2 * (i + 1) / len(users), 'Rendering report')
+
+    # The template renders only the stats, never the rows
+    return {
+        'report_data': {'overall_stats': overall_stats, 'top_talkers': top_talkers},
+        'user_sections': user_sections(),
+        'now': datetime.now(),
+    }
+
+@app.route('/download_report', methods=['POST'])
+def download_report():
+    """Handle report generation and download directly"""
+    start_dt, end_dt, username, selected_report_format, filename = parse_report_form(request.form)
+
+    # For CSV format, stream the CSV file straight from a server-side cursor
+    if selected_report_format == 'csv':
+        if not report_has_transactions(start_dt, end_dt, username):
+            return no_transactions_redirect()
+
+        use_gzip = REPORT_GZIP and accepts_encoding('gzip')
+        chunks = generate_csv_report(iter_transactions_for_report(start_dt, end_dt, username))
+        headers = {"Content-disposition": f"attachment; filename={filename}.csv"}
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
         
-        html_content = render_template(
-            'report_template.html',
-            report_data=report_data,
-            now=datetime.now()
-        )
+        return Response(chunks, mimetype="text/csv", headers=headers)
+
+    # For HTML format, generate HTML report for download
+    if selected_report_format == 'html':
+        context = html_report_context(start_dt, end_dt, username)
         
-        filename = f"transactions_{start_dt.strftime('%Y%m%d%H%M%S')}_{end_dt.strftime('%Y%m%d%H%M%S')}"
+        # If no transactions found, redirect with a message
+        if context is None:
+            return no_transactions_redirect()
         
+        # Streamed so large multi-user reports start downloading immediately
         return Response(
-            html_content,
+            stream_template('report_template.html', **context),
             mimetype="text/html",
             headers={"Content-disposition": f"attachment; filename={filename}.html"}
         )
 
+def build_report_job(job, path, progress):
+    """ReportJobManager build callback: write the job's report to path; False if there is no data."""
+    start_dt, end_dt = datetime.fromisoformat(job['start']), datetime.fromisoformat(job['end'])
+    username = job['username']
+
+    if job['format'] == 'csv':
+        if not report_has_transactions(start_dt, end_dt, username):
+            return False
+        range_seconds = max((end_dt - start_dt).total_seconds(), 1)
+
+        def tracked_batches():
+            # Rows arrive newest first, so progress is how far back from end_dt we have got
+            for batch in iter_transactions_for_report(start_dt, end_dt, username):
+                progress((end_dt - batch[-1]['ingress_time']).total_seconds() / range_seconds, 'Writing rows')
+                yield batch
+
+        # Stored gzipped; served as-is to clients that accept gzip
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            for chunk in generate_csv_report(tracked_batches()):
+                f.write(chunk)
+        return True
+
+    # Rendering needs a request context for url_for() in the template
+    with app.test_request_context('/'):
+        context = html_report_context(start_dt, end_dt, username, progress)
+        if context is None:
+            return False
+        with open(path, 'w', encoding='utf-8') as f:
+            for chunk in stream_template('report_template.html', **context):
+                f.write(chunk)
+    return True
+
+# Reports built in the background; state and files (full transaction data) live in REPORT_JOB_DIR
+report_jobs = ReportJobManager(
+    build_report_job,
+    os.getenv('REPORT_JOB_DIR', os.path.join(app.instance_path, 'report-jobs')),
+    max_workers=int(os.getenv('REPORT_JOB_WORKERS', 2)),
+    result_ttl=int(os.getenv('REPORT_JOB_RESULT_TTL', 3600)),
+)
+
+def report_job_payload(job):
+    payload = {key: job[key] for key in ('id', 'status', 'progress', 'message', 'format', 'filename')}
+    payload['status_url'] = url_for('api_report_job', job_id=job['id'])
+    payload['download_url'] = url_for('download_report_job', job_id=job['id']) if job['status'] == COMPLETE else None
+    return payload
+
+@app.route('/api/report-jobs', methods=['POST'])
+def submit_report_job():
+    """Queue a report build (same form fields as /download_report); identical requests share a job"""
+    start_dt, end_dt, username, report_format, filename = parse_report_form(request.form)
+    if report_format not in ('csv', 'html'):
+        return jsonify({'error': 'Unsupported report format'}), 400
+    job = report_jobs.submit(start_dt, end_dt, username, report_format, filename)
+    return jsonify(report_job_payload(job)), 202
+
+@app.route('/api/report-jobs/<job_id>')
+def api_report_job(job_id):
+    """Progress/state of a report job"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired report job'}), 404
+    return jsonify(report_job_payload(job))
+
+@app.route('/api/report-jobs/<job_id>/download')
+def download_report_job(job_id):
+    """Download a finished report job's file"""
+    job = report_jobs.get(job_id)
+    if job is None or job['status'] != COMPLETE:
+        return jsonify({'error': 'Report is not ready'}), 404
+    path = report_jobs.artifact_path(job)
+    headers = {"Content-disposition": f"attachment; filename={job['filename']}"}
+
+    if job['format'] == 'html':
+        # Keep send_file's status: 304 for a matching If-None-Match, 206 for a Range request
+        response = send_file(path, mimetype="text/html", conditional=True, etag=job['id'])
+        response.headers.update(headers)
+        return response
+
+    headers["Vary"] = "Accept-Encoding"
+    if accepts_encoding('gzip'):
+        response = send_file(path, mimetype="text/csv", conditional=True, etag=job['id'])
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers.update(headers)
+        return response
+
+    def decompressed():
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(decompressed(), mimetype="text/csv", headers=headers)
+
+# Batched writer behind /api/ingest; written rows wake the rolling stats (INGEST_FEED_STATS=0 disables)
+ingest_writer = IngestWriter(
+    upsert_transactions,
+    max_batch_rows=int(os.getenv('INGEST_BATCH_ROWS', 1000)),
+    max_batch_seconds=float(os.getenv('INGEST_BATCH_SECONDS', 0.5)),
+    max_queued=int(os.getenv('INGEST_MAX_QUEUED', 50000)),
+    on_flush=rolling_stats.poke if rolling_stats is not None and os.getenv('INGEST_FEED_STATS', '1') != '0' else None,
+    max_hold_seconds=float(os.getenv('INGEST_HOLD_SECONDS', 60)),
+)
+INGEST_MAX_EVENTS = int(os.getenv('INGEST_MAX_EVENTS', 10000))
+INGEST_QUEUE_TIMEOUT = float(os.getenv('INGEST_QUEUE_TIMEOUT', 1))
+
+@app.route('/api/ingest', methods=['POST'])
+def api_ingest():
+    """Queue transaction events (JSON lines, or a JSON array) for batched writing"""
+    body = request.get_data(as_text=True)
+    if request.mimetype == 'application/json':
+        try:
+            events = app.json.loads(body)
+        except ValueError as err:
+            return jsonify({'error': f'Invalid JSON: {err}'}), 400
+        if not isinstance(events, list):
+            events = [events]
+    else:
+        events = [line for line in body.splitlines() if line.strip()]
+    if len(events) > INGEST_MAX_EVENTS:
+        return jsonify({'error': f'At most {INGEST_MAX_EVENTS} events per request'}), 413
+
+    records, errors = [], []
+    for number, event in enumerate(events, 1):
+        try:
+            records.append(parse_event(app.json.loads(event) if isinstance(event, str) else event))
+        except ValueError as err:
+            errors.append({'line': number, 'error': str(err)})
+    if errors and not records:
+        return jsonify({'accepted': 0, 'invalid': len(errors), 'errors': errors[:20]}), 400
+
+    try:
+        ingest_writer.submit(records, timeout=INGEST_QUEUE_TIMEOUT)
+    except IngestQueueFull as err:
+        response = jsonify({'error': str(err)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    status = 202
+    # ?wait=1 returns only once the events are in the database
+    if request.args.get('wait') == '1':
+        if not ingest_writer.flush():
+            return jsonify({'error': 'Timed out waiting for the write', 'accepted': len(records)}), 504
+        status = 200
+    return jsonify({'accepted': len(records), 'invalid': len(errors), 'errors': errors[:20]}), status
+
 @app.route('/admin/clear-db', methods=['POST'])
 def admin_clear_db():
-    success, message = clear_all_transactions()
+    try:
+        state = retention.clear(wait=CLEAR_WAIT_SECONDS)
+        success = state['status'] in (PURGE_COMPLETE, PURGE_RUNNING)
+        if state['status'] == PURGE_COMPLETE:
+            message = f"{state['deleted']} transactions deleted successfully."
+        elif success:
+            message = (f"Clearing {state['estimated_total'] or 'all'} transactions in the background "
+                       f"({state['deleted']} deleted so far); progress at /admin/retention.")
+        else:
+            message = f"Error clearing transactions: {state['error'] or state['status']}"
+    except PurgeInProgress as err:
+        success, message = False, f"{err}; progress at /admin/retention."
+    response_cache.clear()
     message_type = 'success' if success else 'error'
     # Use global flash message instead of rendering admin page
     if success:
@@ -444,12 +1167,95 @@ def admin_clear_db():
 @app.route('/api/usernames')
 def api_usernames():
     """API endpoint to get unique usernames for dropdowns"""    
-    usernames = get_unique_usernames()   
+    usernames = response_cache.get_or_compute(
+        response_cache.key('usernames'), get_unique_usernames, CACHE_TTL_USERNAMES)
    
     return jsonify({
         'usernames': usernames
     })
 
+@app.route('/api/db-status')
+def api_db_status():
+    """API endpoint exposing connection pool statistics"""
+    return jsonify({
+        'pool': get_pool_stats(),
+        'cache': response_cache.stats(),
+        'ingest': ingest_writer.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+def pool_and_cache_metrics():
+    pool = get_pool_stats()
+    cache = response_cache.stats()
+    return (
+        metric_lines('dashboard_db_pool_connections', 'Pooled database connections by state.',
+                     [({'state': 'in_use'}, pool['in_use']), ({'state': 'idle'}, pool['idle'])])
+        + metric_lines('dashboard_db_pool_checkouts_total', 'Connection checkouts.',
+                       [(None, pool['checkouts'])], 'counter')
+        + metric_lines('dashboard_db_pool_wait_seconds_total', 'Time spent waiting for a connection.',
+                       [(None, pool['wait_seconds'])], 'counter')
+        + metric_lines('dashboard_cache_entries', 'Entries in the response cache.', [(None, cache['entries'])])
+        + metric_lines('dashboard_cache_lookups_total', 'Response cache lookups by result.',
+                       [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])], 'counter')
+    )
+
+metrics_registry.register_collector(pool_and_cache_metrics)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics: route latency histograms, stage and query timings, pool and cache gauges"""
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/retention', methods=['GET', 'POST'])
+def admin_retention():
+    """Retention purge progress; POST older_than_days=N to purge older rows, or action=cancel"""
+    if request.method == 'GET':
+        return jsonify(retention.status())
+    if request.values.get('action') == 'cancel':
+        return jsonify(dict(retention.status(), cancelling=retention.cancel()))
+    older_than_days = request.values.get('older_than_days', type=float)
+    if older_than_days is None or older_than_days < 0:
+        return jsonify({'error': 'older_than_days must be a non-negative number of days'}), 400
+    try:
+        retention.purge_older_than(datetime.now() - timedelta(days=older_than_days))
+    except PurgeInProgress as err:
+        return jsonify(dict(retention.status(), error=str(err))), 409
+    return jsonify(retention.status()), 202
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """Show the slow-request profiler's state; POST enabled=1/0 to turn it on or off"""
+    if request.method == 'POST':
+        profiler.set_enabled(request.values.get('enabled', '1') in ('1', 'true', 'on'))
+    return jsonify(profiler.status())
+
+def accepts_encoding(encoding):
+    """True if the request's Accept-Encoding allows `encoding` (an explicit q=0 refuses it)."""
+    return request.accept_encodings[encoding] > 0
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file, fingerprinted when the asset build has it."""
+    built = static_assets.url_path(filename) if static_assets is not None else None
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=built)
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted static file, precompressed when the client accepts it"""
+    asset = static_assets.resolve(filename, accepts_encoding) if static_assets is not None else None
+    if asset is None:
+        return Response("Not found", status=404, mimetype="text/plain")
+    path, mimetype, encoding = asset
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=STATIC_ASSETS_MAX_AGE)
+    # The name changes whenever the content does, so clients never need to revalidate
+    response.headers["Cache-Control"] = f"public, max-age={STATIC_ASSETS_MAX_AGE}, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
 @app.route('/favicon.ico')
 def favicon():
     return Response(status=204)
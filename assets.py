@@ -0,0 +1,151 @@
+"""Fingerprinted, precompressed static assets.
+
+AssetManifest copies every file under static/ to a build directory under a
+content-hashed name (style.css -> style.1a2b3c4d5e.css), alongside .gz and,
+when the optional `brotli` package is installed, .br variants of the text
+files. Stylesheets have their url(...) references rewritten to the
+fingerprinted names first, so a new webfont also changes the hash of the CSS
+that loads it. Because a fingerprinted URL never changes content, it can be
+served with an immutable, year-long Cache-Control header.
+
+Building is idempotent and safe to run from several workers at once:
+existing outputs are kept, and new ones are written atomically. Old builds
+are never pruned, so pages and saved reports that still reference an earlier
+hash keep working. `python assets.py [build_dir]` builds ahead of time, e.g.
+in a container image, so workers start with nothing left to compress.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are built without it
+    brotli = None
+
+# Worth compressing; fonts like woff2 and images are compressed already
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.ttf', '.eot')
+# (extension, Content-Encoding), most preferred first
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+HASH_LENGTH = 10
+# The app's instance folder: assets are served from here as-is, so it must not be a shared, writable path
+DEFAULT_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'assets')
+MANIFEST_NAME = 'manifest.json'
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def fingerprinted_name(path, digest):
+    """js/app.min.js -> js/app.min.<digest>.js"""
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class AssetManifest:
+    def __init__(self, static_dir, build_dir, brotli_quality=11):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.brotli_quality = brotli_quality
+        self.files = {}  # logical path (as passed to url_for('static')) -> fingerprinted path
+
+    def _sources(self):
+        for root, _, names in os.walk(self.static_dir):
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, self.static_dir).replace(os.sep, '/'), full
+
+    def _rewrite_css(self, path, text):
+        """Point url(...) references at the fingerprinted files (unknown or absolute URLs are left alone)."""
+        base = posixpath.dirname(path)
+
+        def replace(match):
+            quote, url = match.groups()
+            if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            target, sep, suffix = (re.split(r'([?#])', url, maxsplit=1) + ['', ''])[:3]  # keep ?#iefix and the like
+            built = self.files.get(posixpath.normpath(posixpath.join(base, target)))
+            if built is None:
+                return match.group(0)
+            return f"url({quote}{posixpath.relpath(built, base or '.')}{sep}{suffix}{quote})"
+
+        return CSS_URL.sub(replace, text)
+
+    def build(self):
+        """Fingerprint and compress every static file; returns the manifest dict."""
+        files = {}
+        sources = list(self._sources())
+        # Stylesheets last, so the files they reference already have their final names
+        sources.sort(key=lambda item: item[0].endswith('.css'))
+        for path, full in sources:
+            with open(full, 'rb') as f:
+                data = f.read()
+            if path.endswith('.css'):
+                data = self._rewrite_css(path, data.decode('utf-8')).encode('utf-8')
+            built = fingerprinted_name(path, hashlib.sha256(data).hexdigest())
+            self._emit(built, data)
+            files[path] = self.files[path] = built
+        _write_atomic(os.path.join(self.build_dir, MANIFEST_NAME), json.dumps(files, indent=2).encode('utf-8'))
+        return files
+
+    def _emit(self, built, data):
+        target = os.path.join(self.build_dir, *built.split('/'))
+        if not os.path.exists(target):
+            _write_atomic(target, data)
+        if not built.endswith(COMPRESSIBLE):
+            return
+        variants = [('.gz', lambda: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.insert(0, ('.br', lambda: brotli.compress(data, quality=self.brotli_quality)))
+        for ext, compress in variants:
+            if os.path.exists(target + ext):
+                continue
+            compressed = compress()
+            # A variant that doesn't save anything is skipped; the plain file is served instead
+            if len(compressed) < len(data):
+                _write_atomic(target + ext, compressed)
+
+    def url_path(self, path):
+        """The fingerprinted path for a logical static path, or None if it isn't in the build."""
+        return self.files.get(path)
+
+    def resolve(self, built, accept_encoding=lambda encoding: False):
+        """(file path, mimetype, Content-Encoding or None) to serve for a fingerprinted path, or None.
+
+        `accept_encoding(name)` says whether the client accepts an encoding.
+        Files from earlier builds still in build_dir are served too; the
+        manifest, which changes with every build, is not served at all.
+        """
+        parts = built.split('/')
+        # Compressed variants are only served through Content-Encoding, never under their own names
+        if any(part in ('', '.', '..') for part in parts) or built.endswith(('.tmp', '.gz', '.br')):
+            return None
+        if parts == [MANIFEST_NAME]:
+            return None
+        target = os.path.join(self.build_dir, *parts)
+        if not os.path.isfile(target):
+            return None
+        mimetype = mimetypes.guess_type(built)[0] or 'application/octet-stream'
+        for ext, encoding in ENCODINGS:
+            if accept_encoding(encoding) and os.path.isfile(target + ext):
+                return target + ext, mimetype, encoding
+        return target, mimetype, None
+
+
+if __name__ == '__main__':
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    build_dir = sys.argv[1] if len(sys.argv) > 1 else os.getenv('STATIC_ASSETS_DIR', DEFAULT_BUILD_DIR)
+    manifest = AssetManifest(static_dir, build_dir).build()
+    print(f"Built {len(manifest)} assets in {os.path.abspath(build_dir)}"
+          f" ({'gzip and brotli' if brotli is not None else 'gzip only; install brotli for .br'})")
@@ -0,0 +1,227 @@
+"""Benchmark the dashboard's hot paths against a synthetic SQLite database.
+
+Times get_recent_transactions, calculate_dashboard_stats,
+calculate_report_stats_for_subset, the /api/dashboard-stats and
+/api/transactions JSON responses, and CSV/HTML /download_report. Each
+benchmark reports latency percentiles, throughput and peak traced memory.
+Results are saved as JSON; pass --compare to diff against an earlier run.
+
+    python benchmarks/run_benchmarks.py --generate --rows 1000000
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402  (benchmarks/ is on sys.path when run as a script)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile (0-100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def measure(name, func, iterations, warmup=1, units=None):
+    """Run func() `iterations` times after `warmup` runs; func returns the number of items it processed.
+
+    Peak memory is measured on one extra traced run so tracing overhead
+    doesn't skew the timings.
+    """
+    for _ in range(warmup):
+        func()
+    timings, items = [], 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        items = func() or 0
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    return {
+        'name': name,
+        'iterations': iterations,
+        'items': items,
+        'units': units or 'items',
+        'mean_ms': mean * 1000,
+        'min_ms': timings[0] * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'ops_per_second': 1 / mean if mean else 0.0,
+        'items_per_second': items / mean if mean else 0.0,
+        'peak_memory_mb': peak / (1024 * 1024),
+    }
+
+
+def build_benchmarks(args):
+    """(name, callable, units) for every benchmark; imports the app once the environment is set."""
+    import app as dashboard_app
+    from db import get_recent_transactions
+
+    client = dashboard_app.app.test_client()
+    window = args.time_window
+    recent = get_recent_transactions(minutes_ago=window, limit=None)
+    report_end = datetime.now()
+    report_start = report_end - timedelta(hours=args.report_hours)
+    report_form = {
+        'daterange': f"{report_start:%Y-%m-%d %H:%M:%S} - {report_end:%Y-%m-%d %H:%M:%S}",
+        'username': 'all',
+    }
+
+    def fetch_recent():
+        return len(get_recent_transactions(minutes_ago=window, limit=None))
+
+    def dashboard_stats():
+        dashboard_app.calculate_dashboard_stats(recent, window)
+        return len(recent)
+
+    def report_stats():
+        dashboard_app.calculate_report_stats_for_subset(recent, duration_minutes=window)
+        return len(recent)
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+            return len(response.get_data())
+        return run
+
+    def download(report_format):
+        def run():
+            response = client.post('/download_report', data=dict(report_form, report_format=report_format))
+            assert response.status_code == 200, response.status_code
+            return len(response.get_data())  # consumes the streamed body
+        return run
+
+    return [
+        ('get_recent_transactions', fetch_recent, 'rows'),
+        ('calculate_dashboard_stats', dashboard_stats, 'rows'),
+        ('calculate_report_stats_for_subset', report_stats, 'rows'),
+        ('api_dashboard_stats', get(f'/api/dashboard-stats?time_window={window}'), 'bytes'),
+        ('api_transactions_json', get(f'/api/transactions?time_window={window}&limit=500'), 'bytes'),
+        ('download_report_csv', download('csv'), 'bytes'),
+        ('download_report_html', download('html'), 'bytes'),
+    ]
+
+
+def environment_info(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    optional = {}
+    for module in ('numpy', 'orjson'):
+        try:
+            optional[module] = __import__(module).__version__
+        except ImportError:
+            optional[module] = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'optional_packages': optional,
+        'database': args.db,
+        'time_window_minutes': args.time_window,
+        'report_hours': args.report_hours,
+    }
+
+
+def print_results(results):
+    print(f"{'benchmark':36} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'throughput':>18} {'peak MB':>9}")
+    for r in results:
+        throughput = f"{r['items_per_second']:,.0f} {r['units']}/s"
+        print(f"{r['name']:36} {r['p50_ms']:10.2f} {r['p95_ms']:10.2f} {r['p99_ms']:10.2f} "
+              f"{throughput:>18} {r['peak_memory_mb']:9.1f}")
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 changes against a saved run; returns the names that regressed by more than threshold."""
+    with open(baseline_path) as f:
+        baseline = {r['name']: r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nCompared with {baseline_path} (p50; regression threshold {threshold:.0%}):")
+    for r in results:
+        before = baseline.get(r['name'])
+        if not before or not before['p50_ms']:
+            print(f"  {r['name']:36} (no baseline)")
+            continue
+        change = r['p50_ms'] / before['p50_ms'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(r['name'])
+        print(f"  {r['name']:36} {before['p50_ms']:10.2f} -> {r['p50_ms']:10.2f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'bench.sqlite3'), help='SQLite database file')
+    parser.add_argument('--generate', action='store_true', help='(re)populate the database first')
+    synthetic.add_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--time-window', type=int, default=60, help='dashboard window in minutes')
+    parser.add_argument('--report-hours', type=float, default=24, help='download_report range')
+    parser.add_argument('--only', nargs='*', help='run only these benchmarks')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown counted as a regression')
+    parser.add_argument('--keep-caches', action='store_true',
+                        help="leave the response cache, rolling stats, rollups and report shards on (default: measure raw paths)")
+    args = parser.parse_args()
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = args.db
+    if not args.keep_caches:
+        for name in ('RESPONSE_CACHE', 'DASHBOARD_ROLLING_STATS', 'REPORT_ROLLUPS', 'REPORT_SHARD_WORKERS'):
+            os.environ[name] = '0'
+
+    if args.generate or not os.path.exists(args.db):
+        rate = synthetic.populate(synthetic.generator_from_args(args), args.rows,
+                                  progress=lambda done, total: print(f"\rGenerating {done}/{total} rows", end='', flush=True))
+        print(f"\nGenerated {args.rows} rows ({rate:,.0f} rows/s)")
+
+    results = []
+    for name, func, units in build_benchmarks(args):
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name}...", flush=True)
+        results.append(measure(name, func, args.iterations, args.warmup, units))
+    print()
+    print_results(results)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment_info(args), 'results': results}, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
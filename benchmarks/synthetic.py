@@ -0,0 +1,134 @@
+"""Synthetic `transactions` generator for benchmarks.
+
+Writes realistic rows into any pool backend (normally a local SQLite file):
+a configurable number of users and servers with skewed (Zipf-like) activity,
+a weighted status mix, log-normal file sizes and transit times, and ingress
+times spread over the last `hours`. Output is reproducible for a given seed.
+
+    python benchmarks/synthetic.py --db /tmp/bench.sqlite3 --rows 1000000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_STATUS_MIX = {
+    'COMPLETE': 0.85,
+    'EP_UNAVAILABLE': 0.03,
+    'BAD_REQUEST': 0.03,
+    'TIMEOUT': 0.03,
+    'CD_UNAVAILABLE': 0.02,
+    'SUBMITTED': 0.04,
+}
+EGRESS_STATUSES = ('COMPLETE', 'EP_UNAVAILABLE')  # statuses that reached an egress server
+
+
+class TransactionGenerator:
+    def __init__(self, users=50, ingress_servers=4, egress_servers=4, status_mix=None,
+                 file_size_median=2 * 1024 * 1024, file_size_sigma=1.5,
+                 transit_median=1.5, transit_sigma=0.8, hours=24, seed=42, now=None):
+        self.random = random.Random(seed)
+        self.usernames = [f"user{i:03d}" for i in range(users)]
+        self.user_weights = [1 / (i + 1) for i in range(users)]  # a few heavy users, a long tail
+        self.ingress_servers = [f"ingress-{i:02d}" for i in range(ingress_servers)]
+        self.egress_servers = [f"egress-{i:02d}" for i in range(egress_servers)]
+        mix = status_mix or DEFAULT_STATUS_MIX
+        self.statuses, self.status_weights = list(mix), list(mix.values())
+        self.file_size_mu, self.file_size_sigma = math.log(file_size_median), file_size_sigma
+        self.transit_mu, self.transit_sigma = math.log(transit_median), transit_sigma
+        self.now = now or datetime.now()
+        self.span_seconds = hours * 3600
+
+    def rows(self, count):
+        """Yield `count` row tuples in columnar.COLUMNS order."""
+        rnd = self.random
+        for i in range(count):
+            ingress_time = self.now - timedelta(seconds=rnd.random() * self.span_seconds)
+            status = rnd.choices(self.statuses, self.status_weights)[0]
+            if status in EGRESS_STATUSES:
+                egress_server = rnd.choice(self.egress_servers)
+                egress_time = ingress_time + timedelta(seconds=rnd.lognormvariate(self.transit_mu, self.transit_sigma))
+            else:
+                egress_server = egress_time = None
+            yield (
+                str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+                rnd.choices(self.usernames, self.user_weights)[0],
+                f"file_{i:08d}.dat",
+                0 if status == 'BAD_REQUEST' else int(rnd.lognormvariate(self.file_size_mu, self.file_size_sigma)),
+                rnd.choice(self.ingress_servers),
+                ingress_time,
+                egress_server,
+                egress_time,
+                status,
+            )
+
+
+def populate(generator, count, chunk_size=10000, clear=True, progress=None):
+    """Insert `count` generated rows through db.py's pool; returns rows/second."""
+    import db
+    started = time.perf_counter()
+    with db.get_pool().connection() as conn:
+        cursor = conn.cursor()
+        if clear:
+            cursor.execute("DELETE FROM transactions")
+        rows = generator.rows(count)
+        inserted = 0
+        while inserted < count:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            cursor.executemany("""
+                INSERT INTO transactions (transaction_id, username, file_name, file_size, ingress_server,
+                                          ingress_time, egress_server, egress_time, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, chunk)
+            conn.commit()
+            inserted += len(chunk)
+            if progress:
+                progress(inserted, count)
+        cursor.close()
+    return count / (time.perf_counter() - started)
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=200000, help='rows to generate')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--servers', type=int, default=4, help='ingress and egress servers each')
+    parser.add_argument('--hours', type=float, default=24, help='spread ingress times over the last N hours')
+    parser.add_argument('--file-size-median', type=int, default=2 * 1024 * 1024, help='bytes')
+    parser.add_argument('--transit-median', type=float, default=1.5, help='seconds')
+    parser.add_argument('--complete-ratio', type=float, default=None,
+                        help='share of COMPLETE rows; other statuses are scaled to fit')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def generator_from_args(args):
+    mix = dict(DEFAULT_STATUS_MIX)
+    if args.complete_ratio is not None:
+        others = 1 - mix['COMPLETE']
+        mix = {status: (args.complete_ratio if status == 'COMPLETE' else weight / others * (1 - args.complete_ratio))
+               for status, weight in mix.items()}
+    return TransactionGenerator(users=args.users, ingress_servers=args.servers, egress_servers=args.servers,
+                                status_mix=mix, file_size_median=args.file_size_median,
+                                transit_median=args.transit_median, hours=args.hours, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='bench.sqlite3', help='SQLite database file to (re)populate')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = args.db
+    rate = populate(generator_from_args(args), args.rows,
+                    progress=lambda done, total: print(f"\r{done}/{total} rows", end='', flush=True))
+    print(f"\nInserted {args.rows} rows into {args.db} ({rate:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
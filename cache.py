@@ -0,0 +1,222 @@
+"""Short-TTL response cache with single-flight coalescing and pluggable backends."""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # the shared backend is optional
+    redis = None
+
+
+class MemoryCacheBackend:
+    """Per-process LRU dict of (expires_at, value), bounded to `max_entries`."""
+    name = 'memory'
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Cache shared by every worker process, stored in Redis with server-side expiry.
+
+    Also provides a short-lived lock per key so that concurrent misses in
+    different processes compute the value once.
+    """
+    name = 'redis'
+    shared = True
+
+    def __init__(self, url=None, prefix='dashboard:cache:'):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url or os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        self.prefix = prefix
+        self.evictions = 0  # Redis evicts on its own (maxmemory-policy)
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return False, None
+        return True, pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), px=max(1, int(ttl * 1000)))
+
+    def try_lock(self, key, timeout):
+        return bool(self.client.set(self.prefix + 'lock:' + key, b'1', nx=True, px=max(1, int(timeout * 1000))))
+
+    def unlock(self, key):
+        self.client.delete(self.prefix + 'lock:' + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def size(self):
+        return None
+
+
+CACHE_BACKENDS = {
+    'memory': MemoryCacheBackend,
+    'redis': RedisCacheBackend,
+}
+
+
+class _Flight:
+    """One in-progress computation that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, backend, enabled=True, lock_timeout=5.0):
+        self.backend = backend
+        self.enabled = enabled
+        self.lock_timeout = lock_timeout  # longest a shared-backend waiter defers to another process
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'backend_errors': 0}
+
+    @staticmethod
+    def key(endpoint, **params):
+        """Stable cache key for an endpoint and its (normalised) parameters."""
+        return endpoint + '?' + '&'.join(f"{name}={params[name]}" for name in sorted(params))
+
+    def get_or_compute(self, key, compute, ttl):
+        """Return the cached value for key, or compute it once however many callers miss together.
+
+        Cached values are shared between callers and must be treated as read-only.
+        """
+        if not self.enabled or ttl <= 0:
+            return compute()
+        found, value = self._get(key)
+        if found:
+            self._count('hits')
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            self._count('coalesced')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self._count('misses')
+            flight.value = self._compute_shared(key, compute, ttl)
+            return flight.value
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _compute_shared(self, key, compute, ttl):
+        """Compute and store; with a shared backend, defer to a process already computing it."""
+        locked = False
+        if self.backend.shared:
+            locked = self._try_lock(key)
+            deadline = time.monotonic() + self.lock_timeout
+            while not locked and time.monotonic() < deadline:
+                time.sleep(0.02)
+                found, value = self._get(key)
+                if found:
+                    return value
+                locked = self._try_lock(key)
+        try:
+            value = compute()
+            self._set(key, value, ttl)
+            return value
+        finally:
+            if locked:
+                self._backend_call(self.backend.unlock, key)
+
+    def _try_lock(self, key):
+        return bool(self._backend_call(self.backend.try_lock, key, self.lock_timeout))
+
+    # A shared backend being down degrades to computing every time, never to failing the request
+    def _get(self, key):
+        return self._backend_call(self.backend.get, key) or (False, None)
+
+    def _set(self, key, value, ttl):
+        self._backend_call(self.backend.set, key, value, ttl)
+
+    def _backend_call(self, method, *args):
+        try:
+            return method(*args)
+        except Exception as err:
+            self._count('backend_errors')
+            print(f"Response cache backend error: {err}")
+            return None
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self):
+        self._backend_call(self.backend.clear)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'backend': self.backend.name,
+            'enabled': self.enabled,
+            'entries': self.backend.size(),
+            'evictions': self.backend.evictions,
+        })
+        return stats
+
+
+def create_cache_from_env():
+    """Build the process-wide response cache from RESPONSE_CACHE* environment variables."""
+    backend_name = os.getenv('RESPONSE_CACHE_BACKEND', 'memory').lower()
+    if backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024)))
+    else:
+        backend = CACHE_BACKENDS[backend_name]()
+    return ResponseCache(backend, enabled=os.getenv('RESPONSE_CACHE', '1') != '0')
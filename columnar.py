@@ -0,0 +1,135 @@
+"""Columnar, array-backed transaction batches.
+
+A TransactionBatch stores each column as a compact array (epoch floats,
+int64 sizes, small-int status codes, interned username/server codes) instead
+of one dict per row. The stats accumulators consume batches directly, using
+NumPy vectorized reductions when it is installed, and dict rows are only
+materialised for the rows that are actually iterated/rendered.
+"""
+import math
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback; arrays are still compact
+    np = None
+
+STATUSES = ('BAD_REQUEST', 'SUBMITTED', 'COMPLETE', 'TIMEOUT', 'EP_UNAVAILABLE', 'CD_UNAVAILABLE')
+
+# Column order expected by TransactionBatch.append() / from_rows()
+COLUMNS = ('transaction_id', 'username', 'file_name', 'file_size', 'ingress_server',
+           'ingress_time', 'egress_server', 'egress_time', 'status')
+
+NULL = -1  # code for a NULL string column
+
+
+class StringPool:
+    """Interns repeated strings (usernames, servers, statuses) as small integer codes."""
+
+    def __init__(self, initial=()):
+        self.values = []
+        self._codes = {}
+        for value in initial:
+            self.code(value)
+
+    def code(self, value):
+        if value is None:
+            return NULL
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        """Code for value, or None if it has never been seen."""
+        return self._codes.get(value)
+
+    def value(self, code):
+        return None if code == NULL else self.values[code]
+
+
+class TransactionBatch:
+    def __init__(self):
+        self.transaction_id = []
+        self.file_name = []
+        self.file_size = array('q')
+        self.ingress_epoch = array('d')
+        self.egress_epoch = array('d')      # NaN when egress_time is NULL
+        self.transit_seconds = array('d')   # NaN when egress_time is NULL
+        self.status = array('b')
+        self.username = array('i')
+        self.ingress_server = array('i')
+        self.egress_server = array('i')
+        self.statuses = StringPool(STATUSES)
+        self.usernames = StringPool()
+        self.servers = StringPool()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a batch from tuples in COLUMNS order."""
+        batch = cls()
+        for row in rows:
+            batch.append(row)
+        return batch
+
+    def append(self, row):
+        transaction_id, username, file_name, file_size, ingress_server, \
+            ingress_time, egress_server, egress_time, status = row
+        ingress = ingress_time.timestamp()
+        egress = egress_time.timestamp() if egress_time else math.nan
+        self.transaction_id.append(transaction_id)
+        self.file_name.append(file_name)
+        self.file_size.append(file_size or 0)
+        self.ingress_epoch.append(ingress)
+        self.egress_epoch.append(egress)
+        # Keep the exact timedelta arithmetic db.py uses for dict rows
+        self.transit_seconds.append((egress_time - ingress_time).total_seconds() if egress_time else math.nan)
+        self.status.append(self.statuses.code(status))
+        self.username.append(self.usernames.code(username))
+        self.ingress_server.append(self.servers.code(ingress_server))
+        self.egress_server.append(self.servers.code(egress_server))
+
+    def __len__(self):
+        return len(self.file_size)
+
+    def row(self, i):
+        """Materialise row i as a dict shaped like db.py's dict rows."""
+        egress = self.egress_epoch[i]
+        transit = self.transit_seconds[i]
+        return {
+            'transaction_id': self.transaction_id[i],
+            'username': self.usernames.value(self.username[i]),
+            'file_name': self.file_name[i],
+            'file_size': self.file_size[i],
+            'ingress_server': self.servers.value(self.ingress_server[i]),
+            'ingress_time': datetime.fromtimestamp(self.ingress_epoch[i]),
+            'egress_server': self.servers.value(self.egress_server[i]),
+            'egress_time': None if math.isnan(egress) else datetime.fromtimestamp(egress),
+            'status': self.statuses.value(self.status[i]),
+            'transit_time_seconds': None if math.isnan(transit) else transit,
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, name):
+        """Column as a NumPy array (zero-copy) when available, else the raw array/list."""
+        values = getattr(self, name)
+        if np is not None and isinstance(values, array):
+            return np.frombuffer(values, dtype=values.typecode)
+        return values
+
+    def group_indices(self, codes):
+        """Map each distinct code in `codes` (a column or any int sequence) to its row indices."""
+        if np is not None:
+            codes = np.asarray(codes)
+            order = np.argsort(codes, kind='stable')
+            values, starts = np.unique(codes[order], return_index=True)
+            return dict(zip(values.tolist(), np.split(order, starts[1:])))
+        groups = {}
+        for i, code in enumerate(codes):
+            groups.setdefault(code, []).append(i)
+        return groups
@@ -1,24 +1,59 @@
-import mysql.connector
-import os
+import json
+import threading
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from pool import DB_ERRORS, create_pool_from_env
+from columnar import TransactionBatch
+from stats import FAILURE_STATUSES, HeavyHitters
+from metrics import timed_query, timed_connect, instrument_connection
 
 load_dotenv()
 
+# Column list matching columnar.COLUMNS
+REPORT_COLUMNS = """transaction_id, username, file_name, file_size, 
+            ingress_server, ingress_time, egress_server, egress_time, status"""
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = create_pool_from_env()
+    return _pool
+
+def set_pool(pool):
+    """Swap in a different pool (e.g. one backed by SQLite for tests/benchmarks)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = pool
+
+def get_pool_stats():
+    """Connection pool counters for the status endpoint."""
+    return get_pool().stats()
+
 def get_db_connection():
+    """Check out a pooled connection; calling close() on it returns it to the pool."""
     try:
-        conn = mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME')
-        )
-        return conn
-    except mysql.connector.Error as err:
+        with timed_connect():
+            return instrument_connection(get_pool().acquire())
+    except DB_ERRORS as err:
         print(f"Error connecting to database: {err}")
         return None
 
-def get_recent_transactions(minutes_ago=None, limit=None):
+@timed_query
+def get_recent_transactions(minutes_ago=None, limit=None, username=None, status=None, before=None):
+    """Most recent transactions, newest first.
+
+    `before` is an (ingress_time, transaction_id) keyset cursor: only rows that
+    sort strictly after it in (ingress_time DESC, transaction_id DESC) order
+    are returned, so pages stay stable while new rows arrive.
+    """
     conn = get_db_connection()
     if not conn:
         return []
@@ -39,11 +74,23 @@ def get_recent_transactions(minutes_ago=None, limit=None):
         time_filter = datetime.now() - timedelta(minutes=minutes_ago)
         conditions.append("ingress_time >= %s")
         params.append(time_filter)
+
+    if username:
+        conditions.append("username = %s")
+        params.append(username)
+
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+
+    if before is not None:
+        conditions.append("(ingress_time < %s OR (ingress_time = %s AND transaction_id < %s))")
+        params.extend([before[0], before[0], before[1]])
         
     if conditions:
         query_base += " WHERE " + " AND ".join(conditions)
         
-    query_base += " ORDER BY ingress_time DESC"
+    query_base += " ORDER BY ingress_time DESC, transaction_id DESC"
     
     if limit is not None:
         query_base += " LIMIT %s"
@@ -53,21 +100,16 @@ def get_recent_transactions(minutes_ago=None, limit=None):
         cursor.execute(query_base, tuple(params))
         transactions = cursor.fetchall()
         
-        # Calculate transit_time and format times
+        # Calculate transit_time; display strings are added by app.serialize_transaction
+        # only for rows that are actually sent to the client
         for t in transactions:
             if t['egress_time'] and t['ingress_time']:
-                transit = t['egress_time'] - t['ingress_time']
-                t['transit_time_seconds'] = transit.total_seconds()
-                t['transit_time'] = f"{transit.total_seconds():.3f}s"
+                t['transit_time_seconds'] = (t['egress_time'] - t['ingress_time']).total_seconds()
             else:
                 t['transit_time_seconds'] = None
-                t['transit_time'] = "N/A"
-            
-            t['ingress_time_str'] = t['ingress_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if t['ingress_time'] else "N/A"
-            t['egress_time_str'] = t['egress_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if t['egress_time'] else "N/A"
             
         return transactions
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error fetching recent transactions: {err}")
         return []
     finally:
@@ -75,53 +117,671 @@ def get_recent_transactions(minutes_ago=None, limit=None):
             cursor.close()
             conn.close()
 
-def get_transactions_for_report(start_time_dt, end_time_dt, username=None):
+@timed_query
+def get_transactions_changed_since(ingress_since, egress_since, limit, horizon_minutes=10):
+    """Rows ingested at/after ingress_since, or completed (egress_time) at/after egress_since.
+
+    The table has no updated_at column, so an egress_time newer than the
+    client's watermark is how an update is detected. That check is limited to
+    rows ingested within the last `horizon_minutes` so it stays on
+    idx_ingress_time. Boundary rows are returned again; clients dedupe by
+    transaction_id.
+    """
     conn = get_db_connection()
     if not conn:
         return []
 
     cursor = conn.cursor(dictionary=True)
+    horizon = min(ingress_since, datetime.now() - timedelta(minutes=horizon_minutes))
     try:
-        params = [start_time_dt, end_time_dt]
-        query = """
-            SELECT 
-                transaction_id, username, file_name, file_size, 
-                ingress_server, ingress_time, egress_server, egress_time, status
-            FROM transactions 
-            WHERE ingress_time >= %s AND ingress_time <= %s
+        cursor.execute(f"""
+            SELECT {REPORT_COLUMNS}
+            FROM transactions
+            WHERE ingress_time >= %s
+               OR (ingress_time >= %s AND egress_time >= %s)
+            ORDER BY ingress_time DESC, transaction_id DESC
+            LIMIT %s
+        """, (ingress_since, horizon, egress_since, limit))
+        transactions = cursor.fetchall()
+        for t in transactions:
+            if t['egress_time'] and t['ingress_time']:
+                t['transit_time_seconds'] = (t['egress_time'] - t['ingress_time']).total_seconds()
+            else:
+                t['transit_time_seconds'] = None
+        return transactions
+    except DB_ERRORS as err:
+        print(f"Error fetching changed transactions: {err}")
+        return []
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def _fetch_batch(cursor, batch_size=5000):
+    """Drain a tuple cursor (REPORT_COLUMNS order) into a columnar TransactionBatch."""
+    batch = TransactionBatch()
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return batch
+        for row in rows:
+            batch.append(row)
+
+@timed_query
+def get_transactions_ingested_since(since_dt):
+    """Fetch rows ingested at or after since_dt as a TransactionBatch for the stats engine."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {REPORT_COLUMNS}
+            FROM transactions
+            WHERE ingress_time >= %s
+        """, (since_dt,))
+        return _fetch_batch(cursor)
+    except DB_ERRORS as err:
+        print(f"Error fetching transactions for stats engine: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_transactions_between(start_dt, end_dt, username=None, inclusive_end=False):
+    """Fetch rows with start_dt <= ingress_time < end_dt (<= if inclusive_end) as a TransactionBatch, or None on error."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        query = f"""
+            SELECT {REPORT_COLUMNS}
+            FROM transactions
+            WHERE ingress_time >= %s AND ingress_time {'<=' if inclusive_end else '<'} %s
         """
-        if username and username.lower() != 'all':
+        params = [start_dt, end_dt]
+        if username:
             query += " AND username = %s"
             params.append(username)
-        
+        cursor.execute(query, tuple(params))
+        return _fetch_batch(cursor)
+    except DB_ERRORS as err:
+        print(f"Error fetching transactions for range: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_earliest_ingress_time():
+    """Oldest ingress_time in the table (None if empty or on error)."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT ingress_time FROM transactions ORDER BY ingress_time LIMIT 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except DB_ERRORS as err:
+        print(f"Error fetching earliest ingress time: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_rollup_watermark():
+    """Start of the first minute bucket not yet rolled up (None if rollups have never run)."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM rollup_state WHERE name = 'minute_watermark'")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except DB_ERRORS as err:
+        print(f"Error fetching rollup watermark: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def set_rollup_watermark(watermark):
+    """Record that every minute and hour bucket before `watermark` is rolled up; returns True on success."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("REPLACE INTO rollup_state (name, value) VALUES ('minute_watermark', %s)", (watermark,))
+        conn.commit()
+        return True
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error saving rollup watermark: {err}")
+        return False
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def save_rollups(bucket_seconds, start_dt, end_dt, rows, watermark=None):
+    """Replace the rollups of one bucket size in [start_dt, end_dt) and optionally advance the watermark.
+
+    rows are (bucket_start, dimension, dimension_value, summary_state) tuples.
+    Returns True on success.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM transaction_rollups
+            WHERE bucket_seconds = %s AND bucket_start >= %s AND bucket_start < %s
+        """, (bucket_seconds, start_dt, end_dt))
+        if rows:
+            cursor.executemany("""
+                INSERT INTO transaction_rollups
+                    (bucket_seconds, bucket_start, dimension, dimension_value,
+                     transaction_count, total_bytes, summary)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, [(bucket_seconds, bucket_start, dimension, value if value is not None else '',
+                   state['total_transactions'], state['total_bytes'], json.dumps(state))
+                  for bucket_start, dimension, value, state in rows])
+        if watermark is not None:
+            cursor.execute("REPLACE INTO rollup_state (name, value) VALUES ('minute_watermark', %s)", (watermark,))
+        conn.commit()
+        return True
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error saving rollups: {err}")
+        return False
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+# Rows per multi-row INSERT statement (x9 placeholders stays under SQLite's variable limit)
+UPSERT_ROWS_PER_STATEMENT = 500
+
+@timed_query
+def upsert_transactions(records):
+    """Write coalesced transaction records with multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+
+    Full records (with every ingress column) insert or overwrite the row but
+    never clear an egress_time/egress_server already stored or move a
+    finished status back to SUBMITTED. Partial records (egress and/or status
+    only) update just those columns of an existing row. A partial record whose
+    row doesn't exist yet (the egress event beat its ingress event) is not
+    written; it is returned so the caller can hold it until the ingress event
+    arrives. Returns the list of such records ([] when everything was
+    written), or None on error.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    backend = get_pool().backend
+    new = backend.inserted_value_sql
+    keep_egress = [f"{column} = COALESCE({new(column)}, {column})" for column in ('egress_server', 'egress_time')]
+    keep_finished_status = f"status = CASE WHEN {new('status')} = 'SUBMITTED' THEN status ELSE {new('status')} END"
+    statements = {
+        'full': ", ".join([f"{column} = {new(column)}"
+                           for column in ('username', 'file_name', 'file_size', 'ingress_server', 'ingress_time')] +
+                          keep_egress + [keep_finished_status]),
+        'partial': ", ".join(keep_egress + [keep_finished_status]),
+    }
+    full = [r for r in records if r.get('ingress_time') is not None]
+    partial = [r for r in records if r.get('ingress_time') is None]
+
+    cursor = conn.cursor()
+    try:
+        # Lock the rows partial records update, so a purge can't delete one between
+        # this check and the upsert (which would then insert it as a blank row)
+        existing = set()
+        for i in range(0, len(partial), UPSERT_ROWS_PER_STATEMENT):
+            ids = [r['transaction_id'] for r in partial[i:i + UPSERT_ROWS_PER_STATEMENT]]
+            cursor.execute(f"""
+                SELECT transaction_id FROM transactions
+                WHERE transaction_id IN ({', '.join(['%s'] * len(ids))}) {backend.lock_rows_sql()}
+            """, tuple(ids))
+            existing.update(row[0] for row in cursor.fetchall())
+        unmatched = [r for r in partial if r['transaction_id'] not in existing]
+
+        groups = {
+            'full': [(r['transaction_id'], r['username'], r['file_name'], r['file_size'],
+                      r['ingress_server'], r['ingress_time'], r.get('egress_server'),
+                      r.get('egress_time'), r.get('status') or 'SUBMITTED') for r in full],
+            # The ingress columns are never used: these rows exist, so only the update runs
+            'partial': [(r['transaction_id'], '', '', 0, '', r.get('egress_time') or datetime.now(),
+                         r.get('egress_server'), r.get('egress_time'), r.get('status') or 'SUBMITTED')
+                        for r in partial if r['transaction_id'] in existing],
+        }
+        for kind, rows in groups.items():
+            for i in range(0, len(rows), UPSERT_ROWS_PER_STATEMENT):
+                chunk = rows[i:i + UPSERT_ROWS_PER_STATEMENT]
+                values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+                cursor.execute(f"""
+                    INSERT INTO transactions ({REPORT_COLUMNS})
+                    VALUES {values}
+                    {backend.upsert_sql('transaction_id')} {statements[kind]}
+                """, tuple(value for row in chunk for value in row))
+        conn.commit()
+        return unmatched
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error writing ingested transactions: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_rollups(bucket_seconds, start_dt, end_dt, dimension='username', value=None):
+    """Rollup rows of one bucket size with start_dt <= bucket_start < end_dt, or None on error.
+
+    Each row is a dict with bucket_start, dimension_value (None for NULL) and the summary state.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        query = """
+            SELECT bucket_start, dimension_value, summary
+            FROM transaction_rollups
+            WHERE bucket_seconds = %s AND bucket_start >= %s AND bucket_start < %s AND dimension = %s
+        """
+        params = [bucket_seconds, start_dt, end_dt, dimension]
+        if value is not None:
+            query += " AND dimension_value = %s"
+            params.append(value)
+        cursor.execute(query, tuple(params))
+        return [{
+            'bucket_start': row['bucket_start'],
+            'dimension_value': row['dimension_value'] or None,
+            'summary': json.loads(row['summary']),
+        } for row in cursor.fetchall()]
+    except DB_ERRORS as err:
+        print(f"Error fetching rollups: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def prune_rollups(bucket_seconds, before_dt):
+    """Delete rollups of one bucket size older than before_dt. Returns the number removed."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM transaction_rollups WHERE bucket_seconds = %s AND bucket_start < %s",
+                       (bucket_seconds, before_dt))
+        conn.commit()
+        return cursor.rowcount
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error pruning rollups: {err}")
+        return 0
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_dashboard_aggregates(minutes_ago):
+    """Compute dashboard aggregates in SQL so only a handful of rows cross the wire.
+
+    Returns a dict in the same shape as app.aggregate_dashboard_transactions(),
+    or None if the query fails (callers fall back to the row-based path).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    time_filter = datetime.now() - timedelta(minutes=minutes_ago)
+    transit = get_pool().backend.transit_seconds_sql()
+    # Rows that contribute to the transit/data-rate figures on the dashboard
+    timed = f"status IN ('COMPLETE', 'EP_UNAVAILABLE') AND file_size > 0 AND egress_time IS NOT NULL AND {transit} > 0"
+    try:
+        cursor.execute(f"""
+            SELECT
+                status,
+                COUNT(*) AS tx_count,
+                SUM(CASE WHEN file_size > 0 THEN file_size ELSE 0 END) AS bytes,
+                SUM(CASE WHEN file_size > 0 AND egress_time IS NOT NULL THEN file_size ELSE 0 END) AS egress_bytes,
+                COUNT(CASE WHEN {timed} THEN 1 END) AS transit_count,
+                SUM(CASE WHEN {timed} THEN {transit} END) AS transit_sum,
+                MAX(CASE WHEN {timed} THEN {transit} END) AS transit_max,
+                SUM(CASE WHEN {timed} THEN file_size END) AS transit_bytes
+            FROM transactions
+            WHERE ingress_time >= %s
+            GROUP BY status
+        """, (time_filter,))
+        aggregates = {
+            'status_counts': {}, 'complete_bytes': 0, 'egress_bytes': 0,
+            'transit_count': 0, 'transit_sum': 0.0, 'transit_max': 0.0, 'transit_bytes': 0,
+            'p95_transit': 0.0, 'p99_transit': 0.0, 'active_users': 0
+        }
+        for row in cursor.fetchall():
+            aggregates['status_counts'][row['status']] = int(row['tx_count'])
+            if row['status'] == 'COMPLETE':
+                aggregates['complete_bytes'] += int(row['bytes'] or 0)
+            if row['status'] in ('COMPLETE', 'EP_UNAVAILABLE'):
+                aggregates['egress_bytes'] += int(row['egress_bytes'] or 0)
+            aggregates['transit_count'] += int(row['transit_count'] or 0)
+            aggregates['transit_sum'] += float(row['transit_sum'] or 0)
+            aggregates['transit_max'] = max(aggregates['transit_max'], float(row['transit_max'] or 0))
+            aggregates['transit_bytes'] += int(row['transit_bytes'] or 0)
+
+        cursor.execute("""
+            SELECT COUNT(DISTINCT username) AS active_users
+            FROM transactions
+            WHERE ingress_time >= %s AND username <> ''
+        """, (time_filter,))
+        aggregates['active_users'] = int(cursor.fetchone()['active_users'] or 0)
+
+        # Exact interpolated percentiles: rank the transit times with a window
+        # function and fetch only the (at most four) neighbouring ranks we need.
+        n = aggregates['transit_count']
+        if n:
+            positions = {p: (n - 1) * p / 100 for p in (95, 99)}
+            ranks = sorted({int(pos) for pos in positions.values()} |
+                           {min(int(pos) + 1, n - 1) for pos in positions.values()})
+            cursor.execute(f"""
+                SELECT rn, d FROM (
+                    SELECT {transit} AS d, ROW_NUMBER() OVER (ORDER BY {transit}) - 1 AS rn
+                    FROM transactions
+                    WHERE ingress_time >= %s AND {timed}
+                ) ranked
+                WHERE rn IN ({', '.join(['%s'] * len(ranks))})
+            """, (time_filter, *ranks))
+            values = {int(row['rn']): float(row['d']) for row in cursor.fetchall()}
+            for p, pos in positions.items():
+                # Rows ingested between the two queries can shift ranks; degrade gracefully
+                lower = values.get(int(pos), aggregates['transit_max'])
+                upper = values.get(min(int(pos) + 1, n - 1), lower)
+                aggregates[f'p{p}_transit'] = lower + (upper - lower) * (pos - int(pos))
+
+        return aggregates
+    except DB_ERRORS as err:
+        print(f"Error computing dashboard aggregates: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+# Transit-time percentiles reported per time-series bucket
+TIMESERIES_PERCENTILES = (50, 95, 99)
+
+@timed_query
+def get_timeseries_aggregates(start_dt, end_dt, bucket_seconds):
+    """Per-bucket dashboard aggregates for ingress_time in [start_dt, end_dt), computed in SQL.
+
+    Returns {bucket_index: {'status_counts', 'complete_bytes', 'egress_bytes',
+    'transit_count', 'transit_sum', 'transit_max', 'p50_transit', ...}} where
+    bucket i starts at start_dt + i * bucket_seconds, or None if the query
+    fails. Percentiles are exact and interpolated, as in get_dashboard_aggregates().
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    backend = get_pool().backend
+    transit = backend.transit_seconds_sql()
+    bucket = backend.bucket_index_sql('ingress_time', bucket_seconds)
+    timed = f"status IN ('COMPLETE', 'EP_UNAVAILABLE') AND file_size > 0 AND egress_time IS NOT NULL AND {transit} > 0"
+    params = (start_dt, start_dt, end_dt)
+    try:
+        cursor.execute(f"""
+            SELECT
+                {bucket} AS b,
+                status,
+                COUNT(*) AS tx_count,
+                SUM(CASE WHEN file_size > 0 THEN file_size ELSE 0 END) AS bytes,
+                SUM(CASE WHEN file_size > 0 AND egress_time IS NOT NULL THEN file_size ELSE 0 END) AS egress_bytes,
+                COUNT(CASE WHEN {timed} THEN 1 END) AS transit_count,
+                SUM(CASE WHEN {timed} THEN {transit} END) AS transit_sum,
+                MAX(CASE WHEN {timed} THEN {transit} END) AS transit_max
+            FROM transactions
+            WHERE ingress_time >= %s AND ingress_time < %s
+            GROUP BY b, status
+        """, params)
+        buckets = {}
+        for row in cursor.fetchall():
+            aggregates = buckets.setdefault(int(row['b']), {
+                'status_counts': {}, 'complete_bytes': 0, 'egress_bytes': 0,
+                'transit_count': 0, 'transit_sum': 0.0, 'transit_max': 0.0,
+                **{f'p{p}_transit': None for p in TIMESERIES_PERCENTILES}
+            })
+            aggregates['status_counts'][row['status']] = int(row['tx_count'])
+            if row['status'] == 'COMPLETE':
+                aggregates['complete_bytes'] += int(row['bytes'] or 0)
+            if row['status'] in ('COMPLETE', 'EP_UNAVAILABLE'):
+                aggregates['egress_bytes'] += int(row['egress_bytes'] or 0)
+            aggregates['transit_count'] += int(row['transit_count'] or 0)
+            aggregates['transit_sum'] += float(row['transit_sum'] or 0)
+            aggregates['transit_max'] = max(aggregates['transit_max'], float(row['transit_max'] or 0))
+
+        # Rank transit times within each bucket and keep only the ranks either
+        # side of each percentile position (n - 1) * p / 100
+        near_positions = ' OR '.join(f"(rn > n1 * {p / 100} - 1 AND rn < n1 * {p / 100} + 1)"
+                                     for p in TIMESERIES_PERCENTILES)
+        cursor.execute(f"""
+            SELECT b, rn, d FROM (
+                SELECT b, d,
+                       ROW_NUMBER() OVER (PARTITION BY b ORDER BY d) - 1 AS rn,
+                       COUNT(*) OVER (PARTITION BY b) - 1 AS n1
+                FROM (
+                    SELECT {bucket} AS b, {transit} AS d
+                    FROM transactions
+                    WHERE ingress_time >= %s AND ingress_time < %s AND {timed}
+                ) timed_rows
+            ) ranked
+            WHERE {near_positions}
+        """, params)
+        ranked = {}
+        for row in cursor.fetchall():
+            ranked.setdefault(int(row['b']), {})[int(row['rn'])] = float(row['d'])
+        for index, values in ranked.items():
+            aggregates = buckets.get(index)
+            if aggregates is None or not aggregates['transit_count']:
+                continue
+            for p in TIMESERIES_PERCENTILES:
+                pos = (aggregates['transit_count'] - 1) * p / 100
+                # Rows ingested between the two queries can shift ranks; degrade gracefully
+                lower = values.get(int(pos), aggregates['transit_max'])
+                upper = values.get(int(pos) + 1, lower)
+                aggregates[f'p{p}_transit'] = lower + (upper - lower) * (pos - int(pos))
+        return buckets
+    except DB_ERRORS as err:
+        print(f"Error computing time-series aggregates: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+# SQL total behind each HeavyHitters metric
+_FAILED_SQL = ', '.join(f"'{status}'" for status in FAILURE_STATUSES)
+TOP_METRICS_SQL = {
+    'transactions': "COUNT(*)",
+    'bytes': "SUM(file_size)",
+    'failures': f"SUM(CASE WHEN status IN ({_FAILED_SQL}) THEN 1 ELSE 0 END)",
+}
+
+@timed_query
+def get_top_values(start_dt, dimension, metric, limit=10):
+    """The `limit` largest `metric` totals per `dimension` value for ingress_time >= start_dt.
+
+    Returns [(value, total)] largest first, or None if the query fails.
+    """
+    if dimension not in HeavyHitters.DIMENSIONS or metric not in TOP_METRICS_SQL:
+        raise ValueError(f"Unsupported top-N dimension/metric: {dimension}/{metric}")
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {dimension}, {TOP_METRICS_SQL[metric]} AS total
+            FROM transactions
+            WHERE ingress_time >= %s AND {dimension} IS NOT NULL
+            GROUP BY {dimension}
+            HAVING {TOP_METRICS_SQL[metric]} > 0
+            ORDER BY total DESC
+            LIMIT %s
+        """, (start_dt, int(limit)))
+        return [(value, int(total)) for value, total in cursor.fetchall()]
+    except DB_ERRORS as err:
+        print(f"Error fetching top {dimension} by {metric}: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def _report_query(start_time_dt, end_time_dt, username=None, columns=REPORT_COLUMNS):
+    """Build the report SELECT (query, params) for a date range and optional username."""
+    params = [start_time_dt, end_time_dt]
+    query = f"""
+        SELECT 
+            {columns}
+        FROM transactions 
+        WHERE ingress_time >= %s AND ingress_time <= %s
+    """
+    if username and username.lower() != 'all':
+        query += " AND username = %s"
+        params.append(username)
+    return query, params
+
+@timed_query
+def get_transactions_for_report(start_time_dt, end_time_dt, username=None, columnar=False):
+    """Fetch report rows as dicts, or as a TransactionBatch when columnar=True."""
+    conn = get_db_connection()
+    if not conn:
+        return TransactionBatch() if columnar else []
+
+    cursor = conn.cursor(dictionary=not columnar)
+    try:
+        query, params = _report_query(start_time_dt, end_time_dt, username)
         query += " ORDER BY ingress_time DESC"
         
         cursor.execute(query, tuple(params))
+        if columnar:
+            return _fetch_batch(cursor)
         transactions = cursor.fetchall()
         
-        # Add transit_time and string formatted times for consistency if needed elsewhere
-        # but for raw data for reports, original datetime objects might be preferable for calculations.
+        # Add transit_time; raw datetime objects are kept for calculations
         for t in transactions:
             if t['egress_time'] and t['ingress_time']:
-                transit = t['egress_time'] - t['ingress_time']
-                t['transit_time_seconds'] = transit.total_seconds() # Keep as float for calculations
-                t['transit_time_str'] = f"{t['transit_time_seconds']:.3f}s"
+                t['transit_time_seconds'] = (t['egress_time'] - t['ingress_time']).total_seconds() # Keep as float for calculations
             else:
                 t['transit_time_seconds'] = None
-                t['transit_time_str'] = "N/A"
-            
-            t['ingress_time_str'] = t['ingress_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if t['ingress_time'] else "N/A"
-            t['egress_time_str'] = t['egress_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if t['egress_time'] else "N/A"
 
         return transactions
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error fetching transactions for report: {err}")
-        return []
+        return TransactionBatch() if columnar else []
     finally:
         if conn.is_connected():
             cursor.close()
             conn.close()
 
+@timed_query
+def report_has_transactions(start_time_dt, end_time_dt, username=None):
+    """Cheap existence check so streamed reports can redirect before sending headers."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        query, params = _report_query(start_time_dt, end_time_dt, username, columns="1")
+        cursor.execute(query + " LIMIT 1", tuple(params))
+        return cursor.fetchone() is not None
+    except DB_ERRORS as err:
+        print(f"Error checking report transactions: {err}")
+        return False
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def iter_transactions_for_report(start_time_dt, end_time_dt, username=None, batch_size=5000, raise_errors=True):
+    """Yield report rows in batches via fetchmany(), holding one pooled connection.
+
+    The cursor is unbuffered, so rows stream from the server as batches are
+    consumed and memory stays bounded by batch_size regardless of the range.
+    Errors are raised, so a streamed download aborts instead of ending as a
+    silently truncated file; with raise_errors=False they just end the stream.
+    """
+    conn = get_db_connection()
+    if not conn:
+        if raise_errors:
+            raise ConnectionError("Database connection failed.")
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    exhausted = False
+    try:
+        query, params = _report_query(start_time_dt, end_time_dt, username)
+        query += " ORDER BY ingress_time DESC"
+        cursor.execute(query, tuple(params))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                exhausted = True
+                break
+            for t in batch:
+                if t['egress_time'] and t['ingress_time']:
+                    t['transit_time_seconds'] = (t['egress_time'] - t['ingress_time']).total_seconds()
+                else:
+                    t['transit_time_seconds'] = None
+            yield batch
+    except DB_ERRORS as err:
+        print(f"Error streaming transactions for report: {err}")
+        if raise_errors:
+            raise
+    finally:
+        if conn.is_connected():
+            try:
+                cursor.close()
+            except DB_ERRORS:
+                pass
+            # A consumer that stopped early (e.g. client disconnect) leaves unread
+            # rows on the wire; drop that connection rather than pooling it.
+            conn.close(discard=not exhausted)
+
+@timed_query
 def get_unique_usernames():
     """Retrieve all unique usernames from the database."""
     conn = get_db_connection()
@@ -134,7 +794,7 @@ def get_unique_usernames():
         cursor.execute(query)
         usernames = [row[0] for row in cursor.fetchall()]
         return usernames
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error fetching unique usernames: {err}")
         return []
     finally:
@@ -142,21 +802,172 @@ def get_unique_usernames():
             cursor.close()
             conn.close()
 
-def clear_all_transactions():
-    """Clear all transactions from the database."""
+def _older_than(before_dt):
+    """WHERE clause and params selecting rows with ingress_time < before_dt (every row if None)."""
+    return ("WHERE ingress_time < %s", (before_dt,)) if before_dt is not None else ("", ())
+
+@timed_query
+def count_transactions_before(before_dt=None):
+    """Number of transactions with ingress_time < before_dt (all if None), or None on error."""
     conn = get_db_connection()
     if not conn:
-        return False, "Database connection failed."
-    
+        return None
+
+    cursor = conn.cursor()
+    where, params = _older_than(before_dt)
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM transactions {where}", params)
+        return int(cursor.fetchone()[0])
+    except DB_ERRORS as err:
+        print(f"Error counting transactions: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_purge_chunk(before_dt, limit, full_rows=False):
+    """The `limit` oldest transactions with ingress_time < before_dt (any age if None), or None on error.
+
+    Rows come back as REPORT_COLUMNS tuples when `full_rows` (for archiving),
+    otherwise as (transaction_id,) tuples.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    where, params = _older_than(before_dt)
+    try:
+        cursor.execute(f"""
+            SELECT {REPORT_COLUMNS if full_rows else 'transaction_id'}
+            FROM transactions
+            {where}
+            ORDER BY ingress_time, transaction_id
+            LIMIT %s
+        """, (*params, int(limit)))
+        return cursor.fetchall()
+    except DB_ERRORS as err:
+        print(f"Error fetching transactions to purge: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def delete_transactions(transaction_ids):
+    """Delete the given transactions in one short transaction; returns how many were deleted, or None on error."""
+    if not transaction_ids:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(transaction_ids))
+        cursor.execute(f"DELETE FROM transactions WHERE transaction_id IN ({placeholders})", tuple(transaction_ids))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error deleting transactions: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def get_time_partitions():
+    """[(partition, exclusive upper bound)] of the transactions table's ingress_time partitions, or None on error."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        return get_pool().backend.time_partitions(cursor, 'transactions', 'ingress_time')
+    except DB_ERRORS as err:
+        print(f"Error listing partitions: {err}")
+        return None
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def drop_time_partition(partition):
+    """Drop one transactions partition, and every row in it, at once; returns True on success."""
+    statement = get_pool().backend.drop_partition_sql('transactions', partition)
+    if statement is None:
+        print(f"Error dropping partition {partition}: the database doesn't support partitions")
+        return False
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(statement)
+        return True
+    except DB_ERRORS as err:
+        print(f"Error dropping partition {partition}: {err}")
+        return False
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def truncate_transactions(include_rollups=True):
+    """Empty the transactions table without a row-by-row DELETE; returns True on success.
+
+    With include_rollups the rollups summarising it are emptied too (skip
+    them when rollups are disabled, as their tables may not exist).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    backend = get_pool().backend
+    try:
+        cursor.execute(backend.truncate_sql('transactions'))
+        if include_rollups:
+            cursor.execute(backend.truncate_sql('transaction_rollups'))
+            cursor.execute("DELETE FROM rollup_state")
+        conn.commit()
+        return True
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error truncating transactions: {err}")
+        return False
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@timed_query
+def clear_rollups():
+    """Delete every rollup and the rollup watermark, e.g. once the rows they summarise are gone."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM transactions") # Consider TRUNCATE TABLE transactions for performance on large tables
+        cursor.execute("DELETE FROM transaction_rollups")
+        cursor.execute("DELETE FROM rollup_state")
         conn.commit()
-        return True, f"{cursor.rowcount} transactions deleted successfully."
-    except mysql.connector.Error as err:
+        return True
+    except DB_ERRORS as err:
         conn.rollback()
-        print(f"Error clearing transactions: {err}")
-        return False, f"Error clearing transactions: {err}"
+        print(f"Error clearing rollups: {err}")
+        return False
     finally:
         if conn.is_connected():
             cursor.close()
@@ -0,0 +1,259 @@
+"""Batched ingest of transaction events.
+
+Ingress/egress servers post events (JSON lines) to /api/ingest instead of
+writing rows one at a time. IngestWriter coalesces queued events per
+transaction_id, so an ingress event and the egress event that follows it
+become a single row write, and a background thread flushes the queue with
+multi-row upserts once it holds `max_batch_rows` transactions or its oldest
+event is `max_batch_seconds` old. When the database falls behind and the
+queue reaches `max_queued`, submit() blocks and then refuses new events,
+which the endpoint reports as 503 so senders back off.
+
+An egress or status event whose transaction isn't in the table yet (it beat
+its ingress event) is held back rather than written as a blank row. It is
+merged into the ingress event when that arrives, or dropped after
+`max_hold_seconds`.
+"""
+import threading
+import time
+from datetime import datetime
+
+from columnar import STATUSES
+
+INGRESS_FIELDS = ('username', 'file_name', 'file_size', 'ingress_server', 'ingress_time')
+
+
+class IngestQueueFull(Exception):
+    """Raised when events can't be queued because the writer is behind."""
+
+
+def _parse_time(value, field):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an ISO 8601 string or epoch seconds")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)  # the table stores naive local times
+    return parsed
+
+
+def parse_event(event):
+    """Validate one event dict and return its typed fields; raises ValueError.
+
+    An ingress event carries every INGRESS_FIELDS column (status defaults to
+    SUBMITTED); an egress/status update carries egress_server, egress_time
+    and/or status.
+    """
+    if not isinstance(event, dict):
+        raise ValueError("event must be a JSON object")
+    transaction_id = event.get('transaction_id')
+    if not isinstance(transaction_id, str) or not 0 < len(transaction_id) <= 36:
+        raise ValueError("transaction_id must be a string of at most 36 characters")
+    record = {'transaction_id': transaction_id}
+
+    present = [field for field in INGRESS_FIELDS if event.get(field) is not None]
+    if present and len(present) < len(INGRESS_FIELDS):
+        missing = ', '.join(field for field in INGRESS_FIELDS if field not in present)
+        raise ValueError(f"ingress event is missing {missing}")
+    if present:
+        for field in ('username', 'file_name', 'ingress_server'):
+            if not isinstance(event[field], str):
+                raise ValueError(f"{field} must be a string")
+            record[field] = event[field]
+        if isinstance(event['file_size'], bool) or not isinstance(event['file_size'], int) or event['file_size'] < 0:
+            raise ValueError("file_size must be a non-negative integer")
+        record['file_size'] = event['file_size']
+        record['ingress_time'] = _parse_time(event['ingress_time'], 'ingress_time')
+
+    if event.get('egress_server') is not None:
+        if not isinstance(event['egress_server'], str):
+            raise ValueError("egress_server must be a string")
+        record['egress_server'] = event['egress_server']
+    if event.get('egress_time') is not None:
+        record['egress_time'] = _parse_time(event['egress_time'], 'egress_time')
+    if event.get('status') is not None:
+        if event['status'] not in STATUSES:
+            raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+        record['status'] = event['status']
+
+    if len(record) == 1:
+        raise ValueError("event has no ingress, egress or status fields")
+    return record
+
+
+def merge_record(record, update):
+    """Fold a later event for the same transaction into record (in place)."""
+    for field, value in update.items():
+        # An ingress event arriving after its egress event mustn't undo the outcome
+        if field == 'status' and value == 'SUBMITTED' and record.get('status') not in (None, 'SUBMITTED'):
+            continue
+        record[field] = value
+    return record
+
+
+class IngestWriter:
+    def __init__(self, write, max_batch_rows=1000, max_batch_seconds=0.5, max_queued=50000,
+                 retry_interval=1.0, on_flush=None, max_hold_seconds=60.0):
+        # callable(records) -> the partial records it couldn't apply yet, or None on error (db.upsert_transactions)
+        self.write = write
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_seconds = max_batch_seconds
+        self.max_queued = max_queued
+        self.retry_interval = retry_interval
+        self.on_flush = on_flush  # called with the records after each successful write
+        self._pending = {}  # transaction_id -> coalesced record, in arrival order
+        self.max_hold_seconds = max_hold_seconds
+        self._held = {}  # transaction_id -> (partial record awaiting its ingress event, monotonic deadline)
+        self._oldest = None  # monotonic time the oldest pending event arrived
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {'events': 0, 'coalesced': 0, 'rejected': 0, 'rows_written': 0,
+                       'batches': 0, 'write_errors': 0, 'held_expired': 0}
+
+    def start(self):
+        """Start the flush thread (idempotent)."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, records, timeout=1.0):
+        """Queue parsed records, waiting up to `timeout` seconds for room; raises IngestQueueFull."""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            new_ids = len({r['transaction_id'] for r in records if r['transaction_id'] not in self._pending})
+            while len(self._pending) + new_ids > self.max_queued:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['rejected'] += len(records)
+                    raise IngestQueueFull(f"Ingest queue is full ({len(self._pending)} transactions pending)")
+                self._cond.wait(remaining)
+            for record in records:
+                pending = self._pending.get(record['transaction_id'])
+                if pending is None:
+                    held = self._held.pop(record['transaction_id'], None)
+                    if held is not None:
+                        # The egress/status event arrived first; let this (ingress) event complete it
+                        self._pending[record['transaction_id']] = merge_record(held[0], record)
+                        self._stats['coalesced'] += 1
+                    else:
+                        self._pending[record['transaction_id']] = dict(record)
+                else:
+                    merge_record(pending, record)
+                    self._stats['coalesced'] += 1
+            self._stats['events'] += len(records)
+            if self._oldest is None and self._pending:
+                self._oldest = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far has been written (or held); returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._oldest = 0 if self._pending else self._oldest  # flush now rather than at the time bound
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _take_batch(self):
+        """Wait for a full or old-enough batch and remove it from the queue."""
+        with self._cond:
+            while True:
+                next_expiry = self._expire_held()
+                if self._pending:
+                    age = time.monotonic() - self._oldest
+                    if len(self._pending) >= self.max_batch_rows or age >= self.max_batch_seconds:
+                        break
+                    self._cond.wait(self.max_batch_seconds - age)
+                else:
+                    self._cond.wait(next_expiry)
+            ids = list(self._pending)[:self.max_batch_rows]
+            batch = [self._pending.pop(transaction_id) for transaction_id in ids]
+            self._in_flight = len(batch)
+            self._oldest = time.monotonic() if self._pending else None
+            return batch
+
+    def _expire_held(self):
+        """Drop held records whose ingress event never came; returns seconds until the next expiry (or None)."""
+        now = time.monotonic()
+        for transaction_id, (record, deadline) in list(self._held.items()):
+            if deadline > now:
+                return deadline - now  # held in arrival order, so the rest expire later
+            del self._held[transaction_id]
+            self._stats['held_expired'] += 1
+        return None
+
+    def _hold(self, records):
+        """Keep partial records the write couldn't apply until their ingress event is submitted."""
+        deadline = time.monotonic() + self.max_hold_seconds
+        with self._cond:
+            for record in records:
+                pending = self._pending.get(record['transaction_id'])
+                if pending is not None:
+                    # The ingress event was queued while this batch was being written
+                    self._pending[record['transaction_id']] = merge_record(record, pending)
+                    continue
+                held = self._held.pop(record['transaction_id'], None)
+                self._held[record['transaction_id']] = (merge_record(held[0], record) if held else record, deadline)
+            while len(self._held) > self.max_queued:
+                del self._held[next(iter(self._held))]
+                self._stats['held_expired'] += 1
+            self._cond.notify_all()
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front of anything that arrived meanwhile."""
+        with self._cond:
+            pending = {}
+            for record in batch:
+                pending[record['transaction_id']] = record
+            for transaction_id, record in self._pending.items():
+                if transaction_id in pending:
+                    merge_record(pending[transaction_id], record)
+                else:
+                    pending[transaction_id] = record
+            self._pending = pending
+            self._oldest = time.monotonic()
+            self._in_flight = 0
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                unmatched = self.write(batch)
+            except Exception as err:
+                print(f"Error writing ingest batch: {err}")
+                unmatched = None
+            if unmatched is None:
+                with self._cond:
+                    self._stats['write_errors'] += 1
+                self._requeue(batch)
+                time.sleep(self.retry_interval)
+                continue
+            if unmatched:
+                self._hold(unmatched)
+                held_ids = {record['transaction_id'] for record in unmatched}
+                batch = [record for record in batch if record['transaction_id'] not in held_ids]
+            with self._cond:
+                self._stats['rows_written'] += len(batch)
+                self._stats['batches'] += 1
+                self._in_flight = 0
+                self._cond.notify_all()
+            if self.on_flush is not None and batch:
+                try:
+                    self.on_flush(batch)
+                except Exception as err:
+                    print(f"Error in ingest flush callback: {err}")
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending), in_flight=self._in_flight,
+                        held=len(self._held), max_queued=self.max_queued)
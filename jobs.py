@@ -0,0 +1,269 @@
+"""Background report jobs with pollable progress and on-disk results.
+
+A job is identified by a hash of its (start, end, username, format), so
+resubmitting the same report returns the existing job (queued, running or
+finished) instead of building it again. Job state is a small JSON file next
+to the artifact in `storage_dir`; any worker process sharing that directory
+can report progress and serve the download. The worker that builds a job holds
+an exclusively created `<id>.claim` file, so two workers never build the same
+report at once. From submit until the build finishes, including while the job
+waits for a free worker, it touches the claim and the job state; an unfinished
+job whose claim and state are both older than `stale_after` seconds is presumed
+dead and may be rebuilt.
+"""
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Job statuses; 'empty' means the range had no transactions
+QUEUED, RUNNING, COMPLETE, EMPTY, FAILED = 'queued', 'running', 'complete', 'empty', 'failed'
+
+
+def report_job_id(start_dt, end_dt, username, report_format):
+    key = f"{start_dt.isoformat()}|{end_dt.isoformat()}|{username or ''}|{report_format}"
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+class _Heartbeat:
+    """Keeps a claimed job's claim file and saved state fresh until it finishes."""
+
+    def __init__(self, manager, job):
+        self.manager = manager
+        self.job = job
+        self.lock = threading.Lock()  # serialises changes to job and its saves
+        self.last_saved = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"report-job-heartbeat-{job['id']}", daemon=True)
+
+    def save(self):
+        with self.lock:
+            self.last_saved = time.monotonic()
+            self.manager._save(self.job)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def _beat(self):
+        # Runs while the job is queued behind other builds too, and through a build that reports no progress
+        interval = self.manager.stale_after / 4
+        while not self._done.wait(interval):
+            try:
+                os.utime(self.manager._claim_path(self.job['id']))
+                if time.monotonic() - self.last_saved >= interval:
+                    self.save()
+            except OSError as err:
+                print(f"Error updating report job {self.job['id']}: {err}")
+
+
+class ReportJobManager:
+    def __init__(self, build, storage_dir, max_workers=2, result_ttl=3600, stale_after=600):
+        self.build = build  # callable(job, artifact_path, progress) -> True, or False if the range is empty
+        self.storage_dir = storage_dir
+        self.result_ttl = result_ttl    # seconds a finished result is reused/kept
+        self.stale_after = stale_after  # an unfinished job not updated for this long is presumed dead
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-job')
+        self._lock = threading.Lock()
+        os.makedirs(storage_dir, mode=0o700, exist_ok=True)
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.storage_dir, f"{job_id}.json")
+
+    def _claim_path(self, job_id):
+        return os.path.join(self.storage_dir, f"{job_id}.claim")
+
+    def _claim(self, job_id):
+        """Take the right to build job_id; False if a live worker (in any process) holds it."""
+        path = self._claim_path(job_id)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) <= self.stale_after:
+                        return False
+                    # Its builder died; renaming lets only one worker take it over
+                    os.rename(path, f"{path}.{os.getpid()}.stale")
+                    os.remove(f"{path}.{os.getpid()}.stale")
+                except OSError:
+                    pass  # released or taken over meanwhile; try again
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'claimed_at': time.time()}, f)
+            return True
+        return False
+
+    def _release(self, job_id):
+        """Give up our claim on job_id (not one another worker took over after ours went stale)."""
+        path = self._claim_path(job_id)
+        try:
+            with open(path) as f:
+                owner = json.load(f)
+            if owner.get('host') == socket.gethostname() and owner.get('pid') == os.getpid():
+                os.remove(path)
+        except (OSError, ValueError):
+            pass
+
+    def artifact_path(self, job):
+        return os.path.join(self.storage_dir, job['artifact'])
+
+    def get(self, job_id):
+        """Job state dict, or None if unknown or expired."""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(job):
+            return None
+        return job
+
+    def _expired(self, job):
+        now = time.time()
+        if job['status'] in (COMPLETE, EMPTY, FAILED):
+            return now - job['finished_at'] > self.result_ttl
+        if now - job['updated_at'] <= self.stale_after:
+            return False
+        # A live claim means its worker is still there, even if a state write was missed
+        try:
+            return now - os.path.getmtime(self._claim_path(job['id'])) > self.stale_after
+        except OSError:
+            return True
+
+    def _save(self, job):
+        job['updated_at'] = time.time()
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{job['id']}.", suffix='.tmp', dir=self.storage_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._meta_path(job['id']))
+
+    def submit(self, start_dt, end_dt, username, report_format, filename):
+        """Return the job for these parameters, queueing a new one unless a usable one exists."""
+        job_id = report_job_id(start_dt, end_dt, username, report_format)
+        with self._lock:
+            job = self.get(job_id)
+            if job is not None and job['status'] != FAILED:
+                return job
+            claimed = self._claim(job_id)
+            if claimed:
+                try:
+                    self.cleanup()
+                    job = self._new_job(job_id, start_dt, end_dt, username, report_format, filename)
+                except OSError:
+                    self._release(job_id)
+                    raise
+        if not claimed:
+            return self._await_claimed(job_id)
+        heartbeat = _Heartbeat(self, job)
+        heartbeat.start()
+        try:
+            self._executor.submit(self._run, job, heartbeat)
+        except RuntimeError:  # executor shut down
+            heartbeat.stop()
+            self._release(job_id)
+            raise
+        return job
+
+    def _new_job(self, job_id, start_dt, end_dt, username, report_format, filename):
+        """Save and return the queued state of a job this worker has claimed."""
+        extension = 'csv.gz' if report_format == 'csv' else report_format
+        job = {
+            'id': job_id,
+            'status': QUEUED,
+            'progress': 0.0,
+            'message': 'Queued',
+            'format': report_format,
+            'start': start_dt.isoformat(),
+            'end': end_dt.isoformat(),
+            'username': username,
+            'filename': f"{filename}.{report_format}",
+            'artifact': f"{job_id}.{extension}",
+            'created_at': time.time(),
+            'finished_at': None,
+            'error': None,
+        }
+        self._save(job)
+        return job
+
+    def _await_claimed(self, job_id, timeout=2.0):
+        """State of a job another worker just claimed, once that worker has saved it."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if (job is not None and job['status'] != FAILED) or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        if job is None:
+            raise RuntimeError(f"Report job {job_id} is claimed by another worker that hasn't saved it")
+        return job
+
+    def _run(self, job, heartbeat):
+        def progress(fraction, message=None):
+            with heartbeat.lock:
+                job['progress'] = round(min(max(fraction, 0.0), 1.0), 3)
+                if message:
+                    job['message'] = message
+            if time.monotonic() - heartbeat.last_saved >= 0.5:  # throttle state writes
+                heartbeat.save()
+
+        with heartbeat.lock:
+            job['status'], job['message'] = RUNNING, 'Starting'
+        heartbeat.save()
+        artifact_path = self.artifact_path(job)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{job['id']}.", suffix='.tmp', dir=self.storage_dir)
+        os.close(fd)
+        try:
+            found = self.build(job, tmp_path, progress)
+            if found:
+                os.replace(tmp_path, artifact_path)
+                job['status'], job['message'] = COMPLETE, 'Ready'
+            else:
+                job['status'], job['message'] = EMPTY, 'No transactions found for the selected criteria.'
+            job['progress'] = 1.0
+        except Exception as err:
+            print(f"Error building report job {job['id']}: {err}")
+            job['status'], job['message'], job['error'] = FAILED, 'Report generation failed', str(err)
+        finally:
+            heartbeat.stop()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            job['finished_at'] = time.time()
+            heartbeat.save()
+            self._release(job['id'])
+
+    def cleanup(self):
+        """Delete expired job state and artifacts, and temp files left by dead builders."""
+        for name in os.listdir(self.storage_dir):
+            if name.endswith('.tmp'):
+                path = os.path.join(self.storage_dir, name)
+                try:
+                    if time.time() - os.path.getmtime(path) > self.stale_after:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            try:
+                with open(self._meta_path(job_id)) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not self._expired(job):
+                continue
+            for path in (self.artifact_path(job), self._meta_path(job_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
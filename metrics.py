@@ -0,0 +1,368 @@
+"""Request tracing, database query timing and Prometheus-format metrics.
+
+Each request gets a RequestTrace that collects time per stage: `span()`
+blocks in app.py (stats, serialization, JSON encoding, template rendering)
+and the database phases recorded by `timed_query` functions in db.py
+(connect, execute, fetch and the row post-processing left over). The stage
+totals are sent back in a `Server-Timing` header and, together with the
+request duration per route, exported as histograms by `/metrics`.
+"""
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Trace of the request being handled (None outside requests, e.g. background threads)
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+# QueryTiming of the timed_query function currently running
+_current_query = contextvars.ContextVar('current_query', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-2] + [series[-1]]):
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {count}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Thread-safe collection of counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []  # callables returning extra exposition lines (e.g. gauges)
+
+        self.request_duration = self._add(Histogram(
+            'dashboard_http_request_duration_seconds', 'Time to build a response, by route.',
+            ('route', 'method', 'status')))
+        self.stage_duration = self._add(Histogram(
+            'dashboard_stage_duration_seconds', 'Time spent per request stage, by route.',
+            ('route', 'stage')))
+        self.query_duration = self._add(Histogram(
+            'dashboard_db_query_duration_seconds', 'Database function time by phase.',
+            ('query', 'phase')))
+        self.query_rows = self._add(Counter(
+            'dashboard_db_rows_total', 'Rows fetched by database functions.', ('query',)))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def observe(self, histogram, value, *label_values):
+        with self._lock:
+            histogram.observe(value, *label_values)
+
+    def inc(self, counter, *label_values, amount=1):
+        with self._lock:
+            counter.inc(*label_values, amount=amount)
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            lines = [line for metric in self._metrics for line in metric.render()]
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+def metric_lines(name, help_text, samples, metric_type='gauge'):
+    """Exposition lines for a collected gauge or counter from (label dict or None, value) pairs."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        names, values = zip(*labels.items()) if labels else ((), ())
+        lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+    return lines
+
+
+# METRICS=0 turns off metric collection and database query instrumentation
+registry = MetricsRegistry(enabled=os.getenv('METRICS', '1') != '0')
+
+
+class RequestTrace:
+    """Per-request stage timings."""
+
+    def __init__(self, route, method):
+        self.route, self.method = route, method
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> [seconds, calls]
+        self.queries = []  # (query name, seconds, rows)
+
+    def add(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total=None):
+        """Server-Timing header value (durations in milliseconds)."""
+        parts = [f"{stage.replace('.', '-')};dur={seconds * 1000:.2f}" for stage, (seconds, _) in self.stages.items()]
+        parts.append(f"total;dur={(total if total is not None else self.elapsed()) * 1000:.2f}")
+        return ', '.join(parts)
+
+    def summary(self):
+        return {
+            'route': self.route,
+            'method': self.method,
+            'stages': {stage: {'seconds': seconds, 'calls': calls} for stage, (seconds, calls) in self.stages.items()},
+            'queries': [{'query': name, 'seconds': seconds, 'rows': rows} for name, seconds, rows in self.queries],
+        }
+
+
+def begin_trace(route, method):
+    trace = RequestTrace(route, method)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def end_trace(trace, status):
+    """Record the request's duration and stage totals; returns the duration in seconds."""
+    duration = trace.elapsed()
+    _current_trace.set(None)
+    if registry.enabled:
+        with registry._lock:
+            registry.request_duration.observe(duration, trace.route, trace.method, str(status))
+            for stage, (seconds, _) in trace.stages.items():
+                registry.stage_duration.observe(seconds, trace.route, stage)
+    return duration
+
+
+def record_stage(stage, seconds):
+    """Add `seconds` to `stage` of the current request (or to 'background' work)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+    elif registry.enabled:
+        registry.observe(registry.stage_duration, seconds, 'background', stage)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+class QueryTiming:
+    __slots__ = ('name', 'connect', 'execute', 'fetch', 'rows')
+
+    def __init__(self, name):
+        self.name = name
+        self.connect = self.execute = self.fetch = 0.0
+        self.rows = 0
+
+
+def _record_query(timing, total):
+    process = max(total - timing.connect - timing.execute - timing.fetch, 0.0)
+    phases = (('connect', timing.connect), ('execute', timing.execute), ('fetch', timing.fetch), ('process', process))
+    trace = _current_trace.get()
+    if trace is not None:
+        for phase, seconds in phases:
+            if seconds:
+                trace.add(f"db.{phase}", seconds)
+        trace.queries.append((timing.name, total, timing.rows))
+    if registry.enabled:
+        with registry._lock:
+            for phase, seconds in phases:
+                registry.query_duration.observe(seconds, timing.name, phase)
+            registry.query_duration.observe(total, timing.name, 'total')
+            registry.query_rows.inc(timing.name, amount=timing.rows)
+
+
+def timed_query(func):
+    """Decorator for db.py functions: time connect/execute/fetch/post-processing and count rows.
+
+    Generator functions are timed across their next() calls only, so time the
+    consumer spends between batches isn't charged to the query.
+    """
+    name = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            timing = QueryTiming(name)
+            total = 0.0
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    token = _current_query.set(timing)
+                    started = time.perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        total += time.perf_counter() - started
+                        _current_query.reset(token)
+                    yield item
+            finally:
+                gen.close()
+                _record_query(timing, total)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timing = QueryTiming(name)
+        token = _current_query.set(timing)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_query.reset(token)
+            _record_query(timing, time.perf_counter() - started)
+    return wrapper
+
+
+@contextmanager
+def timed_connect():
+    """Charge a connection checkout to the running timed_query."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _current_query.get()
+        if timing is not None:
+            timing.connect += time.perf_counter() - started
+
+
+class TimedCursor:
+    """Cursor proxy adding execute/fetch time and row counts to the running timed_query."""
+
+    def __init__(self, cursor, timing):
+        self._cursor = cursor
+        self._timing = timing
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(*args, **kwargs)
+        finally:
+            self._timing.execute += time.perf_counter() - started
+
+    def executemany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(*args, **kwargs)
+        finally:
+            self._timing.execute += time.perf_counter() - started
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._timing.fetch += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None:
+            self._timing.rows += 1
+        return row
+
+    def fetchmany(self, size):
+        rows = self._timed_fetch(self._cursor.fetchmany, size)
+        self._timing.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        self._timing.rows += len(rows)
+        return rows
+
+
+class TimedConnection:
+    """Connection proxy whose cursors report to the timed_query that checked it out."""
+
+    def __init__(self, conn, timing):
+        self._conn = conn
+        self._timing = timing
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._timing)
+
+
+def instrument_connection(conn):
+    """Wrap a pooled connection for the running timed_query (returned as-is outside one)."""
+    timing = _current_query.get()
+    if conn is None or timing is None or not registry.enabled:
+        return conn
+    return TimedConnection(conn, timing)
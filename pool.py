@@ -0,0 +1,384 @@
+"""Pooled database connections with pluggable MySQL / SQLite backends."""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import mysql.connector
+except ImportError:  # SQLite-only environments (tests, benchmarks)
+    mysql = None
+
+
+class PoolError(Exception):
+    """Base class for connection pool failures."""
+
+
+class PoolTimeout(PoolError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+# Exceptions db.py treats as "database error" regardless of backend
+DB_ERRORS = (sqlite3.Error, PoolError) + ((mysql.connector.Error,) if mysql else ())
+
+
+class MySQLBackend:
+    """Opens connections to the production MySQL server."""
+    name = 'mysql'
+
+    def __init__(self, host=None, user=None, password=None, database=None):
+        self.params = {
+            'host': host or os.getenv('DB_HOST'),
+            'user': user or os.getenv('DB_USER'),
+            'password': password or os.getenv('DB_PASSWORD'),
+            'database': database or os.getenv('DB_NAME'),
+            # Pooled connections live across requests; autocommit keeps each read
+            # from pinning an old REPEATABLE READ snapshot.
+            'autocommit': True,
+        }
+
+    def connect(self):
+        if mysql is None:
+            raise PoolError("mysql-connector-python is not installed")
+        return mysql.connector.connect(**self.params)
+
+    def is_alive(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def transit_seconds_sql(self):
+        """SQL expression for egress_time - ingress_time in (fractional) seconds."""
+        return "TIMESTAMPDIFF(MICROSECOND, ingress_time, egress_time) / 1000000"
+
+    def bucket_index_sql(self, column, bucket_seconds):
+        """SQL expression for how many whole `bucket_seconds` `column` is past a %s start parameter."""
+        return f"FLOOR(TIMESTAMPDIFF(MICROSECOND, %s, {column}) / {int(bucket_seconds) * 1000000})"
+
+    def upsert_sql(self, key_column):
+        """Clause that turns an INSERT into an upsert on `key_column`; SET assignments follow."""
+        return "ON DUPLICATE KEY UPDATE"
+
+    def inserted_value_sql(self, column):
+        """The value the upsert tried to insert for `column`, inside the update assignments."""
+        return f"VALUES({column})"
+
+    def lock_rows_sql(self):
+        """Suffix for a SELECT that locks the rows it reads until the transaction ends."""
+        return "FOR UPDATE"
+
+    def truncate_sql(self, table):
+        """Statement that empties `table` without deleting row by row."""
+        return f"TRUNCATE TABLE {table}"
+
+    def time_partitions(self, cursor, table, column):
+        """[(partition, exclusive upper bound)] of a table RANGE-partitioned on `column`, oldest first.
+
+        Understands RANGE COLUMNS(column) and RANGE (TO_DAYS(column)); any other
+        partitioning (or none) returns [].
+        """
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_METHOD, PARTITION_EXPRESSION, PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table,))
+        partitions = []
+        for name, method, expression, description in cursor.fetchall():
+            expression = (expression or '').replace('`', '').lower()
+            if not (method or '').startswith('RANGE') or description in (None, 'MAXVALUE'):
+                continue
+            if expression == column:
+                bound = datetime.fromisoformat(description.strip("'"))
+            elif expression == f'to_days({column})':
+                bound = datetime.fromordinal(int(description) - 365)  # TO_DAYS counts from year 0
+            else:
+                return []
+            partitions.append((name, bound))
+        return partitions
+
+    def drop_partition_sql(self, table, partition):
+        return f"ALTER TABLE {table} DROP PARTITION {partition}"
+
+
+# SQLite stores DATETIME columns as ISO text; these keep round-trips as datetime objects
+sqlite3.register_adapter(datetime, lambda dt: dt.isoformat(' '))
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id CHAR(36) NOT NULL PRIMARY KEY,
+        username VARCHAR(50) NOT NULL,
+        file_name VARCHAR(255) NOT NULL,
+        file_size BIGINT NOT NULL,
+        ingress_server VARCHAR(100) NOT NULL,
+        ingress_time DATETIME(3) NOT NULL,
+        egress_server VARCHAR(100),
+        egress_time DATETIME(3),
+        status VARCHAR(20) NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_username ON transactions (username);
+    CREATE INDEX IF NOT EXISTS idx_status ON transactions (status);
+    CREATE INDEX IF NOT EXISTS idx_ingress_time ON transactions (ingress_time);
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        bucket_seconds INT NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        dimension VARCHAR(32) NOT NULL,
+        dimension_value VARCHAR(255) NOT NULL,
+        transaction_count INT NOT NULL,
+        total_bytes BIGINT NOT NULL,
+        summary TEXT NOT NULL,
+        PRIMARY KEY (bucket_seconds, bucket_start, dimension, dimension_value)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        value DATETIME(3)
+    );
+"""
+
+
+class _SQLiteCursor:
+    """Cursor adapter exposing the subset of the mysql.connector cursor API db.py uses."""
+
+    def __init__(self, raw, dictionary):
+        self._raw = raw
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._raw.execute(query.replace('%s', '?'), params)
+
+    def executemany(self, query, seq_of_params):
+        self._raw.executemany(query.replace('%s', '?'), seq_of_params)
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {col[0]: value for col, value in zip(self._raw.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._raw.fetchone())
+
+    def fetchmany(self, size):
+        return [self._convert(row) for row in self._raw.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._raw.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    def close(self):
+        self._raw.close()
+
+
+class _SQLiteConnection:
+    """Wraps sqlite3.Connection so it looks like a mysql.connector connection."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, dictionary=False):
+        return _SQLiteCursor(self._raw.cursor(), dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._raw.close()
+
+
+class SQLiteBackend:
+    """Local SQLite stand-in for the transactions table (tests and benchmarks)."""
+    name = 'sqlite'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('DB_SQLITE_PATH', 'dashboard.sqlite3')
+        conn = self.connect()
+        conn._raw.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+    def connect(self):
+        raw = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        return _SQLiteConnection(raw)
+
+    def is_alive(self, conn):
+        try:
+            conn._raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def transit_seconds_sql(self):
+        """SQL expression for egress_time - ingress_time in (fractional) seconds."""
+        return "((julianday(egress_time) - julianday(ingress_time)) * 86400.0)"
+
+    def bucket_index_sql(self, column, bucket_seconds):
+        """SQL expression for how many whole `bucket_seconds` `column` is past a %s start parameter."""
+        # Rounded to whole milliseconds first so julianday() float error can't cross a bucket edge
+        return (f"(CAST(ROUND((julianday({column}) - julianday(%s)) * 86400000.0) AS INTEGER)"
+                f" / {int(bucket_seconds) * 1000})")
+
+    def upsert_sql(self, key_column):
+        """Clause that turns an INSERT into an upsert on `key_column`; SET assignments follow."""
+        return f"ON CONFLICT ({key_column}) DO UPDATE SET"
+
+    def inserted_value_sql(self, column):
+        """The value the upsert tried to insert for `column`, inside the update assignments."""
+        return f"excluded.{column}"
+
+    def lock_rows_sql(self):
+        """Suffix for a SELECT that locks the rows it reads until the transaction ends."""
+        return ""  # SQLite serializes writers on the whole database
+
+    def truncate_sql(self, table):
+        """Statement that empties `table` without deleting row by row."""
+        return f"DELETE FROM {table}"  # without a WHERE clause SQLite drops the pages wholesale
+
+    def time_partitions(self, cursor, table, column):
+        """SQLite has no partitioning."""
+        return []
+
+    def drop_partition_sql(self, table, partition):
+        """SQLite tables are not partitioned; None tells callers there is nothing to run."""
+        return None
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+
+
+class PooledConnection:
+    """Proxy handed out by the pool; close() returns the connection instead of closing it."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self, discard=False):
+        if self._conn is not None:
+            self._pool.release(self._conn, discard=discard)
+            self._conn = None
+
+    def is_connected(self):
+        return self._conn is not None
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of backend connections with idle health checks."""
+
+    def __init__(self, backend, size=5, timeout=5.0, health_check_interval=30.0):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []  # (conn, last_used) pairs, most recently used last
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0, 'timeouts': 0, 'connects': 0,
+            'connect_errors': 0, 'health_check_failures': 0, 'wait_seconds': 0.0,
+        }
+
+    def acquire(self):
+        """Check out a healthy connection, blocking up to `timeout` seconds."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available within {self.timeout}s")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            conn, last_used = self._idle.pop() if self._idle else (None, None)
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds'] += time.monotonic() - started
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self.health_check_interval:
+                if not self.backend.is_alive(conn):
+                    with self._cond:
+                        self._stats['health_check_failures'] += 1
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                try:
+                    conn = self.backend.connect()
+                except Exception:
+                    with self._cond:
+                        self._stats['connect_errors'] += 1
+                    raise
+                with self._cond:
+                    self._stats['connects'] += 1
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn, discard=False):
+        """Return a raw connection to the pool (or drop it if `discard`)."""
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, backend=self.backend.name, size=self.size,
+                        in_use=self._in_use, idle=len(self._idle))
+
+    def close_all(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle.clear()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def create_pool_from_env():
+    """Build the process-wide pool from DB_BACKEND / DB_POOL_* environment variables."""
+    backend_name = os.getenv('DB_BACKEND', 'mysql').lower()
+    backend = BACKENDS[backend_name]()
+    return ConnectionPool(
+        backend,
+        size=int(os.getenv('DB_POOL_SIZE', 5)),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+    )
@@ -0,0 +1,127 @@
+"""Opt-in sampling profiler for slow requests.
+
+While enabled, a single background thread samples the Python stack of every
+thread that is currently handling a request (via sys._current_frames()) every
+`interval` seconds. When a request turns out slower than `slow_threshold`,
+its samples are written to `output_dir` in collapsed-stack format
+("frame;frame;frame count" per line), which flamegraph.pl, speedscope and
+similar tools read directly. Requests under the threshold are discarded, so
+the cost is one stack walk per sample for in-flight requests only.
+"""
+import collections
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir, interval=0.005, slow_threshold=1.0, enabled=False, max_profiles=100):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.enabled = enabled
+        self.max_profiles = max_profiles
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def set_enabled(self, enabled):
+        with self._cond:
+            self.enabled = enabled
+            if not enabled:
+                self._active.clear()
+
+    def begin(self, thread_id=None):
+        """Start sampling a thread (the calling one by default); returns False when disabled."""
+        if not self.enabled:
+            return False
+        thread_id = thread_id or threading.get_ident()
+        with self._cond:
+            self._active[thread_id] = collections.Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def end(self, thread_id=None):
+        """Stop sampling a thread and return its stack counts (None if it wasn't sampled)."""
+        with self._cond:
+            return self._active.pop(thread_id or threading.get_ident(), None)
+
+    def _run(self):
+        sampler_id = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._cond:
+                for thread_id, counter in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != sampler_id:
+                        counter[self._collapse(frame)] += 1
+            del frames
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def finish(self, label, duration, details=None, thread_id=None):
+        """End sampling; if the request was slow, write its profile and return the file path."""
+        samples = self.end(thread_id)
+        if not samples or duration < self.slow_threshold:
+            return None
+        os.makedirs(self.output_dir, mode=0o700, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'request'
+        path = os.path.join(self.output_dir,
+                            f"{datetime.now():%Y%m%d-%H%M%S-%f}-{slug}-{duration * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        if details is not None:
+            with open(path[:-len('.folded')] + '.json', 'w') as f:
+                json.dump(dict(details, duration_seconds=duration, samples=sum(samples.values()),
+                               interval_seconds=self.interval), f, indent=2)
+        self._prune()
+        return path
+
+    def _prune(self):
+        """Keep only the newest `max_profiles` profiles."""
+        try:
+            profiles = sorted(name for name in os.listdir(self.output_dir) if name.endswith('.folded'))
+        except OSError:
+            return
+        for name in profiles[:-self.max_profiles] if self.max_profiles else []:
+            for path in (name, name[:-len('.folded')] + '.json'):
+                try:
+                    os.remove(os.path.join(self.output_dir, path))
+                except OSError:
+                    pass
+
+    def recent_profiles(self, limit=20):
+        try:
+            profiles = sorted((name for name in os.listdir(self.output_dir) if name.endswith('.folded')), reverse=True)
+        except OSError:
+            return []
+        return profiles[:limit]
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'interval_seconds': self.interval,
+            'slow_threshold_seconds': self.slow_threshold,
+            'output_dir': self.output_dir,
+            'active': len(self._active),
+            'recent_profiles': self.recent_profiles(),
+        }
@@ -0,0 +1,173 @@
+"""Server-Sent Events fan-out for the dashboard and live feed.
+
+One LiveProducer thread polls the database once per tick, while anyone is
+subscribed: stats for each time window that has a subscriber, plus one feed
+delta. Each event is encoded once and the same SSE message string is queued
+to every interested subscriber, so database load does not grow with the
+number of open pages.
+"""
+import queue
+import threading
+import time
+
+
+def format_sse(event, data):
+    """Encode one SSE message; `data` must already be a JSON string."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One connected client: its stats window (None for feed only) and a bounded message queue."""
+
+    def __init__(self, time_window, max_queue=100):
+        self.time_window = time_window
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False  # set when a slow client misses events; it gets a fresh snapshot
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+class LiveProducer:
+    def __init__(self, compute_stats, fetch_latest, fetch_changed, encode,
+                 poll_interval=1.0, feed_size=200):
+        self.compute_stats = compute_stats  # callable(time_window) -> JSON-able stats payload
+        self.fetch_latest = fetch_latest    # callable(limit) -> newest rows
+        self.fetch_changed = fetch_changed  # callable(ingress_since, egress_since, limit) -> rows
+        self.encode = encode                # callable(obj) -> JSON string (rows serialized inside)
+        self.poll_interval = poll_interval
+        self.feed_size = feed_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._publish_lock = threading.Lock()  # orders snapshots against tick publishes
+        self._thread = None
+        self._last_stats = {}   # time_window -> stats payload last published
+        self._feed = {}         # transaction_id -> row, newest feed_size rows
+        self._feed_order = []   # transaction ids, newest first
+        self._watermarks = None  # (max ingress_time, max egress_time) of rows in the feed
+
+    def subscribe(self, time_window):
+        """Register a subscriber; its queue starts with a snapshot of the current state."""
+        subscription = Subscription(time_window)
+        with self._publish_lock:
+            for message in self.snapshot(time_window):
+                subscription.put(message)
+            with self._lock:
+                self._subscribers.add(subscription)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='live-producer', daemon=True)
+                    self._thread.start()
+                self._wakeup.notify()
+        return subscription
+
+    def resync(self, subscription):
+        """Replace a lagging subscriber's backlog with a fresh snapshot."""
+        with self._publish_lock:
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.overflowed = False
+            for message in self.snapshot(subscription.time_window):
+                subscription.put(message)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def snapshot(self, time_window):
+        """Messages that bring a new (or lagging) subscriber up to date; call under _publish_lock."""
+        if self._watermarks is None:
+            self._poll_feed()
+        with self._lock:
+            stats = self._last_stats.get(time_window)
+            rows = [self._feed[i] for i in self._feed_order]
+        messages = []
+        if time_window is not None:
+            if stats is None:
+                stats = self._last_stats[time_window] = self.compute_stats(time_window)
+            messages.append(format_sse('stats', self.encode(stats)))
+        messages.append(format_sse('feed', self.encode({'mode': 'full', 'transactions': rows})))
+        return messages
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._subscribers:
+                    self._watermarks = None  # idle: the next subscriber starts from a fresh read
+                    self._wakeup.wait()
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as err:
+                print(f"Error in live producer tick: {err}")
+            time.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+
+    def tick(self):
+        """Poll once and publish whatever changed."""
+        with self._publish_lock:
+            self._tick()
+
+    def _tick(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        windows = {s.time_window for s in subscribers if s.time_window is not None}
+        for window in set(self._last_stats) - windows:
+            del self._last_stats[window]  # nobody watching; don't serve it stale later
+
+        for window in windows:
+            stats = self.compute_stats(window)
+            if stats.get('stats') == (self._last_stats.get(window) or {}).get('stats'):
+                continue
+            self._last_stats[window] = stats
+            message = format_sse('stats', self.encode(stats))
+            for subscriber in subscribers:
+                if subscriber.time_window == window:
+                    subscriber.put(message)
+
+        changed, mode = self._poll_feed()
+        if changed:
+            message = format_sse('feed', self.encode({'mode': mode, 'transactions': changed}))
+            for subscriber in subscribers:
+                subscriber.put(message)
+
+    def _poll_feed(self):
+        """Update the shared feed; return (rows new or changed since last tick, mode)."""
+        if self._watermarks is None:
+            rows = self.fetch_latest(self.feed_size)
+            mode = 'full'
+        else:
+            ingress_wm, egress_wm = self._watermarks
+            rows = self.fetch_changed(ingress_wm, egress_wm or ingress_wm, self.feed_size)
+            mode = 'delta'
+            if len(rows) >= self.feed_size:
+                rows = self.fetch_latest(self.feed_size)
+                mode = 'full'
+
+        with self._lock:
+            if mode == 'full':
+                self._feed = {}
+            changed = []
+            for t in rows:
+                previous = self._feed.get(t['transaction_id'])
+                if previous is None or (previous['status'], previous['egress_time']) != (t['status'], t['egress_time']):
+                    changed.append(t)
+                self._feed[t['transaction_id']] = t
+            ordered = sorted(self._feed.values(), key=lambda t: (t['ingress_time'], t['transaction_id']), reverse=True)
+            ordered = ordered[:self.feed_size]
+            self._feed = {t['transaction_id']: t for t in ordered}
+            self._feed_order = [t['transaction_id'] for t in ordered]
+            if ordered:
+                ingress_wm = ordered[0]['ingress_time']
+                egress_times = [t['egress_time'] for t in ordered if t['egress_time']]
+                egress_wm = max(egress_times) if egress_times else None
+                if self._watermarks and self._watermarks[1] and (egress_wm is None or self._watermarks[1] > egress_wm):
+                    egress_wm = self._watermarks[1]
+                self._watermarks = (ingress_wm, egress_wm)
+        return (rows if mode == 'full' else changed), mode
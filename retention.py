@@ -0,0 +1,286 @@
+"""Chunked, throttled retention purges of the transactions table.
+
+A purge deletes the transactions older than a cutoff, or all of them for a
+clear, in bounded chunks rather than one long DELETE. Each chunk selects the
+`chunk_rows` oldest matching rows by ingress_time and deletes them by
+primary key in a short transaction of its own. The engine then pauses for
+`pause_seconds`, so dashboard queries and ingest keep running and the undo
+log stays small. Where the database allows it, whole ingress_time partitions
+older than the cutoff are dropped instead. A clear without archiving is a
+TRUNCATE.
+
+With `archive_dir` set, each chunk is first appended to a gzip-compressed
+CSV file, so every purged row is archived at least once. Progress goes to a
+JSON state file after every chunk, along with the host and pid running it. A
+purge interrupted by a restart is picked up again by start(): straight away if
+that process is gone from this host, otherwise once the state has gone
+`stale_after` seconds without an update. Because deleted rows are gone, it
+simply continues where it stopped.
+"""
+import csv
+import gzip
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from columnar import COLUMNS
+from db import (
+    count_transactions_before, get_purge_chunk, delete_transactions, get_time_partitions,
+    drop_time_partition, truncate_transactions, clear_rollups
+)
+
+# Operation statuses
+RUNNING, COMPLETE, FAILED, CANCELLED = 'running', 'complete', 'failed', 'cancelled'
+PURGE, CLEAR = 'purge', 'clear'
+
+
+class PurgeInProgress(Exception):
+    """Raised when a purge or clear is requested while another one is running."""
+
+
+class RetentionEngine:
+    def __init__(self, state_path, chunk_rows=5000, pause_seconds=0.1, archive_dir=None,
+                 retention_days=0, poll_interval=3600.0, stale_after=120.0, rollups=True):
+        self.state_path = state_path
+        self.chunk_rows = chunk_rows
+        self.pause_seconds = pause_seconds  # between chunks, so other queries get the table
+        self.archive_dir = archive_dir  # purged rows are archived here first when set
+        self.retention_days = retention_days  # > 0 purges older rows every poll_interval seconds
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after  # a running operation not updated for this long is presumed dead
+        self.rollups = rollups  # whether clears also empty the rollup tables (absent when rollups are off)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._cancel = threading.Event()
+        self._scheduler = None
+        self._stop = threading.Event()
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, state):
+        state['updated_at'] = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _running_elsewhere(self, state):
+        """True if `state` belongs to a live operation (in this process or another one sharing the file)."""
+        if self._worker is not None and self._worker.is_alive():
+            return True
+        return (state is not None and state['status'] == RUNNING and not self._owner_dead(state)
+                and time.time() - state['updated_at'] < self.stale_after)
+
+    def _owner_dead(self, state):
+        """True if the process that ran `state` was on this host and has exited (False if unsure)."""
+        if state.get('host') != socket.gethostname() or not state.get('pid'):
+            return False
+        if state['pid'] == os.getpid():
+            # Our own pid from an earlier run (e.g. pid 1 in a restarted container); the worker check covers this run
+            return True
+        try:
+            os.kill(state['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # exists but belongs to another user
+        return False
+
+    def status(self):
+        state = self._load() or {'status': None}
+        if state.get('estimated_total'):
+            state['progress'] = round(min(state['deleted'] / state['estimated_total'], 1.0), 3)
+        state['config'] = {
+            'chunk_rows': self.chunk_rows,
+            'pause_seconds': self.pause_seconds,
+            'archive_dir': self.archive_dir,
+            'retention_days': self.retention_days,
+        }
+        return state
+
+    def purge_older_than(self, cutoff, wait=None):
+        """Start purging transactions with ingress_time < cutoff; returns the operation's state.
+
+        Raises PurgeInProgress if another purge is running. With `wait`,
+        blocks up to that many seconds for it to finish.
+        """
+        return self._submit(PURGE, cutoff, wait)
+
+    def clear(self, wait=None):
+        """Start deleting every transaction (and the rollups); see purge_older_than()."""
+        return self._submit(CLEAR, None, wait)
+
+    def cancel(self):
+        """Stop the running operation after its current chunk; returns False if none is running here."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                return False
+            self._cancel.set()
+            return True
+
+    def _submit(self, operation, cutoff, wait, resume=None):
+        with self._lock:
+            if resume is None:
+                current = self._load()
+                if self._running_elsewhere(current):
+                    raise PurgeInProgress(f"A {current['operation'] if current else 'purge'} is already running")
+            state = resume or {
+                'id': f"{datetime.now():%Y%m%d-%H%M%S}",
+                'operation': operation,
+                'cutoff': cutoff.isoformat() if cutoff else None,
+                'status': RUNNING,
+                'method': None,
+                'estimated_total': None,
+                'deleted': 0,
+                'chunks': 0,
+                'partitions_dropped': [],
+                'archive': None,
+                'started_at': time.time(),
+                'finished_at': None,
+                'error': None,
+            }
+            state['status'] = RUNNING
+            state['host'], state['pid'] = socket.gethostname(), os.getpid()
+            self._save(state)
+            self._cancel.clear()
+            self._worker = threading.Thread(target=self._run, args=(state,), name='retention', daemon=True)
+            self._worker.start()
+            worker = self._worker
+        if wait:
+            worker.join(wait)
+        return self._load() or state
+
+    def _run(self, state):
+        cutoff = datetime.fromisoformat(state['cutoff']) if state['cutoff'] else None
+        archive = self.archive_dir is not None
+        try:
+            if state['estimated_total'] is None:
+                state['estimated_total'] = count_transactions_before(cutoff)
+                self._save(state)
+            if state['operation'] == CLEAR and not archive:
+                state['method'] = 'truncate'
+                if not truncate_transactions(include_rollups=self.rollups):
+                    raise RuntimeError("Truncating the transactions table failed")
+                state['deleted'] = state['estimated_total'] or 0
+            else:
+                state['method'] = 'chunked'
+                if state['operation'] == PURGE and not archive:
+                    self._drop_partitions(state, cutoff)
+                self._purge_chunks(state, cutoff, archive)
+                if state['operation'] == PURGE and archive:
+                    self._drop_partitions(state, cutoff)  # emptied by the chunks above
+                if (state['operation'] == CLEAR and self.rollups and not self._cancel.is_set()
+                        and not clear_rollups()):
+                    raise RuntimeError("Clearing the rollups failed")
+            state['status'] = CANCELLED if self._cancel.is_set() else COMPLETE
+        except Exception as err:
+            print(f"Error running retention {state['operation']}: {err}")
+            state['status'], state['error'] = FAILED, str(err)
+        finally:
+            state['finished_at'] = time.time()
+            self._save(state)
+
+    def _drop_partitions(self, state, cutoff):
+        """Drop every ingress_time partition that lies entirely before the cutoff."""
+        partitions = get_time_partitions() or []
+        # Never drop the last partition; MySQL tables must keep at least one
+        for name, upper_bound in partitions[:-1]:
+            if upper_bound > cutoff or self._cancel.is_set():
+                break
+            if not drop_time_partition(name):
+                raise RuntimeError(f"Dropping partition {name} failed")
+            state['partitions_dropped'].append(name)
+            state['method'] = 'partitions+chunked'
+            self._save(state)
+
+    def _purge_chunks(self, state, cutoff, archive):
+        while not self._cancel.is_set():
+            rows = get_purge_chunk(cutoff, self.chunk_rows, full_rows=archive)
+            if rows is None:
+                raise RuntimeError("Selecting rows to purge failed")
+            if not rows:
+                return
+            if archive:
+                self._archive(state, rows)
+            deleted = delete_transactions([row[0] for row in rows])
+            if deleted is None:
+                raise RuntimeError("Deleting a chunk failed")
+            state['deleted'] += deleted
+            state['chunks'] += 1
+            self._save(state)
+            if len(rows) < self.chunk_rows:
+                return
+            self._cancel.wait(self.pause_seconds)
+
+    def _archive(self, state, rows):
+        """Append rows to the operation's archive; each chunk is a separate gzip member, synced before deleting."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = state['archive'] or os.path.join(self.archive_dir, f"transactions-{state['operation']}-{state['id']}.csv.gz")
+        with open(path, 'ab') as raw:
+            is_new = raw.tell() == 0
+            with gzip.open(raw, 'wt', newline='') as f:
+                writer = csv.writer(f)
+                if is_new:
+                    writer.writerow(COLUMNS)
+                writer.writerows(rows)
+            raw.flush()
+            os.fsync(raw.fileno())
+        if state['archive'] is None:
+            state['archive'] = path
+
+    def start(self):
+        """Resume an interrupted operation and start the scheduled purge (idempotent)."""
+        with self._lock:
+            if self._scheduler is not None:
+                return
+            self._scheduler = threading.Thread(target=self._run_scheduler, name='retention-scheduler', daemon=True)
+            self._scheduler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._cancel.set()
+
+    def _run_scheduler(self):
+        next_purge = time.monotonic()
+        while not self._stop.is_set():
+            waiting = self._resume_interrupted()
+            if self.retention_days > 0 and time.monotonic() >= next_purge:
+                try:
+                    self.purge_older_than(datetime.now() - timedelta(days=self.retention_days))
+                except PurgeInProgress:
+                    pass
+                except Exception as err:
+                    print(f"Error starting scheduled retention purge: {err}")
+                next_purge = time.monotonic() + self.poll_interval
+            if self.retention_days > 0:
+                timeout = next_purge - time.monotonic()
+                if waiting:
+                    timeout = min(timeout, self.stale_after)
+            elif waiting:
+                timeout = self.stale_after
+            else:
+                return
+            self._stop.wait(max(timeout, 0))
+
+    def _resume_interrupted(self):
+        """Resume an operation whose process died; True if one may still need resuming later."""
+        state = self._load()
+        if state is None or state['status'] != RUNNING:
+            return False
+        if self._running_elsewhere(state):
+            # Another live process, or one that died too recently to tell; checked again once it goes stale
+            return self._worker is None or not self._worker.is_alive()
+        try:
+            self._submit(state['operation'], None, None, resume=state)
+        except Exception as err:
+            print(f"Error resuming retention {state['operation']}: {err}")
+        return False
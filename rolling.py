@@ -0,0 +1,195 @@
+"""Background-maintained rolling-window dashboard statistics.
+
+A single poller thread keeps one DashboardAccumulator per second of
+ingress_time for the retention period. Each tick it re-reads only the most
+recent `settle_seconds` of rows (so status/egress updates to in-flight
+transactions are picked up) and rebuilds those buckets, then precomputes the
+aggregates for the configured windows so every client is served the same
+shared result. With `top_capacity` set, each second also keeps HeavyHitters
+summaries, merged on demand for /api/top. Once a second has settled its
+summaries are folded into its minute's, so at most retention_minutes +
+settle_seconds summaries of `top_capacity` keys each are held.
+"""
+import threading
+import time
+from datetime import datetime
+
+from stats import DashboardAccumulator, HeavyHitters
+
+
+class RollingWindowStats:
+    def __init__(self, fetch_rows, retention_minutes=60, settle_seconds=120,
+                 poll_interval=1.0, windows=(10, 30, 60), top_capacity=0):
+        self.fetch_rows = fetch_rows  # callable(since_dt) -> TransactionBatch, or None on error
+        self.retention_seconds = retention_minutes * 60
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.windows = sorted(w for w in windows if w * 60 <= self.retention_seconds)
+        self.top_capacity = top_capacity  # keys per HeavyHitters summary; 0 disables them
+        self._buckets = {}  # epoch second -> DashboardAccumulator
+        self._hitters = {}  # epoch second -> HeavyHitters, for seconds still being re-read
+        self._minute_hitters = {}  # epoch minute start -> HeavyHitters of its settled seconds
+        self._window_aggregates = {}
+        self._last_refresh = None  # monotonic time of the last successful tick
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        """Start the poller thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='rolling-stats', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poke(self, *args):
+        """Refresh now instead of at the next poll (e.g. right after ingested rows are written)."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as err:
+                print(f"Error refreshing rolling stats: {err}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def refresh(self, now=None):
+        """Run one poll: re-read the unsettled tail, rebuild its buckets, recompute windows."""
+        now = now or datetime.now()
+        now_second = int(now.timestamp())
+        if self._last_refresh is None:
+            since_second = now_second - self.retention_seconds  # cold start: load the full retention
+        else:
+            since_second = now_second - self.settle_seconds
+        batch = self.fetch_rows(datetime.fromtimestamp(since_second))
+        if batch is None:
+            return False
+
+        fresh, fresh_hitters = {}, {}
+        seconds = [int(epoch) for epoch in batch.ingress_epoch]
+        for second, indices in batch.group_indices(seconds).items():
+            bucket = fresh[second] = DashboardAccumulator()
+            bucket.add_batch(batch, indices)
+            if self.top_capacity:
+                hitters = fresh_hitters[second] = HeavyHitters(self.top_capacity)
+                hitters.add_batch(batch, indices)
+
+        with self._lock:
+            buckets = {s: b for s, b in self._buckets.items()
+                       if now_second - self.retention_seconds <= s < since_second}
+            buckets.update(fresh)
+            self._buckets = buckets
+            hitters = {s: h for s, h in self._hitters.items()
+                       if now_second - self.retention_seconds <= s < since_second}
+            hitters.update(fresh_hitters)
+            self._hitters, self._minute_hitters = self._fold_settled(hitters, now_second)
+
+        window_aggregates = self._compute_windows(buckets, now_second)
+        with self._lock:
+            self._window_aggregates = window_aggregates
+            self._last_refresh = time.monotonic()
+        return True
+
+    def _fold_settled(self, hitters, now_second):
+        """Merge per-second summaries no later tick re-reads into per-minute ones; returns both maps."""
+        settled_before = now_second - self.settle_seconds
+        oldest_minute = now_second - self.retention_seconds - 59
+        minutes = {m: h for m, h in self._minute_hitters.items() if m >= oldest_minute}
+        unsettled, folded = {}, {}
+        for second, summary in hitters.items():
+            if second >= settled_before:
+                unsettled[second] = summary
+                continue
+            minute = second - second % 60
+            if minute not in folded:
+                # A new summary rather than merging in place: top() may be reading the old one
+                folded[minute] = HeavyHitters(self.top_capacity)
+                if minute in minutes:
+                    folded[minute].merge(minutes[minute])
+            folded[minute].merge(summary)
+        minutes.update(folded)
+        return unsettled, minutes
+
+    def _compute_windows(self, buckets, now_second):
+        """Single newest-to-oldest pass, snapshotting at each configured window edge."""
+        results = {}
+        running = DashboardAccumulator()
+        pending = list(self.windows)
+        for second in sorted(buckets, reverse=True):
+            while pending and second < now_second - pending[0] * 60:
+                results[pending.pop(0)] = running.aggregates()
+            if not pending:
+                break
+            running.merge(buckets[second])
+        for window in pending:
+            results[window] = running.aggregates()
+        return results
+
+    def is_fresh(self):
+        """True if the last successful tick is recent enough to serve from."""
+        last = self._last_refresh
+        return last is not None and time.monotonic() - last < max(5 * self.poll_interval, 5.0)
+
+    def aggregates(self, window_minutes):
+        """Aggregates for the last `window_minutes`, or None if this engine can't serve them."""
+        if not self.is_fresh() or window_minutes * 60 > self.retention_seconds:
+            return None
+        with self._lock:
+            cached = self._window_aggregates.get(window_minutes)
+            if cached is not None:
+                return cached
+            buckets = dict(self._buckets)
+        now_second = int(datetime.now().timestamp())
+        running = DashboardAccumulator()
+        for second, bucket in buckets.items():
+            if second >= now_second - window_minutes * 60:
+                running.merge(bucket)
+        return running.aggregates()
+
+    def bucketed(self, start_second, bucket_seconds):
+        """{bucket start epoch: DashboardAccumulator} merged from the per-second buckets since start_second.
+
+        start_second should be a multiple of bucket_seconds. Returns None if
+        this engine can't serve the range.
+        """
+        if not self.is_fresh() or start_second < int(datetime.now().timestamp()) - self.retention_seconds:
+            return None
+        with self._lock:
+            buckets = dict(self._buckets)
+        merged = {}
+        for second, bucket in buckets.items():
+            if second >= start_second:
+                start = second - second % bucket_seconds
+                if start in merged:
+                    merged[start].merge(bucket)
+                else:
+                    merged[start] = DashboardAccumulator().merge(bucket)
+        return merged
+
+    def top(self, window_minutes):
+        """HeavyHitters merged over the last `window_minutes`, or None if this engine can't serve them.
+
+        Settled time is summarised per minute, so the window's oldest edge is
+        rounded out to a whole minute.
+        """
+        if not self.top_capacity or not self.is_fresh() or window_minutes * 60 > self.retention_seconds:
+            return None
+        with self._lock:
+            hitters, minutes = dict(self._hitters), dict(self._minute_hitters)
+        since_second = int(datetime.now().timestamp()) - window_minutes * 60
+        merged = HeavyHitters(self.top_capacity)
+        for minute, bucket in minutes.items():
+            if minute + 60 > since_second:
+                merged.merge(bucket)
+        for second, bucket in hitters.items():
+            if second >= since_second:
+                merged.merge(bucket)
+        return merged
@@ -0,0 +1,202 @@
+"""Per-minute and per-hour report rollups.
+
+A background RollupMaintainer summarises settled transactions into the
+transaction_rollups table: one row per (bucket, dimension, value) holding a
+serialized ReportAccumulator, for the username, ingress_server and
+egress_server dimensions. Minute buckets are written as soon as they are
+older than `settle_minutes`, and each hour is rolled up from its minute rows
+once the hour is complete. Minute rows are pruned after
+`minute_retention_hours`; hour rows are kept.
+
+report() answers a report's stats from the largest rollup buckets that fit
+inside the requested range and scans raw rows only for the partial minutes at
+the edges (and anything newer than the rollup watermark).
+"""
+import threading
+from datetime import datetime, timedelta
+
+from db import (
+    get_transactions_between, get_earliest_ingress_time, get_rollup_watermark,
+    save_rollups, get_rollups, prune_rollups, set_rollup_watermark
+)
+from stats import ReportAccumulator, aggregate_report, aggregate_report_by_bucket
+
+MINUTE = 60
+HOUR = 3600
+DIMENSIONS = ('username', 'ingress_server', 'egress_server')
+
+
+def floor_time(dt, seconds):
+    """Round dt down to a multiple of `seconds` since the epoch."""
+    epoch = dt.timestamp()
+    return datetime.fromtimestamp(epoch - epoch % seconds)
+
+
+def ceil_time(dt, seconds):
+    floored = floor_time(dt, seconds)
+    return floored if floored == dt else floored + timedelta(seconds=seconds)
+
+
+class RollupMaintainer:
+    def __init__(self, settle_minutes=10, chunk_minutes=60, minute_retention_hours=48,
+                 poll_interval=30.0, min_report_minutes=60):
+        self.settle = timedelta(minutes=settle_minutes)
+        self.chunk = timedelta(minutes=chunk_minutes)
+        # Hours are built from minute rows, so keep those for at least a couple of hours
+        self.minute_retention = timedelta(hours=max(minute_retention_hours, 2))
+        self.poll_interval = poll_interval
+        self.min_report_span = timedelta(minutes=min_report_minutes)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the background job (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='report-rollups', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                minutes = self.run_once()
+            except Exception as err:
+                print(f"Error maintaining report rollups: {err}")
+                minutes = 0
+            # Keep going without pausing while catching up on a backlog
+            if minutes * MINUTE < self.chunk.total_seconds():
+                self._stop.wait(self.poll_interval)
+
+    def run_once(self, now=None):
+        """Roll up the next chunk of settled minutes; returns how many minutes were written."""
+        now = now or datetime.now()
+        target = floor_time(now - self.settle, MINUTE)
+        watermark = get_rollup_watermark()
+        if watermark is None:
+            earliest = get_earliest_ingress_time()
+            if earliest is None:
+                return 0
+            watermark = floor_time(earliest, HOUR)  # start on an hour so every hour gets all its minutes
+        end = min(target, watermark + self.chunk)
+        if end <= watermark:
+            return 0
+
+        batch = get_transactions_between(watermark, end)
+        if batch is None:
+            return 0
+        rows = []
+        for bucket_epoch, groups in aggregate_report_by_bucket(batch, MINUTE, DIMENSIONS).items():
+            bucket_start = datetime.fromtimestamp(bucket_epoch)
+            for dimension, values in groups.items():
+                for value, accumulator in values.items():
+                    rows.append((bucket_start, dimension, value, accumulator.to_state()))
+        if not save_rollups(MINUTE, watermark, end, rows):
+            return 0
+
+        # Roll up every hour this chunk completed. The watermark only moves once
+        # they are saved, so a failed hour is rebuilt (minutes and all) next run
+        # instead of report() counting it as covered.
+        hour = floor_time(watermark, HOUR)
+        while hour + timedelta(hours=1) <= end:
+            if hour + timedelta(hours=1) > watermark and not self._roll_up_hour(hour):
+                return 0
+            hour += timedelta(hours=1)
+        if not set_rollup_watermark(end):
+            return 0
+
+        prune_rollups(MINUTE, self.minute_horizon(now))
+        return int((end - watermark).total_seconds() // MINUTE)
+
+    def _roll_up_hour(self, hour):
+        rows = []
+        for dimension in DIMENSIONS:
+            minute_rows = get_rollups(MINUTE, hour, hour + timedelta(hours=1), dimension)
+            if minute_rows is None:
+                return False
+            merged = {}
+            for row in minute_rows:
+                accumulator = ReportAccumulator.from_state(row['summary'])
+                value = row['dimension_value']
+                if value in merged:
+                    merged[value].merge(accumulator)
+                else:
+                    merged[value] = accumulator
+            rows.extend((hour, dimension, value, accumulator.to_state()) for value, accumulator in merged.items())
+        return save_rollups(HOUR, hour, hour + timedelta(hours=1), rows)
+
+    def minute_horizon(self, now=None):
+        """Oldest bucket_start for which minute rollups are guaranteed to exist."""
+        return floor_time((now or datetime.now()) - self.minute_retention, HOUR) + timedelta(hours=1)
+
+    def report(self, start_dt, end_dt, username=None, group_by=('username',)):
+        """aggregate_report()-shaped (overall, groups) for ingress_time in [start_dt, end_dt].
+
+        `group_by` takes rollup DIMENSIONS, starting with 'username'. Returns
+        None when rollups can't usefully answer the range (not built yet, too
+        short a span, or a query failed) or the grouping (server rollups
+        aren't split by user); the caller then scans raw rows.
+        """
+        if group_by[:1] != ('username',) or (username and len(group_by) > 1):
+            return None
+        watermark = get_rollup_watermark()
+        if watermark is None:
+            return None
+        covered_start = ceil_time(start_dt, MINUTE)
+        covered_end = min(floor_time(end_dt, MINUTE), watermark)
+        if covered_end - covered_start < self.min_report_span:
+            return None
+
+        # Hour buckets for the whole hours, minute buckets (or raw rows, if already pruned) either side
+        rollup_segments, raw_segments = [], [(start_dt, covered_start)]
+        hours_start, hours_end = ceil_time(covered_start, HOUR), floor_time(covered_end, HOUR)
+        if hours_start < hours_end:
+            rollup_segments.append((HOUR, hours_start, hours_end))
+            minute_segments = [(covered_start, hours_start), (hours_end, covered_end)]
+        else:
+            minute_segments = [(covered_start, covered_end)]
+        horizon = self.minute_horizon()
+        for segment_start, segment_end in minute_segments:
+            if segment_start >= segment_end:
+                continue
+            if segment_start >= horizon:
+                rollup_segments.append((MINUTE, segment_start, segment_end))
+            else:
+                raw_segments.append((segment_start, segment_end))
+
+        groups = {key: {} for key in group_by}
+
+        def merge_group(key, value, accumulator):
+            if value in groups[key]:
+                groups[key][value].merge(accumulator)
+            else:
+                groups[key][value] = accumulator
+
+        for bucket_seconds, segment_start, segment_end in rollup_segments:
+            for key in group_by:
+                rows = get_rollups(bucket_seconds, segment_start, segment_end, key, value=username)
+                if rows is None:
+                    return None
+                for row in rows:
+                    accumulator = ReportAccumulator.from_state(row['summary'])
+                    if key == 'username' and row['dimension_value']:
+                        accumulator.usernames.add(row['dimension_value'])  # rows written before users were counted
+                    merge_group(key, row['dimension_value'], accumulator)
+
+        raw_batches = [get_transactions_between(a, b, username) for a, b in raw_segments if a < b]
+        raw_batches.append(get_transactions_between(covered_end, end_dt, username, inclusive_end=True))
+        for batch in raw_batches:
+            if batch is None:
+                return None
+            for key, key_groups in aggregate_report(batch, group_by=group_by)[1].items():
+                for value, accumulator in key_groups.items():
+                    merge_group(key, value, accumulator)
+
+        overall = ReportAccumulator()
+        for accumulator in groups['username'].values():
+            overall.merge(accumulator)
+        return overall, groups
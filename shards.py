@@ -0,0 +1,90 @@
+"""Parallel report aggregation over time shards.
+
+ShardedReportEngine splits a report's date range into contiguous shards and
+has a process pool fetch and aggregate each one. Every worker process opens
+its own connection pool, so shards are read over separate connections and the
+CPU-bound stats pass runs on separate cores. The partial ReportAccumulators
+(counts, sums, min/max and transit sketches) are then merged into the same
+(overall, groups) shape as stats.aggregate_report().
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from db import get_transactions_between
+from stats import ReportAccumulator, aggregate_report
+
+
+def split_range(start_dt, end_dt, shards):
+    """Split [start_dt, end_dt] into `shards` (start, end, inclusive_end) ranges; only the last includes end_dt."""
+    step = (end_dt - start_dt) / shards
+    bounds = [start_dt + step * i for i in range(shards)] + [end_dt]
+    return [(bounds[i], bounds[i + 1], i == shards - 1) for i in range(shards)]
+
+
+def aggregate_shard(start_dt, end_dt, username, inclusive_end, group_by):
+    """Worker: fetch one shard as a TransactionBatch and aggregate it (None on a database error)."""
+    batch = get_transactions_between(start_dt, end_dt, username, inclusive_end=inclusive_end)
+    if batch is None:
+        return None
+    return aggregate_report(batch, group_by)
+
+
+def merge_report_results(results, group_by):
+    """Merge aggregate_report() results from disjoint shards."""
+    overall = ReportAccumulator()
+    groups = {key: {} for key in group_by}
+    for shard_overall, shard_groups in results:
+        overall.merge(shard_overall)
+        for key in group_by:
+            for value, accumulator in shard_groups[key].items():
+                if value in groups[key]:
+                    groups[key][value].merge(accumulator)
+                else:
+                    groups[key][value] = accumulator
+    return overall, groups
+
+
+class ShardedReportEngine:
+    def __init__(self, workers, min_shard_minutes=60, shards_per_worker=2):
+        self.workers = workers
+        self.min_shard = timedelta(minutes=min_shard_minutes)
+        self.shards_per_worker = shards_per_worker  # extra shards even out skewed traffic
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn, not fork: forked children would inherit the parent's open pooled connections
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def shard_count(self, start_dt, end_dt):
+        return max(1, min(self.workers * self.shards_per_worker, int((end_dt - start_dt) / self.min_shard)))
+
+    def aggregate(self, start_dt, end_dt, username=None, group_by=('username',)):
+        """aggregate_report() over ingress_time in [start_dt, end_dt] computed in parallel.
+
+        Returns None when the range is too short to be worth sharding or a
+        shard failed; the caller then aggregates sequentially.
+        """
+        shards = self.shard_count(start_dt, end_dt)
+        if self.workers < 2 or shards < 2:
+            return None
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(aggregate_shard, shard_start, shard_end, username, inclusive_end, group_by)
+                       for shard_start, shard_end, inclusive_end in split_range(start_dt, end_dt, shards)]
+            results = [future.result() for future in futures]
+        except Exception as err:
+            print(f"Error computing sharded report: {err}")
+            self.shutdown()  # e.g. BrokenProcessPool; start a fresh pool next time
+            return None
+        if any(result is None for result in results):
+            return None
+        return merge_report_results(results, group_by)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,366 @@
+"""Bounded-memory, mergeable streaming summaries used by the stats code."""
+import base64
+import hashlib
+import heapq
+import math
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class QuantileSketch:
+    """DDSketch-style quantile sketch with a relative error guarantee.
+
+    Positive values are counted in logarithmic bins of ratio
+    gamma = (1 + alpha) / (1 - alpha), so any reported percentile is within
+    `relative_accuracy` (default 1%) of the true value at that rank. Two
+    sketches with the same accuracy merge exactly by adding bin counts.
+    Memory is capped at `max_bins`; past that the lowest bins are collapsed,
+    which only degrades accuracy for the smallest values.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0  # values <= 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value > 0:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        """Add a sequence of values; vectorized when NumPy is available."""
+        if np is None:
+            for value in values:
+                self.add(value)
+            return
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        positive = values[values > 0]
+        indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        low, high = float(values.min()), float(values.max())
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def to_dict(self):
+        """JSON-serializable state (see from_dict)."""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'bins': sorted(self.bins.items()),
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['relative_accuracy'], state['max_bins'])
+        sketch.bins = {int(index): count for index, count in state['bins']}
+        sketch.zero_count = state['zero_count']
+        sketch.count = state['count']
+        sketch.min = state['min']
+        sketch.max = state['max']
+        return sketch
+
+    def _collapse(self):
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins + 1
+        target = indexes[excess]
+        self.bins[target] += sum(self.bins.pop(i) for i in indexes[:excess])
+
+    def percentiles(self, *percentiles):
+        """Return estimates for each percentile (0-100) in a single pass over the bins."""
+        if self.count == 0:
+            return [0.0 for _ in percentiles]
+        ranks = sorted((p / 100 * (self.count - 1), i) for i, p in enumerate(percentiles))
+        results = [0.0] * len(percentiles)
+        cumulative = self.zero_count
+        bins = iter(sorted(self.bins.items()))
+        index = None
+        for rank, position in ranks:
+            if rank < self.zero_count:
+                results[position] = float(min(self.max, 0))
+                continue
+            while cumulative <= rank:
+                index, bin_count = next(bins)
+                cumulative += bin_count
+            value = 2 * self.gamma ** index / (self.gamma + 1)
+            results[position] = min(max(value, self.min), self.max)
+        return results
+
+    def percentile(self, percentile):
+        return self.percentiles(percentile)[0]
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters summary over weighted keys.
+
+    Tracks at most `capacity` keys (2x between compactions). Each tracked
+    count overestimates the key's true total by at most its error, and any
+    key missing from the summary has a true total of at most `floor`, so every
+    key whose total exceeds total / capacity is tracked. Summaries merge (the
+    mergeable-summaries construction), so per-second summaries can be combined
+    into a window. While nothing has been evicted (`floor` == 0) the counts are
+    exact.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}  # key -> [count, error]
+        self.floor = 0  # upper bound on the total of any key not in counts
+        self.total = 0
+        # Min-heap of (count, key), one entry per tracked key. Counts only grow, so
+        # an entry may be stale (too low); it is refreshed when it reaches the top.
+        self._heap = None  # built on the first eviction
+
+    def add(self, key, weight=1):
+        if not weight:
+            return
+        self.total += weight
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = [self.floor + weight, self.floor]
+            if self._heap is not None:
+                heapq.heappush(self._heap, (self.floor + weight, key))
+        else:
+            # Replace the smallest key; the newcomer inherits its count as error
+            smallest = self._pop_smallest()
+            self.floor = max(self.floor, smallest)
+            self.counts[key] = [smallest + weight, smallest]
+            heapq.heappush(self._heap, (smallest + weight, key))
+
+    def _pop_smallest(self):
+        """Remove the key with the smallest count and return that count, in O(log capacity) amortized."""
+        heap = self._heap
+        if heap is None or len(heap) != len(self.counts):
+            heap = self._heap = [(count, key) for key, (count, _) in self.counts.items()]
+            heapq.heapify(heap)
+        while True:
+            count, key = heap[0]
+            current = self.counts[key][0]
+            if current == count:
+                heapq.heappop(heap)
+                del self.counts[key]
+                return count
+            heapq.heapreplace(heap, (current, key))
+
+    def merge(self, other):
+        if other.floor:
+            for key, entry in self.counts.items():
+                if key not in other.counts:
+                    entry[0] += other.floor
+                    entry[1] += other.floor
+        for key, (count, error) in other.counts.items():
+            entry = self.counts.get(key)
+            if entry is None:
+                self.counts[key] = [self.floor + count, self.floor + error]
+            else:
+                entry[0] += count
+                entry[1] += error
+        self.floor += other.floor
+        self.total += other.total
+        self._heap = None  # counts changed wholesale; rebuilt on the next eviction
+        if len(self.counts) > 2 * self.capacity:
+            self._compact()
+        return self
+
+    def _compact(self):
+        """Keep the `capacity` largest counts; the largest dropped count becomes the floor."""
+        kept = heapq.nlargest(self.capacity, self.counts.items(), key=lambda item: item[1][0])
+        for key, _ in kept:
+            del self.counts[key]
+        if self.counts:
+            self.floor = max(self.floor, max(count for count, _ in self.counts.values()))
+        self.counts = dict(kept)
+
+    def top(self, n=10):
+        """The n largest (key, count, error) entries, largest first, without sorting the rest."""
+        return [(key, count, error) for key, (count, error)
+                in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1][0])]
+
+    @property
+    def exact(self):
+        return self.floor == 0
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-value counter.
+
+    Uses 2**precision one-byte registers (16 KiB at the default precision
+    14). The estimate's relative standard error is 1.04 / sqrt(2**precision),
+    about 0.8% at precision 14, so it lies within 2.5% of the true count about
+    99.7% of the time. Small cardinalities use linear counting, which is much
+    more accurate. Sketches with the same precision merge exactly by taking
+    the register-wise maximum.
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        rest_bits = 64 - self.precision
+        index = hashed >> rest_bits
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        if np is not None:
+            np.maximum(np.frombuffer(self.registers, dtype=np.uint8),
+                       np.frombuffer(other.registers, dtype=np.uint8),
+                       out=np.frombuffer(self.registers, dtype=np.uint8))
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        if np is not None:
+            registers = np.frombuffer(self.registers, dtype=np.uint8)
+            harmonic = float(np.ldexp(1.0, -registers.astype(np.int32)).sum())
+            zeros = int(np.count_nonzero(registers == 0))
+        else:
+            harmonic = sum(2.0 ** -register for register in self.registers)
+            zeros = self.registers.count(0)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / harmonic
+        if estimate <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # linear counting
+        return round(estimate)
+
+    def to_dict(self):
+        """JSON-serializable state (see from_dict)."""
+        return {'precision': self.precision,
+                'registers': base64.b64encode(zlib.compress(bytes(self.registers))).decode()}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['precision'])
+        sketch.registers = bytearray(zlib.decompress(base64.b64decode(state['registers'])))
+        return sketch
+
+
+class DistinctCounter:
+    """Distinct count that is exact up to `exact_limit` values, then a HyperLogLog estimate.
+
+    Below the limit the values themselves are kept (and counted exactly);
+    past it they are folded into a HyperLogLog sketch, so memory stays bounded
+    however many distinct values a long range holds. exact_limit=None never
+    switches. Counters merge with each other in either state.
+    """
+
+    def __init__(self, exact_limit=1000, precision=14):
+        self.exact_limit = exact_limit
+        self.precision = precision
+        self.values = set()
+        self.sketch = None
+
+    def add(self, value):
+        if self.sketch is not None:
+            self.sketch.add(value)
+            return
+        self.values.add(value)
+        if self.exact_limit is not None and len(self.values) > self.exact_limit:
+            self._switch_to_sketch()
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def _switch_to_sketch(self):
+        self.sketch = HyperLogLog(self.precision)
+        for value in self.values:
+            self.sketch.add(value)
+        self.values = set()
+
+    def merge(self, other):
+        if other.sketch is None:
+            self.update(other.values)
+            return self
+        if self.sketch is None:
+            self._switch_to_sketch()
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def exact(self):
+        return self.sketch is None
+
+    def count(self):
+        return len(self.values) if self.sketch is None else self.sketch.count()
+
+    def __len__(self):
+        return self.count()
+
+    def to_dict(self):
+        """JSON-serializable state (see from_dict)."""
+        if self.sketch is None:
+            return {'values': sorted(self.values)}
+        return {'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state, exact_limit=1000):
+        counter = cls(exact_limit)
+        if 'sketch' in state:
+            counter.sketch = HyperLogLog.from_dict(state['sketch'])
+            counter.precision = counter.sketch.precision
+        else:
+            counter.update(state['values'])
+        return counter
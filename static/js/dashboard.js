@@ -4,7 +4,13 @@
 
 // State tracking variables
 let isRefreshingStats = false;
+let isRefreshingTransactions = false;
 let lastDataRefreshTime = new Date();
+let dashboardTransactions = []; // Rows currently rendered in the table
+let dashboardNextCursor = null; // Keyset cursor for the next page, if any
+let lastServerTimestamp = null; // Server clock from the latest stats, for trimming pushed rows to the window
+
+const DASHBOARD_PAGE_SIZE = 50;
 
 /**
  * Update dashboard with the fetched data
@@ -13,6 +19,7 @@ let lastDataRefreshTime = new Date();
 function updateDashboardDisplay(data) {
     // Update last refresh time
     lastDataRefreshTime = new Date();
+    if (data && data.timestamp) lastServerTimestamp = data.timestamp;
     
     // Update the stat cards
     if (data && data.stats) {
@@ -36,12 +43,10 @@ function updateDashboardDisplay(data) {
 
     // Get container elements
     const statsContainer = document.getElementById('statsContainer');
-    const transactionsTableContainer = document.getElementById('dashboardTransactionsTableContainer');
 
     // Handle error state if no data
     if (!data || !data.stats) {
         statsContainer.innerHTML = '<div class="error-msg"><i class="fas fa-exclamation-triangle"></i> Error loading statistics data.</div>';
-        transactionsTableContainer.innerHTML = '<div class="error-msg"><i class="fas fa-exclamation-triangle"></i> Error loading transactions data.</div>';
         return;
     }
 
@@ -51,9 +56,6 @@ function updateDashboardDisplay(data) {
 
     // Update detailed stats panels
     updateDetailedStatsPanels(statsContainer, ingressStats, egressStats);
-    
-    // Update transactions table
-    renderTransactionsTable(data.transactions_in_window || [], 'dashboardTransactionsTableContainer', false);
 }
 
 /**
@@ -111,24 +113,21 @@ function updateDetailedStatsPanels(container, ingressStats, egressStats) {
 }
 
 /**
- * Fetch dashboard data from the API
+ * Fetch dashboard stats from the API, then refresh the transactions table
  */
 function fetchDashboardData() {
+    fetchDashboardTransactions();
+
     if (isRefreshingStats) return;
     isRefreshingStats = true;
     
     const timeWindow = document.getElementById('time_window').value;
     const statsContainer = document.getElementById('statsContainer');
-    const txTableContainer = document.getElementById('dashboardTransactionsTableContainer');
 
     // Show loading if needed
     if (!statsContainer.querySelector('.detail-panel')) {
         statsContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner fa-spin"></i> Loading...</div>';
     }
-    
-    if (!txTableContainer.querySelector('.data-table') && !txTableContainer.querySelector('.no-data')) {
-        txTableContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner fa-spin"></i> Loading...</div>';
-    }
 
     fetch(`/api/dashboard-stats?time_window=${timeWindow}`)
         .then(response => {
@@ -141,13 +140,119 @@ function fetchDashboardData() {
         .catch(error => {
             console.error('Error fetching dashboard data:', error);
             statsContainer.innerHTML = '<div class="error-msg"><i class="fas fa-exclamation-triangle"></i> Error loading statistics</div>';
-            txTableContainer.innerHTML = '<div class="error-msg"><i class="fas fa-exclamation-triangle"></i> Error loading transactions</div>';
         })
         .finally(() => {
             isRefreshingStats = false;
         });
 }
 
+/**
+ * Fetch a page of transactions for the table (filtered server-side)
+ * @param {boolean} append - Append the next page instead of refreshing from the newest row
+ */
+function fetchDashboardTransactions(append = false) {
+    if (isRefreshingTransactions) return;
+    isRefreshingTransactions = true;
+
+    const txTableContainer = document.getElementById('dashboardTransactionsTableContainer');
+    const loadMoreBtn = document.getElementById('loadMoreTransactionsBtn');
+
+    if (!txTableContainer.querySelector('.data-table') && !txTableContainer.querySelector('.no-data')) {
+        txTableContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner fa-spin"></i> Loading...</div>';
+    }
+
+    // A refresh re-reads as many rows as are currently shown so "load more" pages survive it
+    const params = new URLSearchParams({
+        time_window: document.getElementById('time_window').value,
+        limit: append ? DASHBOARD_PAGE_SIZE : Math.max(DASHBOARD_PAGE_SIZE, dashboardTransactions.length)
+    });
+    const usernameFilter = document.getElementById('filter_username').value;
+    const statusFilter = document.getElementById('filter_status').value;
+    if (usernameFilter) params.set('username', usernameFilter);
+    if (statusFilter) params.set('status', statusFilter);
+    if (append && dashboardNextCursor) params.set('cursor', dashboardNextCursor);
+
+    fetch(`/api/transactions?${params}`)
+        .then(response => {
+            if (!response.ok) throw new Error('Network response: ' + response.statusText);
+            return response.json();
+        })
+        .then(data => {
+            const page = data.transactions || [];
+            dashboardTransactions = append ? dashboardTransactions.concat(page) : page;
+            dashboardNextCursor = data.next_cursor;
+            renderTransactionsTable(dashboardTransactions, 'dashboardTransactionsTableContainer', false);
+            loadMoreBtn.style.display = data.has_more ? '' : 'none';
+        })
+        .catch(error => {
+            console.error('Error fetching dashboard transactions:', error);
+            txTableContainer.innerHTML = '<div class="error-msg"><i class="fas fa-exclamation-triangle"></i> Error loading transactions</div>';
+        })
+        .finally(() => {
+            isRefreshingTransactions = false;
+        });
+}
+
+/**
+ * Merge transactions pushed by the live stream into the table, applying the
+ * current filters and time window client-side instead of re-querying
+ * @param {Array} changed - Transactions new or updated since the last push
+ */
+function mergeDashboardTransactions(changed) {
+    const usernameFilter = document.getElementById('filter_username').value;
+    const statusFilter = document.getElementById('filter_status').value;
+    const timeWindow = parseInt(document.getElementById('time_window').value, 10);
+    const windowStart = lastServerTimestamp ? new Date(lastServerTimestamp).getTime() - timeWindow * 60000 : null;
+
+    const byId = new Map(dashboardTransactions.map(tx => [tx.transaction_id, tx]));
+    changed.forEach(tx => {
+        const matches = (!usernameFilter || tx.username === usernameFilter) &&
+            (!statusFilter || tx.status === statusFilter) &&
+            (windowStart === null || new Date(tx.ingress_time).getTime() >= windowStart);
+        if (matches) {
+            byId.set(tx.transaction_id, tx);
+        } else {
+            byId.delete(tx.transaction_id); // e.g. its status no longer matches the filter
+        }
+    });
+
+    // Keep as many rows as are shown; rows pushed off the end are reachable again via "load more"
+    const sorted = Array.from(byId.values()).sort(compareTransactionsNewestFirst);
+    const kept = sorted.slice(0, Math.max(DASHBOARD_PAGE_SIZE, dashboardTransactions.length));
+    if (kept.length < sorted.length) {
+        const last = kept[kept.length - 1];
+        dashboardNextCursor = `${last.ingress_time}|${last.transaction_id}`;
+        document.getElementById('loadMoreTransactionsBtn').style.display = '';
+    }
+    dashboardTransactions = kept;
+    renderTransactionsTable(dashboardTransactions, 'dashboardTransactionsTableContainer', false);
+}
+
+/**
+ * Start polling or the live stream according to the refresh select
+ */
+function setupDashboardRefresh() {
+    setupAutoRefresh(fetchDashboardData, 'refresh_rate');
+    if (isLiveRefresh('refresh_rate')) {
+        const timeWindow = document.getElementById('time_window').value;
+        openLiveStream('refresh_rate', `/api/stream?time_window=${timeWindow}`, {
+            stats: updateDashboardDisplay,
+            feed: data => mergeDashboardTransactions(data.transactions || [])
+        });
+    } else {
+        closeLiveStream('refresh_rate');
+    }
+}
+
+/**
+ * Drop any extra loaded pages and reload the table from the first page
+ */
+function resetDashboardTransactions() {
+    dashboardTransactions = [];
+    dashboardNextCursor = null;
+    fetchDashboardTransactions();
+}
+
 // Initialize dashboard when the DOM is loaded
 document.addEventListener('DOMContentLoaded', function () {
     // Initialize 
@@ -155,14 +260,25 @@ document.addEventListener('DOMContentLoaded', function () {
     
     // Fetch initial data
     fetchDashboardData();
+    loadUsernameOptions('filter_username');
     
-    // Setup auto-refresh
-    setupAutoRefresh(fetchDashboardData, 'refresh_rate');
+    // Setup auto-refresh (polling or live stream)
+    setupDashboardRefresh();
     
     // Add event listeners
-    document.getElementById('time_window').addEventListener('change', fetchDashboardData);
+    document.getElementById('time_window').addEventListener('change', function() {
+        dashboardTransactions = [];
+        dashboardNextCursor = null;
+        fetchDashboardData();
+        if (isLiveRefresh('refresh_rate')) setupDashboardRefresh(); // re-subscribe for the new window
+    });
+    document.getElementById('filter_username').addEventListener('change', resetDashboardTransactions);
+    document.getElementById('filter_status').addEventListener('change', resetDashboardTransactions);
+    document.getElementById('loadMoreTransactionsBtn').addEventListener('click', function() {
+        fetchDashboardTransactions(true);
+    });
     document.getElementById('refresh_rate').addEventListener('change', function() {
-        setupAutoRefresh(fetchDashboardData, 'refresh_rate');
+        setupDashboardRefresh();
         if (this.value !== "0") fetchDashboardData();
     });
 }); 
\ No newline at end of file
@@ -5,6 +5,8 @@
 // State tracking variables
 let isRefreshingTransactions = false;
 let currentLiveTransactions = []; // Store all fetched transactions for client-side filtering
+let liveFeedSince = null; // Watermark token from the last response; enables delta polling
+let liveFeedEtag = null;  // ETag of the last response, sent as If-None-Match
 
 /**
  * Update the transactions table based on current filters
@@ -36,7 +38,21 @@ function updateLiveTransactionTableDisplay() {
 }
 
 /**
- * Fetch transactions from the API
+ * Merge a delta response into the current list: replace rows by transaction_id,
+ * add new ones, keep newest-first order and trim to the requested size
+ * @param {Array} changed - Transactions new or updated since the last poll
+ * @param {number} numItems - Maximum number of rows to keep
+ */
+function mergeLiveTransactions(changed, numItems) {
+    const byId = new Map(currentLiveTransactions.map(tx => [tx.transaction_id, tx]));
+    changed.forEach(tx => byId.set(tx.transaction_id, tx));
+    currentLiveTransactions = Array.from(byId.values())
+        .sort(compareTransactionsNewestFirst)
+        .slice(0, numItems);
+}
+
+/**
+ * Fetch transactions from the API (only changes since the last poll once primed)
  */
 function fetchLiveTransactions() {
     if (isRefreshingTransactions) return;
@@ -50,14 +66,26 @@ function fetchLiveTransactions() {
         tableContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner fa-spin"></i> Loading transaction data...</div>';
     }
 
+    const params = new URLSearchParams({ num_items: numItems });
+    if (liveFeedSince) params.set('since', liveFeedSince);
+    const headers = liveFeedEtag ? { 'If-None-Match': liveFeedEtag } : {};
+
     // Fetch data from API
-    fetch(`/api/transactions-feed?num_items=${numItems}`)
+    fetch(`/api/transactions-feed?${params}`, { headers: headers, cache: 'no-store' })
         .then(response => {
+            if (response.status === 304) return null; // Nothing changed since the last poll
             if (!response.ok) throw new Error('Network response was not ok: ' + response.statusText);
+            liveFeedEtag = response.headers.get('ETag');
             return response.json();
         })
         .then(data => {
-            currentLiveTransactions = data.transactions || [];
+            if (!data) return;
+            if (data.mode === 'delta') {
+                mergeLiveTransactions(data.transactions || [], data.num_items);
+            } else {
+                currentLiveTransactions = data.transactions || [];
+            }
+            liveFeedSince = data.since;
             updateLiveTransactionTableDisplay(); // Update table with potentially filtered data
             document.getElementById('num_items').value = data.num_items; // Reflect actual num_items
         })
@@ -71,47 +99,55 @@ function fetchLiveTransactions() {
 }
 
 /**
- * Load usernames for the filter dropdown
+ * Apply a pushed `feed` event from the live stream
+ * @param {Object} data - Event payload: full list or delta of changed transactions
  */
-function loadUsernamesForFilter() {
-    fetch('/api/usernames')
-        .then(response => response.json())
-        .then(data => {
-            const usernameSelect = document.getElementById('filter_username');
-            const currentValue = usernameSelect.value;
-            
-            // Clear existing options except the first one
-            while (usernameSelect.options.length > 1) usernameSelect.remove(1);
-            
-            // Add new options
-            data.usernames.forEach(username => {
-                const option = document.createElement('option');
-                option.value = username; 
-                option.textContent = username;
-                usernameSelect.appendChild(option);
-            });
-            
-            // Restore previous selection if possible
-            if (currentValue) usernameSelect.value = currentValue;
-        })
-        .catch(error => console.error('Error loading usernames for filter:', error));
+function applyLiveFeedEvent(data) {
+    const numItems = parseInt(document.getElementById('num_items').value, 10);
+    if (data.mode === 'delta') {
+        mergeLiveTransactions(data.transactions || [], numItems);
+    } else {
+        currentLiveTransactions = (data.transactions || []).slice(0, numItems);
+    }
+    updateLiveTransactionTableDisplay();
+}
+
+/**
+ * Start polling or the live stream according to the refresh select
+ */
+function setupLiveRefresh() {
+    setupAutoRefresh(fetchLiveTransactions, 'live_refresh_rate');
+    if (isLiveRefresh('live_refresh_rate')) {
+        openLiveStream('live_refresh_rate', '/api/stream', { feed: applyLiveFeedEvent });
+    } else {
+        closeLiveStream('live_refresh_rate');
+    }
+}
+
+/**
+ * Forget the delta watermark so the next poll returns a full list
+ */
+function resetLiveTransactions() {
+    liveFeedSince = null;
+    liveFeedEtag = null;
+    fetchLiveTransactions();
 }
 
 // Initialize transactions page when the DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
     // Load initial data
     fetchLiveTransactions();
-    loadUsernamesForFilter();
+    loadUsernameOptions('filter_username');
     
-    // Setup auto-refresh
-    setupAutoRefresh(fetchLiveTransactions, 'live_refresh_rate');
+    // Setup auto-refresh (polling or live stream)
+    setupLiveRefresh();
 
     // Add event listeners
-    document.getElementById('num_items').addEventListener('change', fetchLiveTransactions);
+    document.getElementById('num_items').addEventListener('change', resetLiveTransactions);
     document.getElementById('filter_username').addEventListener('change', updateLiveTransactionTableDisplay);
     document.getElementById('filter_status').addEventListener('change', updateLiveTransactionTableDisplay);
     document.getElementById('live_refresh_rate').addEventListener('change', function(){
-        setupAutoRefresh(fetchLiveTransactions, 'live_refresh_rate');
+        setupLiveRefresh();
         if (this.value !== "0") fetchLiveTransactions();
     });
-}); 
\ No newline at end of file
+});
\ No newline at end of file
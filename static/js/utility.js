@@ -51,6 +51,34 @@ function getStatusColor(status) {
     return getComputedStyle(document.documentElement).getPropertyValue(colorVarName).trim() || '#999999';
 }
 
+/**
+ * Populate a username <select> from the API, keeping its first ("All") option
+ * @param {string} selectElementId - ID of the select element to fill
+ */
+function loadUsernameOptions(selectElementId) {
+    fetch('/api/usernames')
+        .then(response => response.json())
+        .then(data => {
+            const usernameSelect = document.getElementById(selectElementId);
+            const currentValue = usernameSelect.value;
+            
+            // Clear existing options except the first one
+            while (usernameSelect.options.length > 1) usernameSelect.remove(1);
+            
+            // Add new options
+            data.usernames.forEach(username => {
+                const option = document.createElement('option');
+                option.value = username; 
+                option.textContent = username;
+                usernameSelect.appendChild(option);
+            });
+            
+            // Restore previous selection if possible
+            if (currentValue) usernameSelect.value = currentValue;
+        })
+        .catch(error => console.error('Error loading usernames for filter:', error));
+}
+
 /**
  * Setup auto-refresh timer 
  * @param {function} fetchFunction - Function to call on refresh
@@ -68,8 +96,9 @@ function setupAutoRefresh(fetchFunction, selectElementId) {
         window.activeRefreshTimers = {};
     }
     
-    // Get refresh rate from the select element
-    const refreshRate = parseInt(document.getElementById(selectElementId).value, 10) * 1000;
+    // Get refresh rate from the select element ("live" is pushed over SSE; poll every 5s without EventSource)
+    const selectedRate = document.getElementById(selectElementId).value;
+    const refreshRate = selectedRate === 'live' ? (window.EventSource ? 0 : 5000) : parseInt(selectedRate, 10) * 1000;
     
     // Set up the timer if refresh rate is greater than 0
     if (refreshRate > 0) {
@@ -79,6 +108,76 @@ function setupAutoRefresh(fetchFunction, selectElementId) {
     return window.activeRefreshTimers[selectElementId];
 }
 
+/**
+ * Whether a refresh select is set to server push and the browser supports it
+ * @param {string} selectElementId - ID of the select element with refresh rate
+ * @returns {boolean} True if updates should come from the live stream
+ */
+function isLiveRefresh(selectElementId) {
+    return document.getElementById(selectElementId).value === 'live' && !!window.EventSource;
+}
+
+/**
+ * Open a Server-Sent Events stream, replacing any open stream with the same key
+ * @param {string} key - Identifier for the stream (e.g. the refresh select ID)
+ * @param {string} url - Stream URL
+ * @param {Object} handlers - Map of event name to a function receiving the parsed JSON data
+ * @returns {EventSource} The opened stream
+ */
+function openLiveStream(key, url, handlers) {
+    closeLiveStream(key);
+    if (!window.activeLiveStreams) {
+        window.activeLiveStreams = {};
+    }
+
+    const source = new EventSource(url);
+    Object.entries(handlers).forEach(([eventName, handler]) => {
+        source.addEventListener(eventName, event => handler(JSON.parse(event.data)));
+    });
+    // The browser reconnects on its own; the server re-sends a snapshot on reconnect
+    source.onerror = () => console.warn('Live stream interrupted, reconnecting:', url);
+
+    window.activeLiveStreams[key] = source;
+    return source;
+}
+
+/**
+ * Close the live stream with the given key, if one is open
+ * @param {string} key - Identifier passed to openLiveStream
+ */
+function closeLiveStream(key) {
+    if (window.activeLiveStreams && window.activeLiveStreams[key]) {
+        window.activeLiveStreams[key].close();
+        delete window.activeLiveStreams[key];
+    }
+}
+
+/**
+ * Sort comparator putting the newest transaction first (ties broken by transaction_id)
+ * @param {Object} a - Transaction
+ * @param {Object} b - Transaction
+ * @returns {number} Comparison result
+ */
+function compareTransactionsNewestFirst(a, b) {
+    const timeA = sortableTimestamp(a.ingress_time);
+    const timeB = sortableTimestamp(b.ingress_time);
+    if (timeA !== timeB) {
+        return timeA < timeB ? 1 : -1;
+    }
+    return a.transaction_id === b.transaction_id ? 0 : (a.transaction_id < b.transaction_id ? 1 : -1);
+}
+
+/**
+ * Pad an ISO timestamp's fraction to microseconds so timestamps compare as strings in time order
+ * (isoformat() leaves the fraction out when it is zero)
+ * @param {string} timestamp - ISO 8601 timestamp without a UTC offset
+ * @returns {string} Fixed-width timestamp
+ */
+function sortableTimestamp(timestamp) {
+    const [whole, fraction = ''] = (timestamp || '').split('.');
+    return `${whole}.${fraction.padEnd(6, '0')}`;
+}
+
 /**
  * Render a transactions table
  * @param {Array} transactions - Array of transaction objects
@@ -0,0 +1,420 @@
+"""Pure statistics helpers shared by the dashboard and report code paths."""
+import math
+import os
+
+from columnar import TransactionBatch, np
+from sketches import DistinctCounter, QuantileSketch, SpaceSaving
+
+# Distinct users are counted exactly up to DISTINCT_EXACT_LIMIT per accumulator, then
+# estimated with HyperLogLog; DISTINCT_COUNT=exact always keeps every username
+DISTINCT_EXACT_LIMIT = (None if os.getenv('DISTINCT_COUNT', 'approximate') == 'exact'
+                        else int(os.getenv('DISTINCT_EXACT_LIMIT', 1000)))
+
+# Statuses counted as failed transactions (as in the dashboard success rate)
+FAILURE_STATUSES = ('BAD_REQUEST', 'CD_UNAVAILABLE', 'EP_UNAVAILABLE')
+
+
+class DashboardAccumulator:
+    """Mergeable running totals behind the dashboard `stats` structure.
+
+    add() folds in one transaction row, merge() folds in another accumulator,
+    and aggregates() returns the dict consumed by app.build_dashboard_stats().
+    """
+
+    def __init__(self):
+        self.status_counts = {}
+        self.complete_bytes = 0
+        self.egress_bytes = 0
+        self.transit_bytes = 0
+        self.transit_sum = 0.0
+        self.transit_max = 0.0
+        self.transit_sketch = QuantileSketch()
+        self.usernames = DistinctCounter(DISTINCT_EXACT_LIMIT)
+
+    def add(self, t):
+        has_egress = bool(t.get('ingress_time') and t.get('egress_time'))
+        self.add_values(t.get('username'), t['status'], t.get('file_size'), has_egress,
+                        t.get('transit_time_seconds', 0))
+
+    def add_values(self, username, status, file_size, has_egress, duration):
+        if username:
+            self.usernames.add(username)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+        if status in ['COMPLETE', 'EP_UNAVAILABLE']:
+            if status == 'COMPLETE' and file_size: # Accumulate for total volume (complete)
+                self.complete_bytes += file_size
+            if file_size and has_egress:
+                self.egress_bytes += file_size
+                if duration > 0:
+                    self.transit_sketch.add(duration)
+                    self.transit_sum += duration
+                    self.transit_bytes += file_size
+                    if duration > self.transit_max:
+                        self.transit_max = duration
+
+    def add_batch(self, batch, indices=None):
+        """Fold in a TransactionBatch (optionally only the given row indices)."""
+        if np is None:
+            rows = range(len(batch)) if indices is None else indices
+            for i in rows:
+                transit = batch.transit_seconds[i]
+                has_egress = not math.isnan(transit)
+                self.add_values(batch.usernames.value(batch.username[i]), batch.statuses.value(batch.status[i]),
+                                batch.file_size[i], has_egress, transit if has_egress else 0)
+            return
+
+        status, file_size, transit, username = (
+            batch.column(name) if indices is None else batch.column(name)[indices]
+            for name in ('status', 'file_size', 'transit_seconds', 'username'))
+        for code in np.unique(username).tolist():
+            name = batch.usernames.value(code)
+            if name:
+                self.usernames.add(name)
+        for code, count in enumerate(np.bincount(status, minlength=len(batch.statuses.values)).tolist()):
+            if count:
+                name = batch.statuses.value(code)
+                self.status_counts[name] = self.status_counts.get(name, 0) + count
+
+        complete = status == batch.statuses.lookup('COMPLETE')
+        egress = (complete | (status == batch.statuses.lookup('EP_UNAVAILABLE'))) & (file_size != 0) & ~np.isnan(transit)
+        timed = egress & (transit > 0)
+        self.complete_bytes += int(file_size[complete].sum())
+        self.egress_bytes += int(file_size[egress].sum())
+        if timed.any():
+            durations = transit[timed]
+            self.transit_sketch.add_many(durations)
+            self.transit_sum += float(durations.sum())
+            self.transit_bytes += int(file_size[timed].sum())
+            self.transit_max = max(self.transit_max, float(durations.max()))
+
+    def merge(self, other):
+        for status, count in other.status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+        self.complete_bytes += other.complete_bytes
+        self.egress_bytes += other.egress_bytes
+        self.transit_bytes += other.transit_bytes
+        self.transit_sum += other.transit_sum
+        self.transit_max = max(self.transit_max, other.transit_max)
+        self.transit_sketch.merge(other.transit_sketch)
+        self.usernames.merge(other.usernames)
+        return self
+
+    def aggregates(self):
+        p95_transit, p99_transit = self.transit_sketch.percentiles(95, 99)
+        return {
+            'status_counts': dict(self.status_counts),
+            'complete_bytes': self.complete_bytes,
+            'egress_bytes': self.egress_bytes,
+            'transit_count': self.transit_sketch.count,
+            'transit_sum': self.transit_sum,
+            'transit_max': self.transit_max,
+            'transit_bytes': self.transit_bytes,
+            'p95_transit': p95_transit,
+            'p99_transit': p99_transit,
+            'active_users': self.usernames.count()
+        }
+
+
+class HeavyHitters:
+    """Space-Saving top-K summaries of transactions, bytes and failures per dimension.
+
+    Bytes are the file_size of every transaction, failures count the
+    FAILURE_STATUSES. Each of the 12 summaries tracks at most `capacity` keys
+    (2x between compactions) no matter how many distinct users, servers or
+    files a window holds.
+    """
+    DIMENSIONS = ('username', 'ingress_server', 'egress_server', 'file_name')
+    METRICS = ('transactions', 'bytes', 'failures')
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.summaries = {(dimension, metric): SpaceSaving(capacity)
+                          for dimension in self.DIMENSIONS for metric in self.METRICS}
+
+    def add(self, t):
+        failed = t.get('status') in FAILURE_STATUSES
+        for dimension in self.DIMENSIONS:
+            self._add(dimension, t.get(dimension), 1, t.get('file_size') or 0, int(failed))
+
+    def _add(self, dimension, value, transactions, size, failures):
+        if value is None:  # e.g. egress_server of an in-flight transaction
+            return
+        self.summaries[dimension, 'transactions'].add(value, transactions)
+        self.summaries[dimension, 'bytes'].add(value, size)
+        self.summaries[dimension, 'failures'].add(value, failures)
+
+    # Below this many rows a plain loop beats NumPy's per-call overhead (e.g. per-second buckets)
+    VECTORIZE_MIN_ROWS = 256
+
+    def add_batch(self, batch, indices=None):
+        """Fold in a TransactionBatch (optionally only the given row indices), one add per distinct value."""
+        rows = range(len(batch)) if indices is None else indices
+        failure_codes = {batch.statuses.lookup(name) for name in FAILURE_STATUSES} - {None}
+        if np is None or len(rows) < self.VECTORIZE_MIN_ROWS:
+            columns = [(dimension, getattr(batch, _GROUP_COLUMNS[dimension][0]),
+                        getattr(batch, _GROUP_COLUMNS[dimension][1]))
+                       for dimension in ('username', 'ingress_server', 'egress_server')]
+            for i in rows:
+                size, failed = batch.file_size[i], int(batch.status[i] in failure_codes)
+                for dimension, codes, pool in columns:
+                    self._add(dimension, pool.value(codes[i]), 1, size, failed)
+                self._add('file_name', batch.file_name[i], 1, size, failed)
+            return
+
+        file_size, status = (batch.column(name) if indices is None else batch.column(name)[indices]
+                             for name in ('file_size', 'status'))
+        failed = np.isin(status, list(failure_codes))
+        for dimension in ('username', 'ingress_server', 'egress_server'):
+            column, pool_name = _GROUP_COLUMNS[dimension]
+            pool = getattr(batch, pool_name)
+            codes = batch.column(column) if indices is None else batch.column(column)[indices]
+            present = codes >= 0  # NULL (-1) codes have no value to rank
+            codes, sizes, failures = codes[present], file_size[present], failed[present]
+            if not len(codes):
+                continue
+            counts = np.bincount(codes).tolist()
+            size_sums = np.bincount(codes, weights=sizes).tolist()
+            failure_counts = np.bincount(codes, weights=failures).tolist()
+            for code in np.unique(codes).tolist():
+                self._add(dimension, pool.value(code), counts[code], int(size_sums[code]),
+                          int(failure_counts[code]))
+
+        # File names aren't interned, so total them per name first
+        files = {}
+        for i, size, fail in zip(rows, file_size.tolist(), failed.tolist()):
+            totals = files.get(batch.file_name[i])
+            if totals is None:
+                files[batch.file_name[i]] = [1, size, int(fail)]
+            else:
+                totals[0] += 1
+                totals[1] += size
+                totals[2] += fail
+        for name, (transactions, size, failures) in files.items():
+            self._add('file_name', name, transactions, size, failures)
+
+    def merge(self, other):
+        for key, summary in other.summaries.items():
+            self.summaries[key].merge(summary)
+        return self
+
+    def top(self, dimension, metric, n=10):
+        """[(value, count, error)] for the n largest `metric` totals by `dimension`, and whether they're exact."""
+        summary = self.summaries[dimension, metric]
+        return summary.top(n), summary.exact
+
+
+class ReportAccumulator:
+    """Mergeable running totals behind a report stats block (see app.build_report_stats)."""
+
+    def __init__(self):
+        self.total_transactions = 0
+        self.total_bytes = 0
+        self.status_breakdown = {}
+        self.file_size_count = 0
+        self.file_size_sum = 0
+        self.file_size_min = 0
+        self.file_size_max = 0
+        self.data_rate_sum = 0.0
+        self.data_rate_max = 0.0
+        self.transit_sum = 0.0
+        self.transit_max = 0.0
+        self.transit_sketch = QuantileSketch()
+        self.usernames = DistinctCounter(DISTINCT_EXACT_LIMIT)
+
+    def add(self, t):
+        self.add_values(t.get('file_size', 0), t.get('status', 'UNKNOWN'), t.get('transit_time_seconds'),
+                        t.get('username'))
+
+    def add_values(self, file_size, status, transit, username=None):
+        if username:
+            self.usernames.add(username)
+        self.total_transactions += 1
+        self.total_bytes += file_size
+        if file_size > 0: # Only consider for file size stats if actual size > 0
+            if not self.file_size_count or file_size < self.file_size_min:
+                self.file_size_min = file_size
+            if file_size > self.file_size_max:
+                self.file_size_max = file_size
+            self.file_size_count += 1
+            self.file_size_sum += file_size
+        self.status_breakdown[status] = self.status_breakdown.get(status, 0) + 1
+        if transit and transit > 0 and file_size > 0:
+            rate = (file_size * 8) / transit
+            self.data_rate_sum += rate
+            if rate > self.data_rate_max:
+                self.data_rate_max = rate
+            self.transit_sum += transit
+            if transit > self.transit_max:
+                self.transit_max = transit
+            self.transit_sketch.add(transit)
+
+    def add_batch(self, batch, indices=None):
+        """Fold in a TransactionBatch (optionally only the given row indices)."""
+        if np is None:
+            rows = range(len(batch)) if indices is None else indices
+            for i in rows:
+                transit = batch.transit_seconds[i]
+                self.add_values(batch.file_size[i], batch.statuses.value(batch.status[i]),
+                                None if math.isnan(transit) else transit, batch.usernames.value(batch.username[i]))
+            return
+
+        status, file_size, transit, username = (
+            batch.column(name) if indices is None else batch.column(name)[indices]
+            for name in ('status', 'file_size', 'transit_seconds', 'username'))
+        for code in np.unique(username).tolist():
+            name = batch.usernames.value(code)
+            if name:
+                self.usernames.add(name)
+        self.total_transactions += len(file_size)
+        self.total_bytes += int(file_size.sum())
+        sized = file_size[file_size > 0]
+        if len(sized):
+            low, high = int(sized.min()), int(sized.max())
+            if not self.file_size_count or low < self.file_size_min:
+                self.file_size_min = low
+            self.file_size_max = max(self.file_size_max, high)
+            self.file_size_count += len(sized)
+            self.file_size_sum += int(sized.sum())
+        for code, count in enumerate(np.bincount(status, minlength=len(batch.statuses.values)).tolist()):
+            if count:
+                name = batch.statuses.value(code)
+                self.status_breakdown[name] = self.status_breakdown.get(name, 0) + count
+        timed = (transit > 0) & (file_size > 0)  # NaN compares False
+        if timed.any():
+            durations = transit[timed]
+            rates = file_size[timed] * 8 / durations
+            self.data_rate_sum += float(rates.sum())
+            self.data_rate_max = max(self.data_rate_max, float(rates.max()))
+            self.transit_sum += float(durations.sum())
+            self.transit_max = max(self.transit_max, float(durations.max()))
+            self.transit_sketch.add_many(durations)
+
+    def merge(self, other):
+        self.total_transactions += other.total_transactions
+        self.total_bytes += other.total_bytes
+        for status, count in other.status_breakdown.items():
+            self.status_breakdown[status] = self.status_breakdown.get(status, 0) + count
+        if other.file_size_count:
+            if not self.file_size_count or other.file_size_min < self.file_size_min:
+                self.file_size_min = other.file_size_min
+            self.file_size_max = max(self.file_size_max, other.file_size_max)
+            self.file_size_count += other.file_size_count
+            self.file_size_sum += other.file_size_sum
+        self.data_rate_sum += other.data_rate_sum
+        self.data_rate_max = max(self.data_rate_max, other.data_rate_max)
+        self.transit_sum += other.transit_sum
+        self.transit_max = max(self.transit_max, other.transit_max)
+        self.transit_sketch.merge(other.transit_sketch)
+        self.usernames.merge(other.usernames)
+        return self
+
+    # Scalar fields persisted by to_state(); the sketches are stored alongside them
+    _STATE_FIELDS = ('total_transactions', 'total_bytes', 'status_breakdown', 'file_size_count',
+                     'file_size_sum', 'file_size_min', 'file_size_max', 'data_rate_sum',
+                     'data_rate_max', 'transit_sum', 'transit_max')
+
+    def to_state(self):
+        """JSON-serializable state, e.g. for a rollup row (see from_state)."""
+        state = {name: getattr(self, name) for name in self._STATE_FIELDS}
+        state['transit_sketch'] = self.transit_sketch.to_dict()
+        state['usernames'] = self.usernames.to_dict()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        accumulator = cls()
+        for name in cls._STATE_FIELDS:
+            setattr(accumulator, name, state[name])
+        accumulator.transit_sketch = QuantileSketch.from_dict(state['transit_sketch'])
+        if 'usernames' in state:  # absent from rollups written before users were counted
+            accumulator.usernames = DistinctCounter.from_dict(state['usernames'], DISTINCT_EXACT_LIMIT)
+        return accumulator
+
+
+def aggregate_report(transactions, group_by=('username',)):
+    """Aggregate report rows in a single pass.
+
+    Returns (overall, groups) where groups maps each key in `group_by` (e.g.
+    'username', 'ingress_server', 'status') to {value: ReportAccumulator}.
+    Every row lands in exactly one group per key, so the overall accumulator
+    is obtained by merging the first key's groups rather than adding each row
+    twice.
+    """
+    if isinstance(transactions, TransactionBatch):
+        return _aggregate_report_batch(transactions, group_by)
+
+    groups = {key: {} for key in group_by}
+    overall = ReportAccumulator()
+    for t in transactions:
+        for key in group_by:
+            value = t.get(key)
+            accumulator = groups[key].get(value)
+            if accumulator is None:
+                accumulator = groups[key][value] = ReportAccumulator()
+            accumulator.add(t)
+        if not group_by:
+            overall.add(t)
+    if group_by:
+        for accumulator in groups[group_by[0]].values():
+            overall.merge(accumulator)
+    return overall, groups
+
+
+# Batch columns holding interned codes, and the pool that decodes them
+_GROUP_COLUMNS = {
+    'username': ('username', 'usernames'),
+    'ingress_server': ('ingress_server', 'servers'),
+    'egress_server': ('egress_server', 'servers'),
+    'status': ('status', 'statuses'),
+}
+
+def _aggregate_report_batch(batch, group_by):
+    """aggregate_report() for a TransactionBatch: group by code column, then vectorized adds."""
+    groups = {key: {} for key in group_by}
+    overall = ReportAccumulator()
+    for key in group_by:
+        column, pool_name = _GROUP_COLUMNS[key]
+        pool = getattr(batch, pool_name)
+        for code, indices in batch.group_indices(batch.column(column)).items():
+            accumulator = ReportAccumulator()
+            accumulator.add_batch(batch, indices)
+            groups[key][pool.value(code)] = accumulator
+    if group_by:
+        for accumulator in groups[group_by[0]].values():
+            overall.merge(accumulator)
+    else:
+        overall.add_batch(batch)
+    return overall, groups
+
+
+def aggregate_report_by_bucket(batch, bucket_seconds, group_by=('username',)):
+    """Per-bucket aggregate_report() for a TransactionBatch, bucketed on ingress time.
+
+    Returns {bucket_start_epoch: {key: {value: ReportAccumulator}}}. Rows are
+    grouped on a combined (bucket, code) key so each bucket/value pair is one
+    vectorized add_batch() call.
+    """
+    buckets = {}
+    if not len(batch):
+        return buckets
+    if np is not None:
+        bucket_index = (batch.column('ingress_epoch') // bucket_seconds).astype(np.int64)
+    else:
+        bucket_index = [int(epoch // bucket_seconds) for epoch in batch.ingress_epoch]
+    for key in group_by:
+        column, pool_name = _GROUP_COLUMNS[key]
+        pool = getattr(batch, pool_name)
+        stride = len(pool.values) + 1  # codes run from NULL (-1) to len(values) - 1
+        codes = batch.column(column)
+        if np is not None:
+            combined = bucket_index * stride + (codes.astype(np.int64) + 1)
+        else:
+            combined = [b * stride + code + 1 for b, code in zip(bucket_index, codes)]
+        for value, indices in batch.group_indices(combined).items():
+            index, code = divmod(value, stride)
+            accumulator = ReportAccumulator()
+            accumulator.add_batch(batch, indices)
+            groups = buckets.setdefault(index * bucket_seconds, {k: {} for k in group_by})
+            groups[key][pool.value(code - 1)] = accumulator
+    return buckets
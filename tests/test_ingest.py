@@ -0,0 +1,221 @@
+"""Behaviour tests for batched ingest (ingest.py, db.upsert_transactions and /api/ingest) against SQLite.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import importlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import db
+from ingest import IngestWriter, IngestQueueFull, parse_event, merge_record
+from pool import ConnectionPool, SQLiteBackend
+
+INGRESS = {'username': 'alice', 'file_name': 'f.bin', 'file_size': 100,
+           'ingress_server': 'in1', 'ingress_time': '2024-01-01T12:00:00'}
+EGRESS = {'egress_server': 'out1', 'egress_time': '2024-01-01T12:00:05', 'status': 'COMPLETE'}
+
+
+def ingress(transaction_id, **fields):
+    return parse_event(dict(INGRESS, transaction_id=transaction_id, **fields))
+
+
+def egress(transaction_id, **fields):
+    return parse_event(dict(EGRESS, transaction_id=transaction_id, **fields))
+
+
+class ParseEventTests(unittest.TestCase):
+    def test_ingress_and_egress_events(self):
+        record = ingress('tx1')
+        self.assertEqual(record['ingress_time'], datetime(2024, 1, 1, 12))
+        self.assertNotIn('status', record)
+        self.assertEqual(egress('tx1', egress_time=1704110405)['egress_time'], datetime.fromtimestamp(1704110405))
+        self.assertEqual(parse_event({'transaction_id': 'tx1', 'status': 'TIMEOUT'}),
+                         {'transaction_id': 'tx1', 'status': 'TIMEOUT'})
+
+    def test_invalid_events(self):
+        for event in ({'transaction_id': 'tx1'},
+                      {'transaction_id': 'x' * 37, 'status': 'COMPLETE'},
+                      {'transaction_id': 'tx1', 'username': 'alice'},
+                      dict(INGRESS, transaction_id='tx1', file_size=-1),
+                      dict(INGRESS, transaction_id='tx1', file_size=True),
+                      {'transaction_id': 'tx1', 'status': 'DONE'},
+                      {'transaction_id': 'tx1', 'egress_time': 'yesterday'},
+                      ['tx1']):
+            with self.assertRaises(ValueError, msg=event):
+                parse_event(event)
+
+    def test_late_ingress_keeps_the_outcome(self):
+        record = merge_record(egress('tx1'), ingress('tx1', status='SUBMITTED'))
+        self.assertEqual((record['status'], record['username']), ('COMPLETE', 'alice'))
+
+
+class SQLiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.db_path = os.path.join(self.dir, 'dashboard.sqlite3')
+        db.set_pool(ConnectionPool(SQLiteBackend(self.db_path)))
+        self.addCleanup(db.set_pool, None)
+
+    def rows(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return {row['transaction_id']: dict(row) for row in conn.execute("SELECT * FROM transactions")}
+        finally:
+            conn.close()
+
+
+class IngestWriterTests(SQLiteTestCase):
+    def writer(self, write=None, **kwargs):
+        self.flushed = []
+        kwargs.setdefault('max_batch_seconds', 0.05)
+        return IngestWriter(write or db.upsert_transactions, on_flush=self.flushed.extend, **kwargs)
+
+    def wait_for_stat(self, writer, name, value, timeout=5):
+        deadline = time.monotonic() + timeout
+        while writer.stats()[name] != value and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(writer.stats()[name], value)
+
+    def test_events_for_one_transaction_coalesce_into_one_row(self):
+        writer = self.writer()
+        writer.submit([ingress('tx1'), ingress('tx2'), egress('tx1')])
+        self.assertTrue(writer.flush())
+        rows = self.rows()
+        self.assertEqual(set(rows), {'tx1', 'tx2'})
+        self.assertEqual((rows['tx1']['status'], rows['tx1']['egress_server']), ('COMPLETE', 'out1'))
+        self.assertEqual((rows['tx2']['status'], rows['tx2']['egress_server']), ('SUBMITTED', None))
+        stats = writer.stats()
+        self.assertEqual((stats['events'], stats['coalesced'], stats['rows_written']), (3, 1, 2))
+        self.assertEqual(len(self.flushed), 2)
+
+    def test_update_to_an_existing_row(self):
+        writer = self.writer()
+        writer.submit([ingress('tx1')])
+        writer.flush()
+        writer.submit([parse_event({'transaction_id': 'tx1', 'status': 'TIMEOUT'})])
+        writer.flush()
+        self.assertEqual(self.rows()['tx1']['status'], 'TIMEOUT')
+        # A repeated ingress event doesn't move a finished transaction back to SUBMITTED
+        writer.submit([ingress('tx1')])
+        writer.flush()
+        self.assertEqual(self.rows()['tx1']['status'], 'TIMEOUT')
+        self.assertEqual(writer.stats()['held'], 0)
+
+    def test_egress_before_ingress_is_held_not_written(self):
+        writer = self.writer()
+        writer.submit([egress('tx1'), parse_event({'transaction_id': 'tx2', 'status': 'TIMEOUT'})])
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.rows(), {})
+        self.assertEqual(writer.stats()['held'], 2)
+        self.assertEqual(self.flushed, [])  # nothing written, so nothing for the rolling stats
+        writer.submit([ingress('tx1')])
+        self.assertTrue(writer.flush())
+        row = self.rows()['tx1']
+        self.assertEqual((row['username'], row['egress_server'], row['status']), ('alice', 'out1', 'COMPLETE'))
+        self.assertEqual(writer.stats()['held'], 1)
+        self.assertEqual([record['transaction_id'] for record in self.flushed], ['tx1'])
+
+    def test_held_events_merge_and_expire(self):
+        writer = self.writer(max_hold_seconds=0.3)
+        writer.submit([parse_event({'transaction_id': 'tx1', 'egress_server': 'out1'})])
+        writer.flush()
+        writer.submit([parse_event({'transaction_id': 'tx1', 'status': 'COMPLETE'})])
+        writer.flush()
+        self.assertEqual(writer.stats()['held'], 1)
+        self.wait_for_stat(writer, 'held_expired', 1)
+        self.assertEqual(writer.stats()['held'], 0)
+        # The ingress event arriving after expiry is written on its own
+        writer.submit([ingress('tx1')])
+        writer.flush()
+        row = self.rows()['tx1']
+        self.assertEqual((row['egress_server'], row['status']), (None, 'SUBMITTED'))
+
+    def test_failed_write_is_retried(self):
+        calls = []
+
+        def flaky_write(records):
+            calls.append(len(records))
+            return None if len(calls) == 1 else db.upsert_transactions(records)
+
+        writer = self.writer(flaky_write, retry_interval=0.05)
+        writer.submit([ingress('tx1')])
+        self.assertTrue(writer.flush())
+        self.assertEqual(set(self.rows()), {'tx1'})
+        self.assertEqual((len(calls), writer.stats()['write_errors']), (2, 1))
+
+    def test_full_queue_refuses_events(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def blocked_write(records):
+            release.wait(5)
+            return []
+
+        writer = self.writer(blocked_write, max_batch_rows=1, max_queued=2)
+        writer.submit([ingress('tx1')])
+        self.wait_for_stat(writer, 'in_flight', 1)
+        writer.submit([ingress('tx2'), ingress('tx3')])
+        # Events for an already queued transaction still fit
+        writer.submit([egress('tx2')], timeout=0.05)
+        with self.assertRaises(IngestQueueFull):
+            writer.submit([ingress('tx4')], timeout=0.1)
+        self.assertEqual(writer.stats()['rejected'], 1)
+        release.set()
+        self.assertTrue(writer.flush())
+        self.assertEqual(writer.stats()['rows_written'], 3)
+
+
+class IngestEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        env = {'DB_BACKEND': 'sqlite', 'DB_SQLITE_PATH': os.path.join(cls.dir, 'dashboard.sqlite3'),
+               'REPORT_ROLLUPS': '0', 'RETENTION_STATE_PATH': os.path.join(cls.dir, 'retention.json')}
+        with mock.patch.dict(os.environ, env):
+            cls.app_module = importlib.import_module('app')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir, ignore_errors=True)
+
+    def post(self, events, writer):
+        body = '\n'.join(json.dumps(event) for event in events)
+        with mock.patch.object(self.app_module, 'ingest_writer', writer):
+            return self.app_module.app.test_client().post('/api/ingest', data=body, content_type='text/plain')
+
+    def test_accepts_valid_and_reports_invalid_lines(self):
+        writer = IngestWriter(lambda records: [])
+        response = self.post([dict(INGRESS, transaction_id='tx1'), {'transaction_id': 'tx2'}], writer)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.json['accepted'], response.json['invalid']), (1, 1))
+        self.assertEqual(response.json['errors'][0]['line'], 2)
+        self.assertEqual(self.post([{'transaction_id': 'tx2'}], writer).status_code, 400)
+
+    def test_full_queue_answers_503(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        writer = IngestWriter(lambda records: release.wait(5) and [], max_batch_rows=1, max_queued=1)
+        with mock.patch.object(self.app_module, 'INGEST_QUEUE_TIMEOUT', 0.1):
+            self.assertEqual(self.post([dict(INGRESS, transaction_id='tx1')], writer).status_code, 202)
+            deadline = time.monotonic() + 5
+            while writer.stats()['in_flight'] != 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.post([dict(INGRESS, transaction_id='tx2')], writer).status_code, 202)
+            response = self.post([dict(INGRESS, transaction_id='tx3')], writer)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(writer.stats()['rejected'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Behaviour tests for the background report jobs in jobs.py.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+
+from jobs import ReportJobManager, QUEUED, RUNNING, COMPLETE, EMPTY, FAILED
+
+START = datetime(2024, 1, 1)
+
+
+class ReportJobManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_dir, ignore_errors=True)
+        self.builds = Counter()
+        self.release = threading.Event()
+
+    def build(self, job, path, progress):
+        self.builds[job['username']] += 1
+        if job['username'] == 'blocker':
+            self.release.wait(10)
+        if job['username'] == 'empty':
+            return False
+        if job['username'] == 'broken':
+            raise ValueError('boom')
+        progress(0.5, 'Writing rows')
+        with open(path, 'w') as f:
+            f.write(job['username'])
+        return True
+
+    def manager(self, **kwargs):
+        manager = ReportJobManager(self.build, self.storage_dir, **kwargs)
+        self.addCleanup(manager._executor.shutdown)
+        self.addCleanup(self.release.set)
+        return manager
+
+    def submit(self, manager, username):
+        return manager.submit(START, START + timedelta(hours=1), username, 'csv', 'report')
+
+    def wait_for(self, manager, job_id, statuses, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = manager.get(job_id)
+            if job is not None and job['status'] in statuses:
+                return job
+            time.sleep(0.02)
+        self.fail(f"job {job_id} never reached {statuses}")
+
+    def test_build_and_resubmit_reuses_result(self):
+        manager = self.manager()
+        job = self.submit(manager, 'alice')
+        done = self.wait_for(manager, job['id'], (COMPLETE,))
+        self.assertEqual(done['progress'], 1.0)
+        with open(manager.artifact_path(done)) as f:
+            self.assertEqual(f.read(), 'alice')
+        self.assertEqual(self.submit(manager, 'alice')['status'], COMPLETE)
+        self.assertEqual(self.builds['alice'], 1)
+        self.assertFalse(os.path.exists(manager._claim_path(job['id'])))
+
+    def test_empty_and_failed_builds(self):
+        manager = self.manager()
+        empty = self.submit(manager, 'empty')
+        self.wait_for(manager, empty['id'], (EMPTY,))
+        broken = self.submit(manager, 'broken')
+        self.assertEqual(self.wait_for(manager, broken['id'], (FAILED,))['error'], 'boom')
+        # A failed job is retried on resubmit; an empty one is not
+        self.submit(manager, 'broken')
+        self.wait_for(manager, broken['id'], (FAILED,))
+        self.submit(manager, 'empty')
+        self.assertEqual(self.builds, Counter(empty=1, broken=2))
+
+    def test_queued_job_stays_alive_behind_a_long_build(self):
+        manager = self.manager(max_workers=1, stale_after=1)
+        blocker = self.submit(manager, 'blocker')
+        self.wait_for(manager, blocker['id'], (RUNNING,))
+        queued = self.submit(manager, 'queued')
+        time.sleep(2.5)  # well past stale_after, with the only worker still busy
+        self.assertEqual(manager.get(queued['id'])['status'], QUEUED)
+        self.assertEqual(manager.get(blocker['id'])['status'], RUNNING)
+        self.assertEqual(self.submit(manager, 'queued')['status'], QUEUED)
+        self.release.set()
+        self.wait_for(manager, queued['id'], (COMPLETE,))
+        self.assertEqual(self.builds, Counter(blocker=1, queued=1))
+
+    def test_job_claimed_by_a_live_worker_is_not_rebuilt(self):
+        manager = self.manager(max_workers=1, stale_after=1)
+        blocker = self.submit(manager, 'blocker')
+        self.wait_for(manager, blocker['id'], (RUNNING,))
+        # Another process sharing the directory sees the running job rather than building it
+        other = self.manager(stale_after=1)
+        time.sleep(1.5)
+        self.assertEqual(self.submit(other, 'blocker')['status'], RUNNING)
+        self.release.set()
+        self.wait_for(manager, blocker['id'], (COMPLETE,))
+        self.assertEqual(self.builds['blocker'], 1)
+
+    def test_abandoned_job_expires_and_is_rebuilt(self):
+        manager = self.manager(stale_after=1)
+        job = self.submit(manager, 'alice')
+        self.wait_for(manager, job['id'], (COMPLETE,))
+        # State and claim left behind by a worker that died mid-build
+        stale = time.time() - 5
+        with open(manager._meta_path(job['id']), 'w') as f:
+            json.dump(dict(job, status=RUNNING, finished_at=None, updated_at=stale), f)
+        with open(manager._claim_path(job['id']), 'w') as f:
+            json.dump({'host': 'elsewhere', 'pid': 1}, f)
+        os.utime(manager._claim_path(job['id']), (stale, stale))
+        self.assertIsNone(manager.get(job['id']))
+        self.submit(manager, 'alice')
+        self.wait_for(manager, job['id'], (COMPLETE,))
+        self.assertEqual(self.builds['alice'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Behaviour tests for the connection pool in pool.py, using the SQLite backend.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from pool import ConnectionPool, PoolTimeout, SQLiteBackend
+
+
+class CountingBackend(SQLiteBackend):
+    """SQLiteBackend that records connects and can fail its health check."""
+
+    def __init__(self, path):
+        self.connected = []
+        self.healthy = True
+        super().__init__(path)  # creates the schema over a connection of its own
+        self.connected.clear()
+
+    def connect(self):
+        conn = super().connect()
+        self.connected.append(conn)
+        return conn
+
+    def is_alive(self, conn):
+        return self.healthy and super().is_alive(conn)
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.backend = CountingBackend(os.path.join(self.dir, 'dashboard.sqlite3'))
+
+    def pool(self, **kwargs):
+        pool = ConnectionPool(self.backend, **kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_close_returns_the_connection_for_reuse(self):
+        pool = self.pool(size=2)
+        conn = pool.acquire()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+        self.assertEqual(cursor.fetchone(), (0,))
+        cursor.close()
+        conn.close()
+        self.assertFalse(conn.is_connected())
+        conn.close()  # a second close is a no-op
+        self.assertEqual(pool.stats()['idle'], 1)
+        with pool.connection() as again:
+            self.assertIs(again._conn, self.backend.connected[0])
+            self.assertEqual(pool.stats()['in_use'], 1)
+        stats = pool.stats()
+        self.assertEqual((stats['connects'], stats['checkouts'], stats['in_use'], stats['idle']), (1, 2, 0, 1))
+
+    def test_discarded_connection_is_closed(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        raw = conn._conn._raw
+        conn.close(discard=True)
+        self.assertEqual(pool.stats()['idle'], 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            raw.execute("SELECT 1")
+        with pool.connection():
+            pass
+        self.assertEqual(len(self.backend.connected), 2)
+
+    def test_times_out_when_exhausted(self):
+        pool = self.pool(size=1, timeout=0.1)
+        held = pool.acquire()
+        started = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        held.close()
+        with pool.connection():
+            pass
+
+    def test_waiter_gets_a_connection_released_in_time(self):
+        pool = self.pool(size=1, timeout=2)
+        held = pool.acquire()
+        threading.Timer(0.1, held.close).start()
+        with pool.connection() as conn:
+            self.assertIs(conn._conn, self.backend.connected[0])
+        self.assertEqual(pool.stats()['connects'], 1)
+
+    def test_failed_health_check_replaces_the_connection(self):
+        pool = self.pool(health_check_interval=0)
+        with pool.connection():
+            pass
+        stale = self.backend.connected[0]
+        self.backend.healthy = False
+        with pool.connection() as conn:
+            self.assertIsNot(conn._conn, stale)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            stale._raw.execute("SELECT 1")
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['connects']), (1, 2))
+
+    def test_recently_used_connection_skips_the_health_check(self):
+        pool = self.pool(health_check_interval=60)
+        with pool.connection():
+            pass
+        self.backend.healthy = False
+        with pool.connection() as conn:
+            self.assertIs(conn._conn, self.backend.connected[0])
+        self.assertEqual(pool.stats()['health_check_failures'], 0)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = self.pool(size=1, timeout=0.1)
+        self.backend.path = os.path.join(self.dir, 'missing', 'dashboard.sqlite3')
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire()
+        self.assertEqual((pool.stats()['connect_errors'], pool.stats()['in_use']), (1, 0))
+        self.backend.path = os.path.join(self.dir, 'dashboard.sqlite3')
+        with pool.connection():
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+"""Behaviour tests for retention purges (retention.py and its db.py helpers) against SQLite.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import csv
+import gzip
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import zlib
+from datetime import datetime, timedelta
+
+import db
+from columnar import COLUMNS
+from pool import ConnectionPool, SQLiteBackend
+from retention import RetentionEngine, PurgeInProgress, RUNNING, COMPLETE, FAILED, CANCELLED, PURGE
+
+T0 = datetime(2024, 1, 1, 12, 0)
+
+
+def gzip_members(path):
+    """Number of concatenated gzip members in a file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    members = 0
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        members += 1
+    return members
+
+
+class RetentionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.db_path = os.path.join(self.dir, 'dashboard.sqlite3')
+        db.set_pool(ConnectionPool(SQLiteBackend(self.db_path)))
+        self.addCleanup(db.set_pool, None)
+        self.state_path = os.path.join(self.dir, 'retention.json')
+        # One transaction a minute from T0, plus a rollup and watermark summarising them
+        self.execute(
+            "INSERT INTO transactions VALUES (?, 'alice', 'f.bin', 10, 'in1', ?, NULL, NULL, 'SUBMITTED')",
+            [(f"tx{i:02d}", T0 + timedelta(minutes=i)) for i in range(23)], many=True)
+        self.execute("INSERT INTO transaction_rollups VALUES (60, ?, 'username', 'alice', 1, 10, '{}')", (T0,))
+        self.execute("INSERT INTO rollup_state VALUES ('watermark', ?)", (T0,))
+
+    def execute(self, sql, params=(), many=False):
+        with sqlite3.connect(self.db_path) as conn:
+            (conn.executemany if many else conn.execute)(sql, params)
+        conn.close()
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def remaining_ids(self):
+        return [row[0] for row in self.query("SELECT transaction_id FROM transactions ORDER BY transaction_id")]
+
+    def rollup_rows(self):
+        return (self.query("SELECT COUNT(*) FROM transaction_rollups")[0][0]
+                + self.query("SELECT COUNT(*) FROM rollup_state")[0][0])
+
+    def engine(self, **kwargs):
+        kwargs.setdefault('pause_seconds', 0)
+        engine = RetentionEngine(self.state_path, **kwargs)
+        self.addCleanup(self.stop, engine)
+        return engine
+
+    @staticmethod
+    def stop(engine):
+        engine.stop()
+        for thread in (engine._worker, engine._scheduler):
+            if thread is not None:
+                thread.join(5)
+
+
+class DbHelperTests(RetentionTestCase):
+    def test_purge_chunk_is_oldest_first_and_bounded(self):
+        self.assertEqual(db.count_transactions_before(T0 + timedelta(minutes=12)), 12)
+        self.assertEqual(db.count_transactions_before(), 23)
+        chunk = db.get_purge_chunk(T0 + timedelta(minutes=3), 5)
+        self.assertEqual(chunk, [('tx00',), ('tx01',), ('tx02',)])
+        full = db.get_purge_chunk(None, 2, full_rows=True)
+        self.assertEqual([len(row) for row in full], [len(COLUMNS)] * 2)
+
+    def test_delete_and_truncate(self):
+        self.assertEqual(db.delete_transactions(['tx00', 'tx01', 'missing']), 2)
+        self.assertEqual(db.delete_transactions([]), 0)
+        self.assertEqual(len(self.remaining_ids()), 21)
+        self.assertTrue(db.truncate_transactions(include_rollups=False))
+        self.assertEqual(self.remaining_ids(), [])
+        self.assertEqual(self.rollup_rows(), 2)
+        self.assertTrue(db.truncate_transactions())
+        self.assertEqual(self.rollup_rows(), 0)
+
+    def test_sqlite_has_no_partitions(self):
+        self.assertEqual(db.get_time_partitions(), [])
+        self.assertFalse(db.drop_time_partition('p0'))
+
+
+class PurgeTests(RetentionTestCase):
+    def test_purge_with_cutoff_mid_chunk(self):
+        cutoff = T0 + timedelta(minutes=12)
+        state = self.engine(chunk_rows=5).purge_older_than(cutoff, wait=10)
+        self.assertEqual(state['status'], COMPLETE)
+        self.assertEqual((state['method'], state['estimated_total']), ('chunked', 12))
+        # Chunks of 5, 5 and the 2 rows left before the cutoff
+        self.assertEqual((state['deleted'], state['chunks']), (12, 3))
+        self.assertEqual(self.remaining_ids(), [f"tx{i:02d}" for i in range(12, 23)])
+        self.assertEqual(self.rollup_rows(), 2)  # purges leave the rollups alone
+
+    def test_clear_without_archive_truncates(self):
+        state = self.engine().clear(wait=10)
+        self.assertEqual((state['status'], state['method'], state['deleted']), (COMPLETE, 'truncate', 23))
+        self.assertIsNone(state['archive'])
+        self.assertEqual(self.remaining_ids(), [])
+        self.assertEqual(self.rollup_rows(), 0)
+
+    def test_clear_with_archive(self):
+        archive_dir = os.path.join(self.dir, 'archive')
+        state = self.engine(chunk_rows=10, archive_dir=archive_dir).clear(wait=10)
+        self.assertEqual((state['status'], state['method']), (COMPLETE, 'chunked'))
+        self.assertEqual((state['deleted'], state['chunks']), (23, 3))
+        self.assertEqual(os.path.dirname(state['archive']), archive_dir)
+        self.assertEqual(self.remaining_ids(), [])
+        self.assertEqual(self.rollup_rows(), 0)
+        # One gzip member per chunk; the header is written once
+        self.assertEqual(gzip_members(state['archive']), 3)
+        with gzip.open(state['archive'], 'rt', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], list(COLUMNS))
+        self.assertEqual([row[0] for row in rows[1:]], [f"tx{i:02d}" for i in range(23)])
+        self.assertEqual(rows[1][COLUMNS.index('username')], 'alice')
+
+    def test_cancel_stops_after_the_current_chunk(self):
+        engine = self.engine(chunk_rows=2, pause_seconds=0.2)
+        engine.purge_older_than(T0 + timedelta(hours=1))
+        deadline = time.monotonic() + 5
+        while engine.status()['chunks'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(engine.cancel())
+        engine._worker.join(5)
+        state = engine.status()
+        self.assertEqual(state['status'], CANCELLED)
+        self.assertGreater(state['deleted'], 0)
+        self.assertEqual(len(self.remaining_ids()), 23 - state['deleted'])
+        self.assertGreater(len(self.remaining_ids()), 0)
+        self.assertFalse(engine.cancel())
+        # Not running any more, so a new purge may start
+        self.assertEqual(engine.purge_older_than(T0 + timedelta(hours=1), wait=10)['status'], COMPLETE)
+        self.assertEqual(self.remaining_ids(), [])
+
+    def test_second_purge_is_refused_while_one_runs(self):
+        engine = self.engine(chunk_rows=1, pause_seconds=0.2)
+        engine.purge_older_than(T0 + timedelta(hours=1))
+        with self.assertRaises(PurgeInProgress):
+            engine.clear()
+        engine.cancel()
+
+    def test_rollups_off_skips_rollup_tables(self):
+        self.execute("DROP TABLE transaction_rollups")
+        self.execute("DROP TABLE rollup_state")
+        self.assertEqual(self.engine(rollups=True).clear(wait=10)['status'], FAILED)
+        self.assertEqual(len(self.remaining_ids()), 23)  # rolled back with the rollups
+
+        self.assertEqual(self.engine(rollups=False).clear(wait=10)['status'], COMPLETE)
+        self.assertEqual(self.remaining_ids(), [])
+        self.execute("INSERT INTO transactions VALUES ('tx99', 'bob', 'f.bin', 1, 'in1', ?, NULL, NULL, 'COMPLETE')",
+                     (T0,))
+        archive_dir = os.path.join(self.dir, 'archive')
+        self.assertEqual(self.engine(rollups=False, archive_dir=archive_dir).clear(wait=10)['status'], COMPLETE)
+        self.assertEqual(self.remaining_ids(), [])
+
+
+class ResumeTests(RetentionTestCase):
+    def write_running_state(self, **owner):
+        """State file of a purge to T0+12min interrupted after its first chunk of 5."""
+        state = {
+            'id': '20240101-120000', 'operation': PURGE, 'cutoff': (T0 + timedelta(minutes=12)).isoformat(),
+            'status': RUNNING, 'method': 'chunked', 'estimated_total': 12, 'deleted': 5, 'chunks': 1,
+            'partitions_dropped': [], 'archive': None, 'started_at': time.time() - 10, 'finished_at': None,
+            'error': None, 'updated_at': time.time(), **owner,
+        }
+        self.execute("DELETE FROM transactions WHERE transaction_id < 'tx05'")
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f)
+
+    def wait_for_status(self, engine, status, timeout=5):
+        deadline = time.monotonic() + timeout
+        while engine.status()['status'] != status and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return engine.status()
+
+    def test_resumes_at_once_when_its_process_is_gone(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.write_running_state(host=socket.gethostname(), pid=process.pid)
+        engine = self.engine(chunk_rows=5)
+        engine.start()
+        state = self.wait_for_status(engine, COMPLETE)
+        self.assertEqual(state['status'], COMPLETE)
+        self.assertEqual((state['deleted'], state['id']), (12, '20240101-120000'))
+        self.assertEqual(state['pid'], os.getpid())
+        self.assertEqual(self.remaining_ids(), [f"tx{i:02d}" for i in range(12, 23)])
+
+    def test_waits_for_a_possibly_live_owner_to_go_stale(self):
+        self.write_running_state(host='another-host', pid=1)
+        engine = self.engine(chunk_rows=5, stale_after=1)
+        engine.start()
+        time.sleep(0.3)
+        self.assertEqual(engine.status()['deleted'], 5)
+        with self.assertRaises(PurgeInProgress):
+            engine.purge_older_than(T0 + timedelta(hours=1))
+        # Picked up by the scheduler's retry once the state has gone stale_after without an update
+        state = self.wait_for_status(engine, COMPLETE)
+        self.assertEqual(state['status'], COMPLETE)
+        self.assertEqual(state['deleted'], 12)
+        self.assertEqual(len(self.remaining_ids()), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
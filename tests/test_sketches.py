@@ -0,0 +1,222 @@
+"""Behaviour tests for the error-bounded sketches in sketches.py.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import json
+import random
+import unittest
+from collections import Counter
+from unittest import mock
+
+import sketches
+from sketches import SpaceSaving, HyperLogLog, DistinctCounter
+
+
+def skewed_stream(seed, length=20000, keys=2000, weighted=False):
+    """Zipf-like (key, weight) pairs: a few heavy keys and a long tail."""
+    rng = random.Random(seed)
+    return [(f"key{min(int(rng.paretovariate(1.1)), keys)}", rng.randint(1, 50) if weighted else 1)
+            for _ in range(length)]
+
+
+class SpaceSavingTests(unittest.TestCase):
+    def assert_guarantees(self, summary, truth):
+        """The documented Space-Saving bounds against the true totals."""
+        self.assertEqual(summary.total, sum(truth.values()))
+        for key, (count, error) in summary.counts.items():
+            # A tracked count overestimates by at most its error
+            self.assertLessEqual(count - error, truth[key], key)
+            self.assertGreaterEqual(count, truth[key], key)
+        for key, total in truth.items():
+            if key not in summary.counts:
+                # Anything untracked totals at most the floor...
+                self.assertLessEqual(total, summary.floor, key)
+            if total > summary.total / summary.capacity:
+                # ...so every key above total / capacity is tracked
+                self.assertIn(key, summary.counts)
+
+    def test_exact_below_capacity(self):
+        stream = skewed_stream(1, length=500, keys=40)
+        summary = SpaceSaving(capacity=100)
+        for key, weight in stream:
+            summary.add(key, weight)
+        truth = Counter(key for key, _ in stream)
+        self.assertTrue(summary.exact)
+        self.assertEqual({key: count for key, (count, _) in summary.counts.items()}, truth)
+        self.assertTrue(all(error == 0 for _, error in summary.counts.values()))
+
+    def test_single_stream_bounds(self):
+        for seed, weighted in ((2, False), (3, True)):
+            stream = skewed_stream(seed, weighted=weighted)
+            summary = SpaceSaving(capacity=50)
+            truth = Counter()
+            for key, weight in stream:
+                summary.add(key, weight)
+                truth[key] += weight
+            self.assertFalse(summary.exact)
+            self.assertLessEqual(len(summary.counts), summary.capacity)
+            self.assert_guarantees(summary, truth)
+
+    def test_top_is_largest_first(self):
+        summary = SpaceSaving(capacity=50)
+        for key, weight in skewed_stream(4):
+            summary.add(key, weight)
+        top = summary.top(10)
+        self.assertEqual(len(top), 10)
+        counts = [count for _, count, _ in top]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(counts[0], max(count for count, _ in summary.counts.values()))
+
+    def test_merge_bounds(self):
+        stream = skewed_stream(5, length=30000, weighted=True)
+        truth = Counter()
+        for key, weight in stream:
+            truth[key] += weight
+        # Per-part summaries merged pairwise and in sequence, as the rolling and report code does
+        parts = [stream[i:i + 1000] for i in range(0, len(stream), 1000)]
+        summaries = []
+        for part in parts:
+            summary = SpaceSaving(capacity=50)
+            for key, weight in part:
+                summary.add(key, weight)
+            summaries.append(summary)
+        sequential = SpaceSaving(capacity=50)
+        for summary in summaries:
+            sequential.merge(summary)
+        while len(summaries) > 1:
+            summaries = [summaries[i].merge(summaries[i + 1]) if i + 1 < len(summaries) else summaries[i]
+                         for i in range(0, len(summaries), 2)]
+        for merged in (sequential, summaries[0]):
+            self.assertLessEqual(len(merged.counts), 2 * merged.capacity)
+            self.assert_guarantees(merged, truth)
+
+    def test_merge_then_add(self):
+        # Adds after a merge (which rebuilds the eviction heap) keep the bounds
+        stream = skewed_stream(6, length=6000)
+        left, right = SpaceSaving(capacity=30), SpaceSaving(capacity=30)
+        for i, (key, weight) in enumerate(stream[:4000]):
+            (left if i % 2 else right).add(key, weight)
+        left.merge(right)
+        for key, weight in stream[4000:]:
+            left.add(key, weight)
+        self.assert_guarantees(left, Counter(key for key, _ in stream))
+
+    def test_merge_of_exact_summaries_is_exact(self):
+        left, right = SpaceSaving(capacity=10), SpaceSaving(capacity=10)
+        for key in 'aab':
+            left.add(key)
+        for key in 'bcc':
+            right.add(key)
+        left.merge(right)
+        self.assertTrue(left.exact)
+        self.assertEqual({key: count for key, (count, _) in left.counts.items()}, {'a': 2, 'b': 2, 'c': 2})
+
+
+class HyperLogLogTests(unittest.TestCase):
+    def test_within_documented_error(self):
+        # 2.5% is about 3 standard errors at precision 14
+        for cardinality in (5000, 60000, 200000):
+            sketch = HyperLogLog(14)
+            for i in range(cardinality):
+                sketch.add(f"user{cardinality}-{i}")
+            self.assertLess(abs(sketch.count() - cardinality) / cardinality, 0.025, cardinality)
+
+    def test_small_cardinalities_use_linear_counting(self):
+        sketch = HyperLogLog(14)
+        for i in range(200):
+            sketch.add(f"user{i}")
+            sketch.add(f"user{i}")  # duplicates don't count
+        self.assertLessEqual(abs(sketch.count() - 200), 2)
+        self.assertEqual(HyperLogLog(14).count(), 0)
+
+    def test_merge_is_union(self):
+        left, right, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+        for i in range(30000):
+            (left if i < 20000 else right).add(i)
+            union.add(i)
+        for i in range(10000, 20000):
+            right.add(i)  # overlaps left
+        left.merge(right)
+        self.assertEqual(left.registers, union.registers)
+        self.assertEqual(left.count(), union.count())
+
+    def test_merge_rejects_different_precision(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog(12).merge(HyperLogLog(14))
+        with self.assertRaises(ValueError):
+            HyperLogLog(3)
+
+    def test_pure_python_matches_numpy(self):
+        sketch, other = HyperLogLog(10), HyperLogLog(10)
+        for i in range(5000):
+            (sketch if i % 3 else other).add(i)
+        expected = HyperLogLog(10).merge(sketch).merge(other)
+        with mock.patch.object(sketches, 'np', None):
+            self.assertEqual(expected.count(), HyperLogLog(10).merge(sketch).merge(other).count())
+
+    def test_round_trip(self):
+        sketch = HyperLogLog(14)
+        for i in range(50000):
+            sketch.add(i)
+        restored = HyperLogLog.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.precision, 14)
+        self.assertEqual(restored.registers, sketch.registers)
+        self.assertEqual(restored.count(), sketch.count())
+
+
+class DistinctCounterTests(unittest.TestCase):
+    def test_exact_up_to_the_limit(self):
+        counter = DistinctCounter(exact_limit=100)
+        for i in range(100):
+            counter.add(f"user{i}")
+            counter.add(f"user{i}")
+        self.assertTrue(counter.exact)
+        self.assertEqual(counter.count(), 100)
+
+    def test_switches_to_sketch_past_the_limit(self):
+        counter = DistinctCounter(exact_limit=100)
+        counter.update(f"user{i}" for i in range(101))
+        self.assertFalse(counter.exact)
+        self.assertEqual(counter.values, set())
+        counter.update(f"user{i}" for i in range(50000))
+        self.assertLess(abs(counter.count() - 50000) / 50000, 0.025)
+
+    def test_no_limit_never_switches(self):
+        counter = DistinctCounter(exact_limit=None)
+        counter.update(range(5000))
+        self.assertTrue(counter.exact)
+        self.assertEqual(len(counter), 5000)
+
+    def test_merge(self):
+        left, right = DistinctCounter(exact_limit=100), DistinctCounter(exact_limit=100)
+        left.update(range(60))
+        right.update(range(30, 90))
+        self.assertEqual(DistinctCounter(exact_limit=100).merge(left).merge(right).count(), 90)
+        # Exact counters crossing the limit together switch to the sketch
+        right.update(range(90, 150))
+        merged = DistinctCounter(exact_limit=100).merge(left).merge(right)
+        self.assertFalse(merged.exact)
+        self.assertLessEqual(abs(merged.count() - 150), 3)
+        # Exact merged into a sketch, and a sketch into an exact counter
+        big = DistinctCounter(exact_limit=100)
+        big.update(range(1000, 21000))
+        self.assertLess(abs(DistinctCounter(exact_limit=100).merge(left).merge(big).count() - 20060) / 20060, 0.025)
+        self.assertLess(abs(big.merge(left).count() - 20060) / 20060, 0.025)
+
+    def test_round_trip(self):
+        exact = DistinctCounter(exact_limit=100)
+        exact.update(['bob', 'alice', 'bob'])
+        restored = DistinctCounter.from_dict(json.loads(json.dumps(exact.to_dict())), exact_limit=100)
+        self.assertTrue(restored.exact)
+        self.assertEqual(restored.values, {'alice', 'bob'})
+
+        estimated = DistinctCounter(exact_limit=100, precision=12)
+        estimated.update(range(10000))
+        restored = DistinctCounter.from_dict(json.loads(json.dumps(estimated.to_dict())), exact_limit=100)
+        self.assertFalse(restored.exact)
+        self.assertEqual(restored.precision, 12)
+        self.assertEqual(restored.count(), estimated.count())
+
+
+if __name__ == '__main__':
+    unittest.main()